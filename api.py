@@ -1,9 +1,17 @@
-from fastapi import FastAPI
+import time
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
+
+from app.utils import metrics
+from app.utils.admission import UploadGate, UploadTooLarge, upload_too_large_response
 
 # === ROUTE IMPORTS ===
 from app.routes.wav2lip_single_image import router as wav2lip_single_image_router
 from app.routes.wav2lip import router as wav2lip_router
+from app.routes.jobs import router as jobs_router
+from app.routes.realtime import router as realtime_router
 
 # === CREATE APP FIRST ===
 app = FastAPI(title="Lip2Sync API Server", version="1.0")
@@ -17,9 +25,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# === UPLOAD SIZE LIMIT / FULL QUEUE ===
+# Checked before the routes read the body (429, or 413 on Content-Length) and while it streams in (413).
+app.add_middleware(UploadGate, render_prefixes=("/api/sync/", "/api/stream/", "/api/preview/"))
+app.add_exception_handler(UploadTooLarge, upload_too_large_response)
+
+
+# === REQUEST METRICS ===
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        path = metrics.route_label(request.scope)
+        metrics.HTTP_REQUESTS.labels(path, request.method, status).inc()
+        metrics.HTTP_LATENCY.labels(path, request.method).observe(time.perf_counter() - start)
+
+
 # === ROUTES (order does not matter once app exists) ===
 app.include_router(wav2lip_single_image_router, prefix="/api")
 app.include_router(wav2lip_router, prefix="/api")
+app.include_router(jobs_router, prefix="/api")
+app.include_router(realtime_router, prefix="/api")
 
 
 # === HEALTH CHECK ===
@@ -31,7 +62,21 @@ def root():
         "routes": [
             "/api/sync/single_image",
             "/api/sync/wav2lip",
+            "/api/stream/single_image",
+            "/api/stream/wav2lip",
+            "/api/preview/single_image",
+            "/api/preview/wav2lip",
+            "/api/jobs/{job_id}",
+            "/api/realtime/faces",
+            "/api/realtime/wav2lip (WebSocket)",
+            "/metrics",
         ],
     }
 
 
+# === PROMETHEUS METRICS ===
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
@@ -0,0 +1,121 @@
+# app/engines/realtime/engine.py
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Optional, Sequence, Tuple
+
+from app.utils.metrics import REALTIME_LATENCY, record_cache
+
+
+def parse_box(text: Optional[str]) -> Optional[Tuple[int, int, int, int]]:
+    """"y1,y2,x1,x2" (infer.py's --box order) -> tuple; None when not given."""
+    if not text:
+        return None
+    parts = [int(p) for p in text.split(",")]
+    if len(parts) != 4:
+        raise ValueError("box must be y1,y2,x1,x2")
+    return tuple(parts)
+
+
+class RealtimeEngine:
+    """
+    Wav2Lip loaded inside the API process for live WebSocket sessions:
+      - Model and S3FD are loaded once, on first use, instead of an infer.py subprocess per job
+      - register_face(image_bytes, box) detects the face once; faces are cached by content (LRU)
+      - open_session(face, fps, encoder) -> models/wav2lip/realtime.RealtimeSession, which reuses
+        the face-encoder features for every frame
+      - model_path holds infer.py's helper modules and checkpoints/; src_path adds audio.py,
+        hparams.py and models/ when they live elsewhere (models/wav2lip_src in this repo)
+    """
+
+    def __init__(self, model_path: str = "models/wav2lip", src_path: Optional[str] = None,
+                 checkpoint: Optional[str] = None, detector_path: Optional[str] = None, max_faces: int = 64):
+        self.model_path = model_path
+        self.src_path = src_path
+        self.checkpoint = checkpoint or os.path.join(model_path, "checkpoints", "wav2lip.pth")
+        self.detector_path = detector_path or os.path.join(model_path, "checkpoints", "s3fd.pth")
+        self.max_faces = max_faces
+        self.faces: "OrderedDict[str, object]" = OrderedDict()
+        self.device = None
+        self._rt = None
+        self._model = None
+        self._detector = None
+        self._lock = threading.Lock()
+
+    def _load_model(self):
+        with self._lock:
+            if self._model is not None:
+                return
+            for path in (self.src_path, self.model_path):
+                path = os.path.abspath(path) if path else None
+                if path and os.path.isdir(path) and path not in sys.path:
+                    sys.path.insert(0, path)
+            if not os.path.exists(self.checkpoint):
+                raise FileNotFoundError(f"checkpoint not found at {self.checkpoint}")
+
+            import torch
+            import realtime
+            import weights
+            from models import Wav2Lip
+
+            self.device = "cuda" if torch.cuda.is_available() else "cpu"
+            # Memory-maps wav2lip.safetensors when it has been converted next to the checkpoint
+            model = weights.load_into(Wav2Lip(), self.checkpoint)
+            self._rt = realtime
+            self._model = model.to(self.device).eval()
+
+    def _load_detector(self):
+        self._load_model()
+        with self._lock:
+            if self._detector is None:
+                import face_detection
+                path = self.detector_path if os.path.exists(self.detector_path) else None
+                self._detector = face_detection.get_face_alignment(device=self.device, path_to_detector=path)
+        return self._detector
+
+    def register_face(self, image_bytes: bytes, box: Optional[Sequence[int]] = None) -> Tuple[str, object]:
+        """Decode, detect (unless box is given) and cache a face; returns (face_id, face)."""
+        face_id = hashlib.sha256(image_bytes + repr(box).encode()).hexdigest()[:32]
+        with self._lock:
+            face = self.faces.get(face_id)
+            if face is not None:
+                self.faces.move_to_end(face_id)
+        record_cache("realtime_face", face is not None)
+        if face is not None:
+            return face_id, face
+
+        import cv2
+        import numpy as np
+
+        self._load_model()
+        image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("image could not be decoded")
+        if box is not None:
+            y1, y2, x1, x2 = box
+            if not (0 <= y1 < y2 <= image.shape[0] and 0 <= x1 < x2 <= image.shape[1]):
+                raise ValueError("box is outside the image")
+            face = self._rt.RegisteredFace(image, box)
+        else:
+            face = self._rt.RegisteredFace.detect(image, self._load_detector())
+
+        with self._lock:
+            self.faces[face_id] = face
+            while len(self.faces) > self.max_faces:
+                self.faces.popitem(last=False)
+        return face_id, face
+
+    def get_face(self, face_id: str):
+        with self._lock:
+            return self.faces.get(face_id)
+
+    def open_session(self, face, fps: float = 25.0, encoder: str = "jpeg"):
+        self._load_model()
+        return self._rt.RealtimeSession(self._model, face, device=self.device, fps=fps, encoder=encoder,
+                                        observer=lambda stage, s: REALTIME_LATENCY.labels(stage).observe(s))
+
+    def lookahead_ms(self) -> float:
+        self._load_model()
+        return round(1000.0 * self._rt.lookahead_s(), 1)
@@ -0,0 +1,136 @@
+# app/engines/stub/engine.py
+import json
+import math
+import os
+import time
+import uuid
+import wave
+from typing import Dict, Optional
+
+from app.utils.jobs import PREVIEW_COST_SCALE
+from app.utils.profiling import JobProfiler
+
+
+def _wav_seconds(path: str) -> Optional[float]:
+    try:
+        with wave.open(path, "rb") as f:
+            return f.getnframes() / float(f.getframerate())
+    except (wave.Error, EOFError, OSError):
+        return None
+
+
+def _video_seconds(path: str) -> Optional[float]:
+    try:
+        import cv2
+    except ImportError:
+        return None
+    cap = cv2.VideoCapture(path)
+    try:
+        frames, fps = cap.get(cv2.CAP_PROP_FRAME_COUNT), cap.get(cv2.CAP_PROP_FPS)
+    finally:
+        cap.release()
+    return frames / fps if frames > 0 and fps > 0 else None
+
+
+class StubEngine:
+    """
+    Stand-in for the Wav2Lip engines when load testing the HTTP layer:
+      - Same run(primary_bytes, audio_bytes) -> Dict contract as the real engines
+      - Saves the uploads like the real engines, then blocks for
+        overhead_s + rtf * <input seconds> instead of running infer.py
+      - Input length comes from the WAV header, else the video container, else default_seconds
+      - Returns the primary upload as the "rendered" output, with a profile like the real engines
+      - With stream_dir, releases that output as HLS / fMP4 "segments" at the same pace, so the
+        progressive routes can be load tested too (the files are not playable media)
+      - preview=True costs PREVIEW_COST_SCALE of a full render, as admission assumes; artifacts_dir is ignored
+
+    Enable with LIP2SYNC_ENGINE=stub; LIP2SYNC_STUB_RTF, LIP2SYNC_STUB_OVERHEAD_S and
+    LIP2SYNC_STUB_DEFAULT_S override the cost model.
+    """
+
+    def __init__(self, name: str, workspace: Optional[str] = None, rtf: Optional[float] = None,
+                 overhead_s: Optional[float] = None, default_seconds: Optional[float] = None, fps: float = 25.0):
+        env_ws = os.environ.get("WORKSPACE")
+        if workspace is None:
+            workspace = env_ws if env_ws else "."
+        self.name = name
+        self.workspace = workspace
+        self.rtf = rtf if rtf is not None else float(os.environ.get("LIP2SYNC_STUB_RTF", "0.5"))
+        self.overhead_s = overhead_s if overhead_s is not None else float(os.environ.get("LIP2SYNC_STUB_OVERHEAD_S", "0.2"))
+        self.default_seconds = (default_seconds if default_seconds is not None
+                                else float(os.environ.get("LIP2SYNC_STUB_DEFAULT_S", "10")))
+        self.fps = fps
+        self.temp_dir = os.path.join(self.workspace, "temp_stub")
+        self.outputs_dir = os.path.join(self.workspace, "outputs")
+        os.makedirs(self.temp_dir, exist_ok=True)
+        os.makedirs(self.outputs_dir, exist_ok=True)
+
+    def input_seconds(self, primary_path: str, audio_path: Optional[str]) -> float:
+        seconds = _wav_seconds(audio_path) if audio_path else None
+        if seconds is None:
+            seconds = _video_seconds(primary_path)
+        return seconds if seconds is not None else self.default_seconds
+
+    def _stream(self, data: bytes, seconds: float, stream_dir: str, stream_format: str, segment_s: float = 2.0,
+                rtf: Optional[float] = None):
+        rtf = self.rtf if rtf is None else rtf
+        os.makedirs(stream_dir, exist_ok=True)
+        count = max(1, int(math.ceil(seconds / segment_s)))
+        size = int(math.ceil(len(data) / float(count)))
+        lines = ["#EXTM3U", "#EXT-X-VERSION:7", f"#EXT-X-TARGETDURATION:{int(math.ceil(segment_s))}",
+                 "#EXT-X-PLAYLIST-TYPE:EVENT"]
+        time.sleep(self.overhead_s)
+        for i in range(count):
+            length = min(segment_s, seconds - i * segment_s)
+            time.sleep(rtf * length)
+            chunk = data[i * size:(i + 1) * size]
+            if stream_format == "fmp4":
+                with open(os.path.join(stream_dir, "stream.mp4"), "ab") as f:
+                    f.write(chunk)
+                continue
+            with open(os.path.join(stream_dir, f"seg_{i:05d}.m4s"), "wb") as f:
+                f.write(chunk)
+            lines += [f"#EXTINF:{length:.3f},", f"seg_{i:05d}.m4s"]
+            if i == count - 1:
+                lines.append("#EXT-X-ENDLIST")
+            tmp = os.path.join(stream_dir, "index.m3u8.tmp")
+            with open(tmp, "w") as f:
+                f.write("\n".join(lines) + "\n")
+            os.replace(tmp, os.path.join(stream_dir, "index.m3u8"))
+        with open(os.path.join(stream_dir, "status.json"), "w") as f:
+            json.dump({"done": True, "ok": True, "format": stream_format}, f)
+
+    def run(self, primary_bytes: bytes, audio_bytes: Optional[bytes] = None,
+            stream_dir: Optional[str] = None, stream_format: str = "hls",
+            preview: bool = False, artifacts_dir: Optional[str] = None) -> Dict:
+        job_id = str(uuid.uuid4())
+        profiler = JobProfiler(job_id)
+        primary_in = os.path.join(self.temp_dir, f"{job_id}_in_primary")
+        audio_in = os.path.join(self.temp_dir, f"{job_id}_in_audio.wav") if audio_bytes else None
+        job_output = os.path.join(self.outputs_dir, f"{job_id}_{self.name}_stub.mp4")
+
+        try:
+            with profiler.stage("upload_save"):
+                with open(primary_in, "wb") as f:
+                    f.write(primary_bytes)
+                if audio_in:
+                    with open(audio_in, "wb") as f:
+                        f.write(audio_bytes)
+
+            seconds = self.input_seconds(primary_in, audio_in)
+            rtf = self.rtf * (PREVIEW_COST_SCALE if preview else 1.0)
+            with profiler.stage("inference"):
+                if stream_dir:
+                    self._stream(primary_bytes, seconds, stream_dir, stream_format, rtf=rtf)
+                else:
+                    time.sleep(self.overhead_s + rtf * seconds)
+
+            os.replace(primary_in, job_output)
+        finally:
+            for path in (primary_in, audio_in):
+                if path and os.path.exists(path):
+                    os.remove(path)
+
+        profiler.counters.update({"frames": int(round(seconds * self.fps)), "fps": self.fps,
+                                  "input_seconds": round(seconds, 3)})
+        return {"status": "success", "output_path": job_output, "profile": profiler.report()}
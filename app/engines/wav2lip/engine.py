@@ -1,4 +1,5 @@
 # app/engines/wav2lip/engine.py
+import hashlib
 import os
 import uuid
 import subprocess
@@ -8,7 +9,18 @@ from app.engines.wav2lip.utils import (
     save_uploaded_bytes,
     ensure_outputs_dir,
     merge_audio_video_if_needed,
+    publish_output,
 )
+from app.utils.metrics import FFMPEG_FAILURES
+from app.utils.profiling import JobProfiler
+from app.utils.resources import CpuSlot
+from app.utils.zygote import run_infer
+
+# infer.py flags of the preview profile: half the frames at half resolution, face detection on
+# frames scaled down once more and the fastest x264 preset. --keyframe_interval stays at 1 until
+# benchmarks/bench_keyframes.py has LSE-C / LSE-D numbers showing interpolation keeps the sync.
+PREVIEW_INFER_ARGS = ["--frame_step", "2", "--resize_factor", "2", "--detect_scale", "0.5",
+                      "--encoder_preset", "ultrafast"]
 
 class Wav2LipEngine:
     """
@@ -16,9 +28,16 @@ class Wav2LipEngine:
     - Expects model infer.py in model_path (default: Wav2Lip folder)
     - Works with 'workspace' param (use '.' for local testing, '/workspace' in Pod)
     - Writes canonical output to <workspace>/outputs/video_sync.mp4
+    - Optional cpu_slot pins infer.py/ffmpeg to this worker's cores and thread count
+    - Every result carries a per-stage "profile"; set trace_dir (or LIP2SYNC_TORCH_TRACE_DIR)
+      to also keep a torch.profiler trace per job
+    - stream_dir makes infer.py also write HLS / fragmented MP4 segments there as batches finish
+    - preview=True renders a quick low-resolution proxy; with artifacts_dir it keeps its decoded frames,
+      face boxes and mel there, and a later run(..., artifacts_dir=...) of the same inputs reuses them
     """
 
-    def __init__(self, model_path: str = "models/wav2lip", workspace: Optional[str] = None):
+    def __init__(self, model_path: str = "models/wav2lip", workspace: Optional[str] = None,
+                 cpu_slot: Optional[CpuSlot] = None, trace_dir: Optional[str] = None):
         # workspace: if environment variable WORKSPACE set, use that, else default to current directory
         env_ws = os.environ.get("WORKSPACE")
         if workspace is None:
@@ -26,6 +45,8 @@ class Wav2LipEngine:
 
         self.model_path = model_path
         self.workspace = workspace
+        self.cpu_slot = cpu_slot
+        self.trace_dir = trace_dir or os.environ.get("LIP2SYNC_TORCH_TRACE_DIR")
         self.temp_dir = os.path.join(self.workspace, "temp")
         self.outputs_dir = os.path.join(self.workspace, "outputs")
 
@@ -33,8 +54,13 @@ class Wav2LipEngine:
         os.makedirs(self.temp_dir, exist_ok=True)
         ensure_outputs_dir(self.outputs_dir)
 
-    def run(self, video_bytes: bytes, audio_bytes: Optional[bytes] = None) -> Dict:
+    def run(self, video_bytes: bytes, audio_bytes: Optional[bytes] = None,
+            stream_dir: Optional[str] = None, stream_format: str = "hls",
+            preview: bool = False, artifacts_dir: Optional[str] = None) -> Dict:
         job_id = str(uuid.uuid4())
+        profiler = JobProfiler(job_id)
+        run_kwargs = self.cpu_slot.popen_kwargs() if self.cpu_slot else {}
+        threads = self.cpu_slot.threads if self.cpu_slot else None
 
         # Paths
         video_in = os.path.join(self.temp_dir, f"{job_id}_in_video.mp4")
@@ -45,25 +71,30 @@ class Wav2LipEngine:
         merged_video = os.path.join(self.temp_dir, f"{job_id}_merged.mp4")
         job_output = os.path.join(self.outputs_dir, f"{job_id}_video_sync.mp4")
         final_output = os.path.join(self.outputs_dir, "video_sync.mp4")
+        profile_path = os.path.join(self.temp_dir, f"{job_id}_profile.json")
 
         # Save inputs
-        save_uploaded_bytes(video_bytes, video_in)
-        if audio_bytes:
-            save_uploaded_bytes(audio_bytes, audio_in)
+        with profiler.stage("upload_save"):
+            save_uploaded_bytes(video_bytes, video_in)
+            if audio_bytes:
+                save_uploaded_bytes(audio_bytes, audio_in)
 
         # Merge audio if separate
         if audio_in:
             try:
-                merge_audio_video_if_needed(video_in, audio_in, merged_video)
+                with profiler.stage("ffmpeg_merge"):
+                    merge_audio_video_if_needed(video_in, audio_in, merged_video, threads=threads, **run_kwargs)
                 face_input = merged_video
             except Exception as e:
-                return {"status": "error", "details": f"ffmpeg merge failed: {e}"}
+                FFMPEG_FAILURES.labels("merge").inc()
+                return {"status": "error", "details": f"ffmpeg merge failed: {e}", "profile": profiler.report()}
         else:
             face_input = video_in
 
         # Validate model paths
         infer_script = os.path.join(self.model_path, "infer.py")
         checkpoint = os.path.join(self.model_path, "checkpoints", "wav2lip.pth")
+        detector = os.path.join(self.model_path, "checkpoints", "s3fd.pth")
 
         if not os.path.exists(infer_script):
             return {"status": "error", "details": f"infer.py not found at {infer_script}"}
@@ -78,24 +109,43 @@ class Wav2LipEngine:
             "--face", face_input,
         ]
 
+        # Load S3FD from checkpoints/ instead of downloading it into the package dir
+        if os.path.exists(detector):
+            command += ["--detector_path", detector]
+
         if audio_in:
             command += ["--audio", audio_in]
 
-        command += ["--outfile", job_output]
+        command += ["--outfile", job_output, "--profile_out", profile_path]
+        if threads:
+            command += ["--threads", str(threads)]
+        if self.trace_dir:
+            command += ["--torch_trace", os.path.join(self.trace_dir, f"{job_id}_trace.json")]
+        if stream_dir:
+            # Progressive output: segments appear in stream_dir while infer.py runs
+            command += ["--stream_dir", stream_dir, "--stream_format", stream_format]
+        if preview:
+            command += PREVIEW_INFER_ARGS
+        if artifacts_dir:
+            command += ["--save_artifacts" if preview else "--reuse_artifacts", artifacts_dir]
+        if os.environ.get("LIP2SYNC_FRAME_STORE"):
+            # Every job saves the upload under a new name; key the frame store on its content instead.
+            command += ["--face_digest", hashlib.sha256(video_bytes).hexdigest()]
 
         # Run inference
         try:
-            subprocess.run(command, check=True)
+            with profiler.stage("inference"):
+                run_infer(command, self.cpu_slot)
         except subprocess.CalledProcessError as e:
-            return {"status": "error", "details": f"inference failed: {e}"}
+            return {"status": "error", "details": f"inference failed: {e}", "profile": profiler.report()}
+        finally:
+            profiler.merge_file(profile_path, prefix="inference.")
 
-        # Move result to canonical output name
+        # Publish the canonical output as a hard link swapped in atomically. The job keeps
+        # its own file, so concurrent renders never return each other's video.
         try:
-            if os.path.exists(final_output):
-                os.remove(final_output)
-            os.rename(job_output, final_output)
-        except Exception:
-            # fallback
-            return {"status": "success", "output_path": job_output}
-
-        return {"status": "success", "output_path": final_output}
+            publish_output(job_output, final_output)
+        except OSError:
+            pass
+
+        return {"status": "success", "output_path": job_output, "profile": profiler.report()}
@@ -1,6 +1,8 @@
 # app/engines/wav2lip/utils.py
 import os
-import subprocess
+from typing import Optional
+
+from app.utils.profiling import run_child
 
 def save_uploaded_bytes(data: bytes, path: str) -> str:
     with open(path, "wb") as f:
@@ -11,10 +13,21 @@ def ensure_outputs_dir(path: str):
     os.makedirs(path, exist_ok=True)
     return path
 
-def merge_audio_video_if_needed(video_in: str, audio_in: str, out_path: str):
+def publish_output(job_output: str, final_output: str) -> str:
+    """
+    Point final_output at job_output via a hard link swapped in with os.replace,
+    so readers always see a complete file and job_output stays in place.
+    """
+    tmp = f"{final_output}.{os.getpid()}.{os.path.basename(job_output)}.tmp"
+    os.link(job_output, tmp)
+    os.replace(tmp, final_output)
+    return final_output
+
+def merge_audio_video_if_needed(video_in: str, audio_in: str, out_path: str, threads: Optional[int] = None, **run_kwargs):
     """
     Use ffmpeg to merge audio + video into out_path.
-    Requires ffmpeg present in PATH.
+    Requires ffmpeg present in PATH. ``run_kwargs`` go to subprocess.Popen
+    (e.g. env/preexec_fn from a CpuSlot).
     """
     cmd = [
         "ffmpeg", "-y",
@@ -25,7 +38,9 @@ def merge_audio_video_if_needed(video_in: str, audio_in: str, out_path: str):
         "-strict", "experimental",
         "-map", "0:v:0",
         "-map", "1:a:0",
-        out_path
     ]
-    subprocess.run(cmd, check=True)
+    if threads:
+        cmd += ["-threads", str(threads)]
+    cmd.append(out_path)
+    run_child(cmd, **run_kwargs)
     return out_path
@@ -8,7 +8,13 @@ from app.engines.wav2lip_single_image.utils import (
     save_uploaded_bytes,
     ensure_outputs_dir,
     merge_audio_video_if_needed,
+    publish_output,
 )
+from app.engines.wav2lip.engine import PREVIEW_INFER_ARGS
+from app.utils.metrics import FFMPEG_FAILURES
+from app.utils.profiling import JobProfiler, run_child
+from app.utils.resources import CpuSlot
+from app.utils.zygote import run_infer
 
 class Wav2LipSingleImageEngine:
     """
@@ -21,14 +27,23 @@ class Wav2LipSingleImageEngine:
              checkpoints/wav2lip.pth
              checkpoints/wav2lip_gan.pth (optional)
              checkpoints/s3fd.pth
+      - Optional cpu_slot pins infer.py/ffmpeg to this worker's cores and thread count
+      - Results carry a per-stage "profile"; trace_dir (or LIP2SYNC_TORCH_TRACE_DIR) keeps a
+        torch.profiler trace per job
+      - stream_dir makes infer.py also write HLS / fragmented MP4 segments there as batches finish
+      - preview / artifacts_dir: quick proxy render whose artifacts a later full render reuses
+        (see Wav2LipEngine)
     """
 
-    def __init__(self, model_path: str = "models/wav2lip", workspace: Optional[str] = None):
+    def __init__(self, model_path: str = "models/wav2lip", workspace: Optional[str] = None,
+                 cpu_slot: Optional[CpuSlot] = None, trace_dir: Optional[str] = None):
         env_ws = os.environ.get("WORKSPACE")
         if workspace is None:
             workspace = env_ws if env_ws else "."
         self.model_path = model_path
         self.workspace = workspace
+        self.cpu_slot = cpu_slot
+        self.trace_dir = trace_dir or os.environ.get("LIP2SYNC_TORCH_TRACE_DIR")
 
         # temp + outputs inside workspace so Pod can mount /workspace
         self.temp_dir = os.path.join(self.workspace, "temp_single_image")
@@ -36,7 +51,9 @@ class Wav2LipSingleImageEngine:
         os.makedirs(self.temp_dir, exist_ok=True)
         ensure_outputs_dir(self.outputs_dir)
 
-    def run(self, image_bytes: bytes, audio_bytes: Optional[bytes] = None) -> Dict:
+    def run(self, image_bytes: bytes, audio_bytes: Optional[bytes] = None,
+            stream_dir: Optional[str] = None, stream_format: str = "hls",
+            preview: bool = False, artifacts_dir: Optional[str] = None) -> Dict:
         """
         Run the single-image pipeline:
           - Save uploads to temp
@@ -47,6 +64,10 @@ class Wav2LipSingleImageEngine:
         Returns: dict with status and path or error details.
         """
         job_id = str(uuid.uuid4())
+        profiler = JobProfiler(job_id)
+        run_kwargs = self.cpu_slot.popen_kwargs() if self.cpu_slot else {}
+        threads = self.cpu_slot.threads if self.cpu_slot else None
+        ffmpeg_threads = ["-threads", str(threads)] if threads else []
 
         # file paths
         img_in = os.path.join(self.temp_dir, f"{job_id}_in_image.png")
@@ -58,14 +79,16 @@ class Wav2LipSingleImageEngine:
         image_video = os.path.join(self.temp_dir, f"{job_id}_image_video.mp4")
         job_output = os.path.join(self.outputs_dir, f"{job_id}_single_image.mp4")
         final_output = os.path.join(self.outputs_dir, "single_image.mp4")
+        profile_path = os.path.join(self.temp_dir, f"{job_id}_profile.json")
 
         # Save uploaded bytes
         try:
-            save_uploaded_bytes(image_bytes, img_in)
-            if audio_bytes:
-                save_uploaded_bytes(audio_bytes, audio_in)
+            with profiler.stage("upload_save"):
+                save_uploaded_bytes(image_bytes, img_in)
+                if audio_bytes:
+                    save_uploaded_bytes(audio_bytes, audio_in)
         except Exception as e:
-            return {"status": "error", "details": f"failed to save uploads: {e}"}
+            return {"status": "error", "details": f"failed to save uploads: {e}", "profile": profiler.report()}
 
         # Create a short video from the image ( ffmpeg -loop 1 -i img -c:v libx264 -t <duration> ... )
         # Duration: if audio provided use audio duration implicitly by merging; otherwise create 5s video.
@@ -80,12 +103,15 @@ class Wav2LipSingleImageEngine:
                     "ffmpeg", "-y", "-loop", "1", "-i", img_in,
                     "-c:v", "libx264", "-t", "60", "-pix_fmt", "yuv420p",
                     "-vf", "scale=640:-2",
+                    *ffmpeg_threads,
                     image_video
                 ]
-                subprocess.run(cmd_img_vid, check=True)
+                with profiler.stage("ffmpeg_image_video"):
+                    run_child(cmd_img_vid, **run_kwargs)
                 # merge audio into that video (so Face input is video with audio)
                 merged_input = os.path.join(self.temp_dir, f"{job_id}_merged_input.mp4")
-                merge_audio_video_if_needed(image_video, audio_in, merged_input)
+                with profiler.stage("ffmpeg_merge"):
+                    merge_audio_video_if_needed(image_video, audio_in, merged_input, threads=threads, **run_kwargs)
                 face_input = merged_input
             else:
                 # if no audio provided, just produce a short video (5s) to feed model
@@ -93,18 +119,23 @@ class Wav2LipSingleImageEngine:
                     "ffmpeg", "-y", "-loop", "1", "-i", img_in,
                     "-c:v", "libx264", "-t", "5", "-pix_fmt", "yuv420p",
                     "-vf", "scale=640:-2",
+                    *ffmpeg_threads,
                     image_video
                 ]
-                subprocess.run(cmd_img_vid, check=True)
+                with profiler.stage("ffmpeg_image_video"):
+                    run_child(cmd_img_vid, **run_kwargs)
                 face_input = image_video
         except subprocess.CalledProcessError as e:
-            return {"status": "error", "details": f"ffmpeg failed while creating image video: {e}"}
+            FFMPEG_FAILURES.labels("image_video").inc()
+            return {"status": "error", "details": f"ffmpeg failed while creating image video: {e}",
+                    "profile": profiler.report()}
         except Exception as e:
-            return {"status": "error", "details": f"image video creation error: {e}"}
+            return {"status": "error", "details": f"image video creation error: {e}", "profile": profiler.report()}
 
         # Validate model existence
         infer_script = os.path.join(self.model_path, "infer.py")
         checkpoint = os.path.join(self.model_path, "checkpoints", "wav2lip.pth")
+        detector = os.path.join(self.model_path, "checkpoints", "s3fd.pth")
         if not os.path.exists(infer_script):
             return {"status": "error", "details": f"infer.py not found at {infer_script}"}
         if not os.path.exists(checkpoint):
@@ -116,25 +147,43 @@ class Wav2LipSingleImageEngine:
             infer_script,
             "--checkpoint_path", checkpoint,
             "--face", face_input,
-            "--outfile", job_output
+            "--outfile", job_output,
+            "--profile_out", profile_path,
         ]
+        if threads:
+            command += ["--threads", str(threads)]
+        if self.trace_dir:
+            command += ["--torch_trace", os.path.join(self.trace_dir, f"{job_id}_trace.json")]
+        if stream_dir:
+            # Progressive output: segments appear in stream_dir while infer.py runs
+            command += ["--stream_dir", stream_dir, "--stream_format", stream_format]
+        if preview:
+            command += PREVIEW_INFER_ARGS
+        if artifacts_dir:
+            command += ["--save_artifacts" if preview else "--reuse_artifacts", artifacts_dir]
+
+        # Load S3FD from checkpoints/ instead of downloading it into the package dir
+        if os.path.exists(detector):
+            command += ["--detector_path", detector]
 
         # If audio_bytes exists and we didn't already attach it into face_input, pass --audio (but above we merged)
         # (No-op here - we already merged audio into face_input)
         try:
-            subprocess.run(command, check=True)
+            with profiler.stage("inference"):
+                run_infer(command, self.cpu_slot)
         except subprocess.CalledProcessError as e:
             # capture stderr would be useful but avoid exposing too much; include returncode
-            return {"status": "error", "details": f"inference failed: returncode {e.returncode}"}
+            return {"status": "error", "details": f"inference failed: returncode {e.returncode}",
+                    "profile": profiler.report()}
+        finally:
+            profiler.merge_file(profile_path, prefix="inference.")
 
-        # Move to canonical filename
+        # Publish the canonical output as a hard link swapped in atomically. The job keeps
+        # its own file, so concurrent renders never return each other's video.
         try:
-            if os.path.exists(final_output):
-                os.remove(final_output)
-            os.rename(job_output, final_output)
-        except Exception:
-            # fallback to returning job_output path
-            return {"status": "success", "output_path": job_output}
-
-        return {"status": "success", "output_path": final_output}
+            publish_output(job_output, final_output)
+        except OSError:
+            pass
+
+        return {"status": "success", "output_path": job_output, "profile": profiler.report()}
 
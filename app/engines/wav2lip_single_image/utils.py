@@ -1,8 +1,9 @@
 # app/engines/wav2lip_single_image/utils.py
 import os
-import subprocess
 from typing import Optional
 
+from app.utils.profiling import run_child
+
 def save_uploaded_bytes(data: bytes, path: str) -> str:
     """Write bytes to path and return path."""
     with open(path, "wb") as f:
@@ -14,10 +15,21 @@ def ensure_outputs_dir(path: str) -> str:
     os.makedirs(path, exist_ok=True)
     return path
 
-def merge_audio_video_if_needed(video_in: str, audio_in: str, out_path: str) -> str:
+def publish_output(job_output: str, final_output: str) -> str:
+    """
+    Make final_output a hard link to job_output, replaced atomically, so the
+    canonical file is always complete and job_output is left in place.
+    """
+    tmp = f"{final_output}.{os.getpid()}.{os.path.basename(job_output)}.tmp"
+    os.link(job_output, tmp)
+    os.replace(tmp, final_output)
+    return final_output
+
+def merge_audio_video_if_needed(video_in: str, audio_in: str, out_path: str, threads: Optional[int] = None, **run_kwargs) -> str:
     """
     Use ffmpeg to copy video and merge audio into out_path.
-    Requires ffmpeg installed and available in PATH.
+    Requires ffmpeg installed and available in PATH. ``run_kwargs`` go to
+    subprocess.Popen (e.g. env/preexec_fn from a CpuSlot).
     """
     # Build ffmpeg command to map video and audio properly, re-encode audio to aac
     cmd = [
@@ -29,8 +41,10 @@ def merge_audio_video_if_needed(video_in: str, audio_in: str, out_path: str) ->
         "-b:a", "192k",
         "-map", "0:v:0",
         "-map", "1:a:0",
-        out_path
     ]
-    subprocess.run(cmd, check=True)
+    if threads:
+        cmd += ["-threads", str(threads)]
+    cmd.append(out_path)
+    run_child(cmd, **run_kwargs)
     return out_path
 
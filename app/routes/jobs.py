@@ -0,0 +1,81 @@
+# app/routes/jobs.py
+import asyncio
+import os
+from fastapi import APIRouter, Request
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from app.utils.jobs import MEDIA_TYPES, Job, get_job_registry
+
+router = APIRouter()
+
+# How often a reader of the growing fragmented MP4 looks for new bytes
+TAIL_POLL_S = 0.25
+TAIL_CHUNK = 1 << 16
+
+
+def _job_or_404(job_id: str):
+    job = get_job_registry().get(job_id)
+    if job is None:
+        return None, JSONResponse({"status": "error", "details": "unknown job"}, status_code=404)
+    return job, None
+
+
+def _base_url(request: Request, job: Job) -> str:
+    return request.url_for("job_status", job_id=job.id).path
+
+
+@router.get("/jobs/{job_id}", name="job_status")
+async def job_status(job_id: str, request: Request):
+    job, error = _job_or_404(job_id)
+    if error:
+        return error
+    return job.describe(_base_url(request, job))
+
+
+async def _tail(path: str, job: Job):
+    """Yield a file that is still being written, until the render has finished and everything was sent."""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(TAIL_CHUNK)
+            if chunk:
+                yield chunk
+            elif job.done:
+                # One last read: the encoder may have flushed after our previous read.
+                rest = f.read()
+                if rest:
+                    yield rest
+                return
+            else:
+                await asyncio.sleep(TAIL_POLL_S)
+
+
+@router.get("/jobs/{job_id}/stream/{filename}")
+async def job_stream(job_id: str, filename: str):
+    job, error = _job_or_404(job_id)
+    if error:
+        return error
+    path = os.path.join(job.stream_dir, filename)
+    if os.path.basename(filename) != filename or filename.endswith(".tmp") or not os.path.isfile(path):
+        # The playlist appears with the first segment; players and clients retry.
+        headers = None if job.done else {"Retry-After": "1"}
+        return JSONResponse({"status": "error", "details": "not available yet" if headers else "not found"},
+                            status_code=404, headers=headers)
+
+    media_type = MEDIA_TYPES.get(os.path.splitext(filename)[1], "application/octet-stream")
+    if filename == job.entry_file:
+        if job.stream_format == "fmp4" and not job.done:
+            return StreamingResponse(_tail(path, job), media_type=media_type)
+        if not job.done:
+            # The EVENT playlist grows while rendering; never let a cache pin an old copy.
+            return FileResponse(path, media_type=media_type, headers={"Cache-Control": "no-cache"})
+    return FileResponse(path, media_type=media_type)
+
+
+@router.get("/jobs/{job_id}/result")
+async def job_result(job_id: str, request: Request):
+    job, error = _job_or_404(job_id)
+    if error:
+        return error
+    if job.status != "success":
+        code = 500 if job.status == "error" else 202
+        return JSONResponse(job.describe(_base_url(request, job)), status_code=code)
+    return FileResponse(job.result["output_path"], media_type="video/mp4", filename=f"{job.kind}.mp4")
@@ -0,0 +1,126 @@
+# app/routes/realtime.py
+"""
+Live lip-sync over a WebSocket, e.g. to drive an avatar from a TTS stream.
+
+1. POST /api/realtime/faces with an image (and optionally box=y1,y2,x1,x2)
+   registers the face and returns a face_id. Detection runs once here.
+2. Open ws /api/realtime/wav2lip?face_id=...&fps=25&format=jpeg|h264.
+   The server answers {"type": "ready", ...}.
+3. Send binary messages of PCM: s16le, mono, 16 kHz, any chunk size.
+   Each frame is returned as a binary message as soon as its audio window is
+   complete: one JPEG per message, or an Annex-B H.264 byte stream. About once
+   per second the server sends {"type": "stats"} with per-stage latency
+   against the 1/fps frame budget.
+4. Send {"type": "end"} to flush the tail. The server sends the remaining
+   frames, then {"type": "done", "stats": ...}, and closes. {"type": "stats"}
+   asks for the latency report at any time.
+
+LIP2SYNC_RT_SESSIONS caps concurrent sessions per process (default 2).
+Sessions beyond that are closed with code 1013 (try again later). A session
+that cannot be opened gets {"type": "error"} and code 1011 (checkpoint or
+encoder missing on the server) or 1008 (face/fps/format rejected).
+"""
+import json
+import os
+import time
+from typing import Optional
+from fastapi import APIRouter, File, Query, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from app.engines.realtime.engine import RealtimeEngine, parse_box
+from app.utils.metrics import REALTIME_SESSIONS
+
+router = APIRouter()
+
+engine = RealtimeEngine(model_path=os.environ.get("WAV2LIP_MODEL_PATH", "Wav2Lip"),
+                        src_path=os.environ.get("WAV2LIP_SRC_PATH"))
+MAX_SESSIONS = int(os.environ.get("LIP2SYNC_RT_SESSIONS", "2"))
+_open_sessions = 0
+
+
+@router.post("/realtime/faces")
+async def register_face(image: UploadFile = File(...),
+                        box: Optional[str] = Query(None, description="y1,y2,x1,x2; skips face detection")):
+    image_bytes = await image.read()
+    try:
+        face_id, face = await run_in_threadpool(engine.register_face, image_bytes, parse_box(box))
+    except ValueError as e:
+        return JSONResponse({"status": "error", "details": str(e)}, status_code=422)
+    except FileNotFoundError as e:
+        return JSONResponse({"status": "error", "details": str(e)}, status_code=503)
+    return {"face_id": face_id, "box": list(face.coords), "lookahead_ms": engine.lookahead_ms()}
+
+
+async def _send(websocket: WebSocket, session, chunks):
+    if not chunks:
+        return
+    start = time.perf_counter()
+    for chunk in chunks:
+        await websocket.send_bytes(chunk)
+    session.latency.add("send", time.perf_counter() - start)
+
+
+async def _close_with_error(websocket: WebSocket, code: int, details: str):
+    await websocket.send_json({"type": "error", "details": details})
+    # Close reasons are limited to 123 bytes.
+    await websocket.close(code=code, reason=details.encode()[:123].decode(errors="ignore"))
+
+
+def _message_type(text: Optional[str]) -> Optional[str]:
+    try:
+        return json.loads(text).get("type")
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+@router.websocket("/realtime/wav2lip")
+async def realtime_wav2lip(websocket: WebSocket, face_id: str, fps: float = Query(25.0, gt=0, le=60),
+                           encoder: str = Query("jpeg", alias="format", pattern="^(jpeg|h264)$")):
+    global _open_sessions
+    await websocket.accept()
+    face = engine.get_face(face_id)
+    if face is None:
+        await websocket.send_json({"type": "error", "details": "unknown face_id; register it first"})
+        await websocket.close(code=1008)
+        return
+    if _open_sessions >= MAX_SESSIONS:
+        await websocket.send_json({"type": "error", "details": "too many real-time sessions"})
+        await websocket.close(code=1013)
+        return
+
+    _open_sessions += 1
+    REALTIME_SESSIONS.inc()
+    session = None
+    try:
+        try:
+            session = await run_in_threadpool(engine.open_session, face, fps, encoder)
+        except (FileNotFoundError, ValueError) as e:
+            # Missing checkpoint or encoder binary is a server fault (1011); a bad face/fps/format is policy (1008).
+            await _close_with_error(websocket, 1011 if isinstance(e, FileNotFoundError) else 1008, str(e))
+            return
+        await websocket.send_json({"type": "ready", "face_id": face_id, "fps": fps, "format": encoder,
+                                   "sample_rate": 16000, "lookahead_ms": engine.lookahead_ms()})
+        next_stats = int(fps)
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes") is not None:
+                await _send(websocket, session, await run_in_threadpool(session.push, message["bytes"]))
+                if session.frame_index >= next_stats:
+                    next_stats = session.frame_index + int(fps)
+                    await websocket.send_json({"type": "stats", "stats": session.latency.report()})
+            elif _message_type(message.get("text")) == "end":
+                await _send(websocket, session, await run_in_threadpool(session.end))
+                await websocket.send_json({"type": "done", "stats": session.latency.report()})
+                await websocket.close()
+                break
+            elif _message_type(message.get("text")) == "stats":
+                await websocket.send_json({"type": "stats", "stats": session.latency.report()})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        _open_sessions -= 1
+        REALTIME_SESSIONS.dec()
+        if session is not None:
+            await run_in_threadpool(session.close)
@@ -1,8 +1,18 @@
 # app/routes/wav2lip.py
 import os
-from fastapi import APIRouter, UploadFile, File
+from typing import Optional
+from fastapi import APIRouter, UploadFile, File, Header, Query, Request
 from fastapi.responses import FileResponse, JSONResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from app.engines.stub.engine import StubEngine
 from app.engines.wav2lip.engine import Wav2LipEngine
+from app.utils.admission import AdmissionError, admit_upload
+from app.utils.jobs import PREVIEW_COST_SCALE, get_job_registry
+from app.utils.metrics import record_render, track_in_flight
+from app.utils.profiling import profile_header
+from app.utils.resources import get_cpu_slot
+from app.utils.singleflight import SingleFlight, remove_output, request_key
 
 router = APIRouter()
 
@@ -11,14 +21,108 @@ workspace_env = os.environ.get("WORKSPACE", ".")
 # model path (if your repo contains Wav2Lip folder, use "Wav2Lip")
 model_path = os.environ.get("WAV2LIP_MODEL_PATH", "Wav2Lip")
 
-engine = Wav2LipEngine(model_path=model_path, workspace=workspace_env)
+# LIP2SYNC_ENGINE=stub simulates inference cost so load tests measure only the HTTP/upload/queueing layers
+if os.environ.get("LIP2SYNC_ENGINE") == "stub":
+    engine = StubEngine("wav2lip", workspace=workspace_env)
+else:
+    engine = Wav2LipEngine(model_path=model_path, workspace=workspace_env, cpu_slot=get_cpu_slot())
+inflight = SingleFlight("wav2lip")
 
 @router.post("/sync/wav2lip")
-async def sync_wav2lip(video: UploadFile = File(...), audio: UploadFile = File(None)):
+async def sync_wav2lip(video: UploadFile = File(...), audio: UploadFile = File(None),
+                       profile: bool = False, priority: int = Query(0, ge=-10, le=10),
+                       x_api_key: Optional[str] = Header(None)):
     video_bytes = await video.read()
     audio_bytes = await audio.read() if audio else None
 
-    result = engine.run(video_bytes, audio_bytes)
+    async def render():
+        # Queue order is fair across API keys; priority shifts a job within that order.
+        ticket = await admit_upload("wav2lip", video_bytes, audio_bytes, tenant=x_api_key, priority=priority)
+        # Wait for this job's turn at a render slot, then render off the event loop
+        # so other requests keep being served.
+        async with ticket:
+            with track_in_flight("wav2lip"):
+                result = await run_in_threadpool(engine.run, video_bytes, audio_bytes)
+            ticket.record(result)
+        record_render("wav2lip", result)
+        return result
+
+    # Identical uploads that arrive while this render runs share it instead of rendering again.
+    key = await run_in_threadpool(request_key, "wav2lip", video_bytes, audio_bytes)
+    try:
+        result, release = await inflight.do(key, render, cleanup=remove_output)
+    except AdmissionError as e:
+        return e.response()
+
     if result.get("status") == "success":
-        return FileResponse(result["output_path"], media_type="video/mp4", filename="video_sync.mp4")
-    return JSONResponse({"status": "error", "details": result.get("details", "unknown")}, status_code=500)
+        # The per-job file is removed once every request sharing it has been sent;
+        # the engine keeps the canonical copy.
+        return FileResponse(result["output_path"], media_type="video/mp4", filename="video_sync.mp4",
+                            headers=profile_header(result) if profile else None,
+                            background=BackgroundTask(release))
+    release()
+    body = {"status": "error", "details": result.get("details", "unknown")}
+    if profile:
+        body["profile"] = result.get("profile")
+    return JSONResponse(body, status_code=500)
+
+@router.post("/stream/wav2lip", status_code=202)
+async def stream_wav2lip(request: Request, video: UploadFile = File(...), audio: UploadFile = File(None),
+                         stream_format: str = Query("hls", alias="format", pattern="^(hls|fmp4)$"),
+                         priority: int = Query(0, ge=-10, le=10), x_api_key: Optional[str] = Header(None)):
+    # Progressive output: answer with a job at once and serve its segments while it renders.
+    video_bytes = await video.read()
+    audio_bytes = await audio.read() if audio else None
+
+    async def admit():
+        return await admit_upload("wav2lip", video_bytes, audio_bytes, tenant=x_api_key, priority=priority)
+
+    async def render(job, ticket):
+        async with ticket:
+            with track_in_flight("wav2lip"):
+                result = await run_in_threadpool(engine.run, video_bytes, audio_bytes,
+                                                 stream_dir=job.stream_dir, stream_format=job.stream_format)
+            ticket.record(result)
+        record_render("wav2lip", result)
+        return result
+
+    # An identical upload that is still rendering returns the existing job.
+    key = await run_in_threadpool(request_key, "wav2lip", video_bytes, audio_bytes, stream_format=stream_format)
+    try:
+        job = await get_job_registry().submit("wav2lip", key, stream_format, admit, render)
+    except AdmissionError as e:
+        return e.response()
+    body = job.describe(request.url_for("job_status", job_id=job.id).path)
+    return JSONResponse(body, status_code=202, headers={"Location": body["status_url"]})
+
+@router.post("/preview/wav2lip", status_code=202)
+async def preview_wav2lip(request: Request, video: UploadFile = File(...), audio: UploadFile = File(None),
+                          stream_format: str = Query("hls", alias="format", pattern="^(hls|fmp4)$"),
+                          priority: int = Query(0, ge=-10, le=10), x_api_key: Optional[str] = Header(None)):
+    # Two tiers: a low-resolution, low-fps preview within seconds, then the full-quality render,
+    # which starts from the preview's frames, face boxes and mel instead of from zero.
+    video_bytes = await video.read()
+    audio_bytes = await audio.read() if audio else None
+
+    async def admit(preview):
+        return await admit_upload("wav2lip", video_bytes, audio_bytes, tenant=x_api_key, priority=priority,
+                                  cost_scale=PREVIEW_COST_SCALE if preview else 1.0)
+
+    async def render(job, ticket, preview, artifacts_dir):
+        async with ticket:
+            with track_in_flight("wav2lip"):
+                result = await run_in_threadpool(engine.run, video_bytes, audio_bytes,
+                                                 stream_dir=job.stream_dir, stream_format=job.stream_format,
+                                                 preview=preview, artifacts_dir=artifacts_dir)
+            ticket.record(result)
+        record_render("wav2lip", result)
+        return result
+
+    key = await run_in_threadpool(request_key, "wav2lip", video_bytes, audio_bytes, stream_format=stream_format)
+    try:
+        preview, final = await get_job_registry().submit_preview("wav2lip", key, stream_format, admit, render)
+    except AdmissionError as e:
+        return e.response()
+    body = {name: job.describe(request.url_for("job_status", job_id=job.id).path)
+            for name, job in (("preview", preview), ("final", final))}
+    return JSONResponse(body, status_code=202, headers={"Location": body["final"]["status_url"]})
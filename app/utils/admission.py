@@ -0,0 +1,395 @@
+# app/utils/admission.py
+"""
+Admission control for render requests.
+
+Every upload is costed before it is queued: ffprobe reads the container
+headers (no decoding) for frame count, resolution and audio length, and the
+cost is the number of output frames times their pixel count. The controller
+turns that into estimated render seconds and admits the job only while the
+node's outstanding work (queued + running) stays within its budget.
+
+  - over the size limits         -> 413, before any decode work
+  - unreadable input             -> 400
+  - over the node's work budget  -> 429 with Retry-After = estimated drain time
+
+UploadGate (ASGI middleware) applies the cheap checks before the routes
+buffer an upload: a render request meets a full queue with 429 before its
+body is read, and a body over LIP2SYNC_MAX_UPLOAD_MB gets 413 as soon as
+it crosses the limit, whether or not it declared a Content-Length.
+
+Admitted jobs wait for one of the node's render slots, so only that many
+renders hold memory at once. The scheduler (app/utils/scheduler.py) decides
+which waiting job gets the next free slot.
+
+Configuration (environment, per API process):
+  LIP2SYNC_RENDER_SLOTS         concurrent renders (default 1)
+  LIP2SYNC_ADMISSION_BUDGET_S   outstanding estimated render seconds (default 900)
+  LIP2SYNC_MAX_INPUT_S          longest audio/video accepted (default 600)
+  LIP2SYNC_MAX_PIXELS           largest frame accepted (default 3840x2160)
+  LIP2SYNC_MAX_UPLOAD_MB        largest request body accepted (default 500)
+  LIP2SYNC_MPIX_FRAMES_PER_S    initial render throughput in megapixel-frames/s (default 25)
+  LIP2SYNC_JOB_OVERHEAD_S       fixed per-job cost: model load, ffmpeg steps (default 5)
+"""
+import json
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import wave
+from dataclasses import dataclass, replace
+from typing import Dict, Optional
+
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+
+from app.utils import metrics
+from app.utils.scheduler import DEFAULT_TENANT, RenderScheduler
+
+REFERENCE_SIZE = (1280, 720)
+SINGLE_IMAGE_WIDTH = 640
+DEFAULT_FPS = 25.0
+
+
+class AdmissionError(Exception):
+    status_code = 400
+    reason = "rejected"
+
+    def __init__(self, details: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(details)
+        self.details = details
+        self.headers = headers
+
+    def response(self) -> JSONResponse:
+        return JSONResponse({"status": "error", "details": self.details}, status_code=self.status_code,
+                            headers=self.headers)
+
+
+class InputTooLarge(AdmissionError):
+    status_code = 413
+    reason = "too_large"
+
+
+class UnreadableInput(AdmissionError):
+    status_code = 400
+    reason = "unreadable"
+
+
+class Overloaded(AdmissionError):
+    status_code = 429
+    reason = "overloaded"
+
+    def __init__(self, details: str, retry_after: int):
+        super().__init__(details, headers={"Retry-After": str(retry_after)})
+        self.retry_after = retry_after
+
+
+class UploadTooLarge(HTTPException):
+    """Raised from inside body parsing; FastAPI passes HTTPExceptions through, so the app can answer 413."""
+
+    def __init__(self):
+        super().__init__(status_code=413, detail="upload too large")
+
+
+@dataclass
+class MediaInfo:
+    width: int = 0
+    height: int = 0
+    fps: float = 0.0
+    frames: int = 0
+    duration_s: float = 0.0
+    audio_s: float = 0.0
+
+
+@dataclass
+class JobCost:
+    kind: str
+    output_frames: int
+    width: int
+    height: int
+    audio_s: float
+
+    @property
+    def mpix_frames(self) -> float:
+        return self.output_frames * self.width * self.height / 1e6
+
+
+def _rate(text: Optional[str]) -> float:
+    try:
+        num, _, den = (text or "0/1").partition("/")
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def _wav_info(path: str) -> Optional[MediaInfo]:
+    try:
+        with wave.open(path, "rb") as f:
+            seconds = f.getnframes() / float(f.getframerate())
+    except (wave.Error, EOFError, OSError):
+        return None
+    return MediaInfo(duration_s=seconds, audio_s=seconds)
+
+
+def probe_media(path: str) -> MediaInfo:
+    """Container-level media info from ffprobe; WAV headers only when ffprobe is missing."""
+    if shutil.which("ffprobe") is None:
+        return _wav_info(path) or MediaInfo()
+
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-show_entries", "stream=codec_type,width,height,avg_frame_rate,r_frame_rate,nb_frames,duration"
+                         ":format=duration",
+        "-of", "json", path,
+    ]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise UnreadableInput(f"could not read input: {proc.stderr.strip()[:200] or 'ffprobe failed'}")
+    data = json.loads(proc.stdout or "{}")
+
+    info = MediaInfo(duration_s=float(data.get("format", {}).get("duration") or 0.0))
+    for stream in data.get("streams", []):
+        duration = float(stream.get("duration") or 0.0) or info.duration_s
+        if stream.get("codec_type") == "video" and not info.width:
+            info.width, info.height = int(stream.get("width") or 0), int(stream.get("height") or 0)
+            info.fps = _rate(stream.get("avg_frame_rate")) or _rate(stream.get("r_frame_rate"))
+            info.frames = int(stream.get("nb_frames") or 0) or int(round(duration * info.fps))
+        elif stream.get("codec_type") == "audio":
+            info.audio_s = max(info.audio_s, duration)
+    return info
+
+
+def probe_bytes(data: bytes, suffix: str = "") -> MediaInfo:
+    with tempfile.NamedTemporaryFile(suffix=suffix) as f:
+        f.write(data)
+        f.flush()
+        return probe_media(f.name)
+
+
+def estimate_cost(kind: str, primary: MediaInfo, audio: Optional[MediaInfo] = None) -> JobCost:
+    """Output frames x frame size for a render.
+
+    infer.py emits one frame per mel window (fps of the face input), looping
+    the video over the audio, so the audio length sets the frame count.
+    """
+    audio_s = (audio.audio_s or audio.duration_s) if audio else 0.0
+    if kind == "single_image":
+        # The engine scales the still to 640 px wide and renders it at 25 fps.
+        w, h = primary.width or SINGLE_IMAGE_WIDTH, primary.height or SINGLE_IMAGE_WIDTH
+        width, height, fps = SINGLE_IMAGE_WIDTH, int(round(SINGLE_IMAGE_WIDTH * h / float(w))), DEFAULT_FPS
+    else:
+        width, height = (primary.width, primary.height) if primary.width else REFERENCE_SIZE
+        fps = primary.fps or DEFAULT_FPS
+        audio_s = audio_s or primary.audio_s or primary.duration_s
+    return JobCost(kind=kind, output_frames=int(math.ceil(audio_s * fps)), width=width, height=height,
+                   audio_s=audio_s)
+
+
+class Ticket:
+    """An admitted job: ``async with ticket`` waits for a render slot and returns the budget on exit."""
+
+    def __init__(self, controller: "AdmissionController", cost: JobCost, estimate_s: float, raw_s: float,
+                 tenant: str = DEFAULT_TENANT, priority: int = 0):
+        self.controller = controller
+        self.cost = cost
+        self.estimate_s = estimate_s
+        # Uncalibrated estimate, kept to compare with the measured render time.
+        self.raw_s = raw_s
+        self.tenant = tenant
+        self.priority = priority
+        self._started = None
+
+    async def __aenter__(self):
+        try:
+            await self.controller.scheduler.acquire(self.estimate_s, self.tenant, self.priority)
+        except BaseException:
+            self.controller._release(self)
+            raise
+        self._started = time.perf_counter()
+        return self
+
+    async def __aexit__(self, *exc):
+        try:
+            self.controller.scheduler.release()
+        finally:
+            self.controller._release(self)
+        return False
+
+    def record(self, result: Dict):
+        """Calibrate the controller's estimates with this job's measured render time."""
+        if self._started is not None and result.get("status") == "success":
+            self.controller.observe(self, time.perf_counter() - self._started)
+
+
+class AdmissionController:
+    def __init__(self, slots: int = 1, budget_s: float = 900.0, max_input_s: float = 600.0,
+                 max_pixels: int = 3840 * 2160, max_upload_mb: float = 500.0,
+                 mpix_frames_per_s: float = 25.0, overhead_s: float = 5.0):
+        self.slots = max(1, slots)
+        self.budget_s = budget_s
+        self.max_input_s = max_input_s
+        self.max_pixels = max_pixels
+        self.max_upload_bytes = int(max_upload_mb * 1e6)
+        self.mpix_frames_per_s = mpix_frames_per_s
+        self.overhead_s = overhead_s
+        # Measured / estimated render time, smoothed over finished jobs.
+        self.scale = 1.0
+        self.outstanding_s = 0.0
+        self._lock = threading.Lock()
+        self.scheduler = RenderScheduler.from_env(self.slots)
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        env = os.environ.get
+        return cls(
+            slots=int(env("LIP2SYNC_RENDER_SLOTS", "1")),
+            budget_s=float(env("LIP2SYNC_ADMISSION_BUDGET_S", "900")),
+            max_input_s=float(env("LIP2SYNC_MAX_INPUT_S", "600")),
+            max_pixels=int(env("LIP2SYNC_MAX_PIXELS", str(3840 * 2160))),
+            max_upload_mb=float(env("LIP2SYNC_MAX_UPLOAD_MB", "500")),
+            mpix_frames_per_s=float(env("LIP2SYNC_MPIX_FRAMES_PER_S", "25")),
+            overhead_s=float(env("LIP2SYNC_JOB_OVERHEAD_S", "5")),
+        )
+
+    def upload_too_large(self, content_length: Optional[str]) -> bool:
+        try:
+            return int(content_length or 0) > self.max_upload_bytes
+        except ValueError:
+            return False
+
+    def check_capacity(self):
+        """Raise Overloaded when the outstanding work alone already fills the budget."""
+        with self._lock:
+            if self.outstanding_s >= self.budget_s:
+                retry = self.retry_after(0.0)
+                raise Overloaded(f"render queue is full; retry in {retry} s", retry_after=retry)
+
+    def check_limits(self, cost: JobCost, primary: MediaInfo):
+        longest = max(cost.audio_s, primary.duration_s)
+        if longest > self.max_input_s:
+            raise InputTooLarge(f"input is {longest:.0f} s long; the limit is {self.max_input_s:.0f} s")
+        pixels = primary.width * primary.height
+        if pixels > self.max_pixels:
+            raise InputTooLarge(f"frame size {primary.width}x{primary.height} exceeds {self.max_pixels} pixels")
+
+    def raw_estimate_seconds(self, cost: JobCost) -> float:
+        return self.overhead_s + cost.mpix_frames / self.mpix_frames_per_s
+
+    def estimate_seconds(self, cost: JobCost) -> float:
+        return self.scale * self.raw_estimate_seconds(cost)
+
+    def retry_after(self, estimate_s: float) -> int:
+        """Seconds until enough outstanding work drains for a job of ``estimate_s`` to fit."""
+        excess = self.outstanding_s + estimate_s - self.budget_s
+        return max(1, int(math.ceil(excess / self.slots)))
+
+    def admit(self, cost: JobCost, tenant: str = DEFAULT_TENANT, priority: int = 0) -> Ticket:
+        raw_s = self.raw_estimate_seconds(cost)
+        with self._lock:
+            estimate_s = self.scale * raw_s
+            # An idle node takes any job that passed the size limits, however long.
+            if self.outstanding_s > 0 and self.outstanding_s + estimate_s > self.budget_s:
+                retry = self.retry_after(estimate_s)
+                raise Overloaded(f"render queue is full; retry in {retry} s", retry_after=retry)
+            self.outstanding_s += estimate_s
+            metrics.OUTSTANDING_WORK.set(self.outstanding_s)
+        return Ticket(self, cost, estimate_s, raw_s, tenant, priority)
+
+    def _release(self, ticket: Ticket):
+        with self._lock:
+            self.outstanding_s = max(0.0, self.outstanding_s - ticket.estimate_s)
+            metrics.OUTSTANDING_WORK.set(self.outstanding_s)
+
+    def observe(self, ticket: Ticket, render_s: float, alpha: float = 0.2):
+        if ticket.raw_s > 0:
+            with self._lock:
+                self.scale = (1 - alpha) * self.scale + alpha * (render_s / ticket.raw_s)
+
+
+_controller: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> AdmissionController:
+    """The process-wide controller shared by every render route, configured from the environment."""
+    global _controller
+    if _controller is None:
+        _controller = AdmissionController.from_env()
+    return _controller
+
+
+class UploadGate:
+    """ASGI middleware: reject render uploads on queue budget and size before and while the body is read.
+
+    Requests under ``render_prefixes`` are turned away with 429 before their
+    body is read when the node is already full. Every request body is
+    counted as it arrives and stops at the upload limit with 413, so chunked
+    bodies are limited as well as those with a Content-Length.
+    """
+
+    def __init__(self, app, render_prefixes=()):
+        self.app = app
+        self.render_prefixes = tuple(render_prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT"):
+            await self.app(scope, receive, send)
+            return
+        controller = get_admission_controller()
+        try:
+            if self.render_prefixes and scope["path"].startswith(self.render_prefixes):
+                controller.check_capacity()
+            length = dict(scope["headers"]).get(b"content-length")
+            if controller.upload_too_large(length.decode("latin-1") if length else None):
+                raise InputTooLarge("upload too large")
+        except AdmissionError as e:
+            metrics.ADMISSIONS.labels("any", e.reason).inc()
+            await e.response()(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > controller.max_upload_bytes:
+                    raise UploadTooLarge()
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def upload_too_large_response(request, exc: UploadTooLarge) -> JSONResponse:
+    """Exception handler for UploadTooLarge, in the same shape as the other admission errors."""
+    metrics.ADMISSIONS.labels("any", InputTooLarge.reason).inc()
+    return InputTooLarge(exc.detail).response()
+
+
+def _probe_and_cost(kind: str, primary_bytes: bytes, audio_bytes: Optional[bytes]):
+    primary = probe_bytes(primary_bytes)
+    audio = probe_bytes(audio_bytes) if audio_bytes else None
+    return primary, estimate_cost(kind, primary, audio)
+
+
+async def admit_upload(kind: str, primary_bytes: bytes, audio_bytes: Optional[bytes] = None,
+                       tenant: Optional[str] = None, priority: int = 0, cost_scale: float = 1.0) -> Ticket:
+    """Probe, cost and admit an upload; raises an AdmissionError carrying the HTTP response to send.
+
+    ``cost_scale`` discounts renders that produce fewer or smaller frames than the input, e.g. previews.
+    """
+    controller = get_admission_controller()
+    try:
+        primary, cost = await run_in_threadpool(_probe_and_cost, kind, primary_bytes, audio_bytes)
+        controller.check_limits(cost, primary)
+        if cost_scale != 1.0:
+            cost = replace(cost, output_frames=max(1, int(math.ceil(cost.output_frames * cost_scale))))
+        ticket = controller.admit(cost, tenant or DEFAULT_TENANT, priority)
+    except AdmissionError as e:
+        metrics.ADMISSIONS.labels(kind, e.reason).inc()
+        raise
+    metrics.ADMISSIONS.labels(kind, "admitted").inc()
+    return ticket
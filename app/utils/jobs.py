@@ -0,0 +1,214 @@
+# app/utils/jobs.py
+"""
+Background render jobs with progressive output.
+
+``POST /api/stream/...`` admits the upload and answers 202 with a job id
+straight away. The render then runs in the background with infer.py's
+--stream_dir, so finished batches are encoded into an HLS playlist (or a
+fragmented MP4) in the job's directory as they complete. ``/api/jobs/{id}``
+serves those files while rendering continues. Playback can start once the
+first segment closes, about a second of video after the first Wav2Lip batch,
+instead of after the whole render.
+
+Identical uploads submitted while a job is still running get that job back,
+as with single-flight for the synchronous routes. A finished job and its
+files are kept for LIP2SYNC_JOB_TTL_S seconds (default 3600).
+
+``submit_preview`` starts two linked jobs for one upload. The preview is a
+low-resolution, low-fps proxy that is costed at a fraction of the full render,
+so it is admitted and scheduled ahead of it. The final job waits for the
+preview, then renders at full quality from the preview's artifacts (decoded
+frames, face boxes, mel spectrogram; see models/wav2lip/artifacts.py).
+"""
+import asyncio
+import os
+import shutil
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.utils.singleflight import remove_output
+
+FORMATS = ("hls", "fmp4")
+# Must match models/wav2lip/stream_sink.py, which writes these files.
+ENTRY_FILES = {"hls": "index.m3u8", "fmp4": "stream.mp4"}
+STATUS_FILE = "status.json"
+MEDIA_TYPES = {".m3u8": "application/vnd.apple.mpegurl", ".m4s": "video/iso.segment", ".mp4": "video/mp4"}
+# Preview admission cost relative to the full render: half the frames at a quarter of the pixels.
+PREVIEW_COST_SCALE = 0.125
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    key: str
+    stream_dir: str
+    stream_format: str = "hls"
+    status: str = "queued"  # queued -> running -> success | error
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    result: Optional[Dict] = None
+    after: Optional[str] = None  # id of a job that must finish before this one starts
+    task: Optional["asyncio.Task"] = field(default=None, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.finished is not None
+
+    @property
+    def entry_file(self) -> str:
+        return ENTRY_FILES[self.stream_format]
+
+    def stream_ready(self) -> bool:
+        return os.path.exists(os.path.join(self.stream_dir, self.entry_file))
+
+    def describe(self, base_url: str) -> Dict:
+        """Status document; ``base_url`` is this job's URL, e.g. /api/jobs/<id>."""
+        body = {"job_id": self.id, "kind": self.kind, "status": self.status, "format": self.stream_format,
+                "stream_ready": self.stream_ready(), "stream_url": f"{base_url}/stream/{self.entry_file}",
+                "status_url": base_url}
+        if self.after is not None:
+            body["after"] = self.after
+        if self.started is not None:
+            body["elapsed_s"] = round((self.finished or time.time()) - self.started, 3)
+        if self.status == "success":
+            body["result_url"] = f"{base_url}/result"
+        elif self.status == "error":
+            body["details"] = (self.result or {}).get("details", "unknown")
+        return body
+
+
+class JobRegistry:
+    """In-memory job table for this API process. Event-loop only, not thread-safe."""
+
+    def __init__(self, root: str, ttl_s: float = 3600.0):
+        self.root = root
+        self.ttl_s = ttl_s
+        self.jobs: Dict[str, Job] = {}
+        self._active: Dict[str, str] = {}
+        # Keys whose upload is being admitted; identical submits wait for that job instead of admitting again.
+        self._admitting: Dict[str, "asyncio.Future[Job]"] = {}
+
+    @classmethod
+    def from_env(cls) -> "JobRegistry":
+        workspace = os.environ.get("WORKSPACE", ".")
+        return cls(os.path.join(workspace, "streams"), float(os.environ.get("LIP2SYNC_JOB_TTL_S", "3600")))
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def active(self, key: str) -> Optional[Job]:
+        job_id = self._active.get(key)
+        return self.jobs.get(job_id) if job_id else None
+
+    async def submit(self, kind: str, key: str, stream_format: str, admit: Callable[[], Awaitable[Any]],
+                     render: Callable[[Job, Any], Awaitable[Dict]], after: Optional[Job] = None) -> Job:
+        """Return the running job for ``key``, or admit a new one and start ``render(job, ticket)`` in the background.
+
+        AdmissionErrors from ``admit()`` propagate, so the caller can answer 413/429 before any job exists.
+        An identical submit that arrives during admission waits for it and gets the same job (or error).
+        With ``after``, the new job stays queued until that job has finished, whatever its outcome.
+        """
+        self.sweep()
+        while True:
+            job = self.active(key)
+            if job is not None:
+                return job
+            pending = self._admitting.get(key)
+            if pending is None:
+                break
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # The request that was admitting went away; admit this one instead.
+        pending = asyncio.get_running_loop().create_future()
+        self._admitting[key] = pending
+        try:
+            ticket = await admit()
+            job_id = str(uuid.uuid4())
+            job = Job(job_id, kind, key, os.path.join(self.root, job_id), stream_format,
+                      after=after.id if after is not None else None)
+            os.makedirs(job.stream_dir, exist_ok=True)
+            self.jobs[job_id] = job
+            self._active[key] = job_id
+            job.task = asyncio.ensure_future(self._run(job, render, ticket, after))
+            pending.set_result(job)
+            return job
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                pending.cancel()
+            else:
+                pending.set_exception(e)
+                pending.exception()  # retrieved here, so no "never retrieved" warning without waiters
+            raise
+        finally:
+            del self._admitting[key]
+
+    @staticmethod
+    def artifacts_dir(job: Job) -> str:
+        return os.path.join(job.stream_dir, "artifacts")
+
+    async def submit_preview(self, kind: str, key: str, stream_format: str,
+                             admit: Callable[[bool], Awaitable[Any]],
+                             render: Callable[[Job, Any, bool, str], Awaitable[Dict]]) -> Tuple[Job, Job]:
+        """Start a preview job and a final job that follows it; returns ``(preview, final)``.
+
+        ``admit(preview)`` admits one of the two renders and
+        ``render(job, ticket, preview, artifacts_dir)`` runs it. The preview
+        writes its artifacts to ``artifacts_dir`` and the final render reads
+        them; they are deleted once the final render is done. AdmissionErrors
+        for the final job propagate after the preview has started.
+        """
+        preview = await self.submit(kind, key + "|preview", stream_format, lambda: admit(True),
+                                    lambda job, ticket: render(job, ticket, True, self.artifacts_dir(job)))
+        artifacts = self.artifacts_dir(preview)
+
+        async def render_final(job: Job, ticket: Any) -> Dict:
+            try:
+                return await render(job, ticket, False, artifacts)
+            finally:
+                shutil.rmtree(artifacts, ignore_errors=True)
+
+        final = await self.submit(kind, key, stream_format, lambda: admit(False), render_final, after=preview)
+        return preview, final
+
+    async def _run(self, job: Job, render: Callable[[Job, Any], Awaitable[Dict]], ticket: Any,
+                   after: Optional[Job] = None):
+        if after is not None and after.task is not None:
+            await asyncio.wait([after.task])
+        job.started = time.time()
+        job.status = "running"
+        try:
+            job.result = await render(job, ticket)
+        except Exception as e:
+            job.result = {"status": "error", "details": f"render failed: {e}"}
+        finally:
+            job.status = (job.result or {}).get("status", "error")
+            job.finished = time.time()
+            if self._active.get(job.key) == job.id:
+                del self._active[job.key]
+
+    def sweep(self, now: Optional[float] = None):
+        """Forget jobs that finished more than ttl_s ago and delete their files."""
+        now = time.time() if now is None else now
+        for job in [j for j in self.jobs.values() if j.done and now - j.finished > self.ttl_s]:
+            del self.jobs[job.id]
+            shutil.rmtree(job.stream_dir, ignore_errors=True)
+            if job.result:
+                remove_output(job.result)
+
+
+_registry: Optional[JobRegistry] = None
+
+
+def get_job_registry() -> JobRegistry:
+    """The process-wide registry shared by the stream and job routes."""
+    global _registry
+    if _registry is None:
+        _registry = JobRegistry.from_env()
+    return _registry
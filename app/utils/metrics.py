@@ -0,0 +1,256 @@
+# app/utils/metrics.py
+"""
+Minimal Prometheus metrics for the API, rendered in the text exposition format
+at GET /metrics. There are no extra dependencies. Each update takes one lock
+and a dict lookup, so it is cheap enough to call on every request and stage.
+"""
+import bisect
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values, **kwvalues):
+        if kwvalues:
+            values = tuple(kwvalues[n] for n in self.labelnames)
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _default(self):
+        return self.labels(*())
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._sample_lines(key, child))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        with self.lock:
+            self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def _sample_lines(self, key, child):
+        return [f"{self.name}{_labels(self.labelnames, key)} {_fmt(child.value)}"]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0):
+        self._default().dec(amount)
+
+    def set(self, value: float):
+        self._default().set(value)
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "lock")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def _sample_lines(self, key, child):
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, ('le', _fmt(bound)))} {cumulative}")
+        lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(child.sum)}")
+        lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "lip2sync_http_requests_total", "HTTP requests by route, method and status.", ("route", "method", "status")))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "lip2sync_http_request_duration_seconds", "HTTP request latency by route.", ("route", "method")))
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    "lip2sync_stage_duration_seconds", "Render pipeline stage wall time.", ("engine", "stage")))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "lip2sync_queue_depth", "Render jobs waiting to start."))
+QUEUE_DEPTH.set(0)
+OUTSTANDING_WORK = REGISTRY.register(Gauge(
+    "lip2sync_outstanding_work_seconds", "Estimated render seconds admitted but not finished."))
+ADMISSIONS = REGISTRY.register(Counter(
+    "lip2sync_admissions_total", "Admission decisions by engine and result.", ("engine", "result")))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    "lip2sync_jobs_in_flight", "Render jobs currently running.", ("engine",)))
+JOBS = REGISTRY.register(Counter(
+    "lip2sync_jobs_total", "Finished render jobs by engine and status.", ("engine", "status")))
+FRAMES = REGISTRY.register(Counter(
+    "lip2sync_frames_generated_total", "Output frames generated; rate() gives frames/sec.", ("engine",)))
+RENDER_FPS = REGISTRY.register(Histogram(
+    "lip2sync_render_fps", "Frames generated per second of render wall time, per job.", ("engine",),
+    buckets=(1, 2, 5, 10, 15, 25, 30, 50, 60, 100, 200, 500)))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "lip2sync_cache_requests_total", "Cache lookups by cache and result (hit/miss).", ("cache", "result")))
+COALESCED = REGISTRY.register(Counter(
+    "lip2sync_singleflight_requests_total",
+    "Render requests that started a pipeline or joined an identical one in flight.", ("engine", "result")))
+REALTIME_SESSIONS = REGISTRY.register(Gauge(
+    "lip2sync_realtime_sessions", "Open real-time WebSocket sessions."))
+REALTIME_SESSIONS.set(0)
+REALTIME_LATENCY = REGISTRY.register(Histogram(
+    "lip2sync_realtime_stage_seconds", "Real-time session latency per batch and stage; end_to_end per frame.",
+    ("stage",), buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 1, 2, 5)))
+FFMPEG_FAILURES = REGISTRY.register(Counter(
+    "lip2sync_ffmpeg_failures_total", "ffmpeg subprocess failures by pipeline step.", ("step",)))
+
+
+def route_label(scope: Dict) -> str:
+    """Route template for a request scope, e.g. "/api/sync/wav2lip"; "unmatched" for 404s.
+
+    Labelling by template rather than raw path keeps label cardinality bounded.
+    Routers included with a prefix may report the template without it, so the
+    prefix is recovered from the leading segments of the request path.
+    """
+    template = getattr(scope.get("route"), "path", None)
+    if template is None:
+        return "unmatched"
+    parts = scope.get("path", "").split("/")
+    prefix = "/".join(parts[:max(1, len(parts) - template.count("/"))])
+    return prefix + template
+
+
+def record_cache(cache: str, hit: bool, count: int = 1):
+    if count:
+        CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc(count)
+
+
+def record_render(engine: str, result: Dict):
+    """Feed a finished engine result (status + profile) into the job and stage metrics."""
+    JOBS.labels(engine, result.get("status", "unknown")).inc()
+    profile = result.get("profile") or {}
+    for stage, entry in profile.get("stages", {}).items():
+        STAGE_LATENCY.labels(engine, stage).observe(entry.get("wall_s", 0.0))
+    counters = profile.get("counters", {})
+    for step in counters.get("ffmpeg_failures", []):
+        FFMPEG_FAILURES.labels(step).inc()
+    # infer.py counts its lookups of the audio cache, the frame store and reused artifacts.
+    for cache, counts in counters.get("cache_lookups", {}).items():
+        record_cache(cache, True, counts.get("hit", 0))
+        record_cache(cache, False, counts.get("miss", 0))
+    frames = counters.get("frames")
+    if frames and result.get("status") == "success":
+        FRAMES.labels(engine).inc(frames)
+        wall = profile.get("total_wall_s")
+        if wall:
+            RENDER_FPS.labels(engine).observe(frames / wall)
+
+
+class track_in_flight:
+    """Context manager counting a running render in IN_FLIGHT."""
+
+    def __init__(self, engine: str):
+        self.gauge = IN_FLIGHT.labels(engine)
+
+    def __enter__(self):
+        self.gauge.inc()
+        return self
+
+    def __exit__(self, *exc):
+        self.gauge.dec()
+        return False
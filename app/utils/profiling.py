@@ -0,0 +1,121 @@
+# app/utils/profiling.py
+"""
+Per-job stage profile for the API side of a render.
+
+The engine times its own stages (upload save, ffmpeg pre-steps, the infer.py
+subprocess) here and merges in the JSON report infer.py writes with
+--profile_out (decode, face detection, mel, Wav2Lip forward, paste-back,
+encode, mux). The merged report goes into the engine result. Routes can
+return it in the X-Lip2Sync-Profile header.
+
+The API process runs several jobs at once, so its own rusage says nothing
+about one job. A stage's cpu_s is the CPU time of the job's thread plus
+that of the child processes the stage ran: run_child() reaps them with
+wait4, and zygote renders report the rusage the zygote reaped. peak_rss_mb
+is the largest such child. A stage that runs no child reports the API
+process's high-water mark instead, which is shared by every job.
+"""
+import json
+import os
+import resource
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+PROFILE_HEADER = "X-Lip2Sync-Profile"
+
+# Usage of the child processes run by the stage that is open in this thread.
+_active = threading.local()
+
+
+def _process_peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def record_child_usage(cpu_s: float, peak_rss_mb: float):
+    """Charge a finished child process to the stage open in this thread, if any."""
+    usage = getattr(_active, "usage", None)
+    if usage is not None:
+        usage["cpu_s"] += cpu_s
+        usage["peak_rss_mb"] = max(usage["peak_rss_mb"], peak_rss_mb)
+
+
+def run_child(cmd: List[str], check: bool = True, **popen_kwargs) -> int:
+    """subprocess.run(cmd, check=check) that reaps the child with wait4 and records its own rusage."""
+    proc = subprocess.Popen(cmd, **popen_kwargs)
+    try:
+        _, status, usage = os.wait4(proc.pid, 0)
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    record_child_usage(usage.ru_utime + usage.ru_stime, usage.ru_maxrss / 1024.0)
+    if check and proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+    return proc.returncode
+
+
+class JobProfiler:
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.stages: Dict[str, Dict] = {}
+        self.counters: Dict = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        wall0 = time.perf_counter()
+        cpu0 = time.thread_time()
+        outer = getattr(_active, "usage", None)
+        children = _active.usage = {"cpu_s": 0.0, "peak_rss_mb": 0.0}
+        try:
+            yield
+        finally:
+            _active.usage = outer
+            if outer is not None:
+                record_child_usage(children["cpu_s"], children["peak_rss_mb"])
+            self._add(name, {"wall_s": time.perf_counter() - wall0,
+                             "cpu_s": time.thread_time() - cpu0 + children["cpu_s"],
+                             "peak_rss_mb": children["peak_rss_mb"] or _process_peak_rss_mb(), "calls": 1})
+
+    def _add(self, name: str, entry: Dict):
+        current = self.stages.setdefault(name, {"wall_s": 0.0, "cpu_s": 0.0, "peak_rss_mb": 0.0, "calls": 0})
+        current["wall_s"] += entry.get("wall_s", 0.0)
+        current["cpu_s"] += entry.get("cpu_s", 0.0)
+        current["peak_rss_mb"] = max(current["peak_rss_mb"], entry.get("peak_rss_mb", 0.0))
+        current["calls"] += entry.get("calls", 1)
+
+    def merge_file(self, path: str, prefix: str = ""):
+        """Fold a StageProfiler report written by infer.py into this profile; missing files are ignored."""
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path) as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            return
+        for name, entry in report.get("stages", {}).items():
+            self._add(prefix + name, entry)
+        self.counters.update(report.get("counters", {}))
+
+    def report(self) -> Dict:
+        return {
+            "job_id": self.job_id,
+            "total_wall_s": round(time.perf_counter() - self._start, 4),
+            "stages": {
+                name: {k: round(v, 4) if isinstance(v, float) else v for k, v in entry.items()}
+                for name, entry in self.stages.items()
+            },
+            "counters": self.counters,
+        }
+
+
+def profile_header(result: Dict) -> Optional[Dict[str, str]]:
+    """Response headers carrying the compact JSON profile of an engine result, if it has one."""
+    profile = result.get("profile")
+    if not profile:
+        return None
+    return {PROFILE_HEADER: json.dumps(profile, separators=(",", ":"))}
@@ -0,0 +1,194 @@
+# app/utils/resources.py
+"""
+CPU partitioning for several engine workers on one node.
+
+Each worker claims a CpuSlot: a disjoint set of cores (optionally all on one
+NUMA node) plus a thread count. The slot is applied to the worker itself and
+to every subprocess it starts (infer.py, ffmpeg), so PyTorch, OpenCV and
+ffmpeg each size their thread pools to the slot instead of to the machine.
+
+Configuration (environment):
+  LIP2SYNC_CPU_WORKERS   number of workers sharing the node (unset = no pinning)
+  LIP2SYNC_CPU_NUMA      "1" to keep each worker's cores on a single NUMA node
+  LIP2SYNC_CPU_LOCK_DIR  where slot lock files live (default /tmp)
+"""
+import fcntl
+import glob
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+)
+
+
+def parse_cpulist(text: str) -> List[int]:
+    """Parse a kernel cpulist such as "0-3,8,10-11"."""
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        if "-" in part:
+            lo, hi = part.split("-")
+            cpus.extend(range(int(lo), int(hi) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def available_cores() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def numa_nodes() -> Dict[int, List[int]]:
+    """Map NUMA node id -> usable cores. Single node when sysfs is unavailable."""
+    usable = set(available_cores())
+    nodes = {}
+    for path in sorted(glob.glob("/sys/devices/system/node/node[0-9]*/cpulist")):
+        node = int(os.path.basename(os.path.dirname(path))[len("node"):])
+        with open(path) as f:
+            cores = [c for c in parse_cpulist(f.read()) if c in usable]
+        if cores:
+            nodes[node] = cores
+    return nodes or {0: sorted(usable)}
+
+
+@dataclass
+class CpuSlot:
+    index: int
+    cores: List[int]
+    numa_node: Optional[int] = None
+    _lock_fd: Optional[int] = field(default=None, repr=False)
+
+    @property
+    def threads(self) -> int:
+        return max(1, len(self.cores))
+
+    def env(self, base: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """Environment for a subprocess that should stay inside this slot."""
+        env = dict(os.environ if base is None else base)
+        for name in THREAD_ENV_VARS:
+            env[name] = str(self.threads)
+        env["LIP2SYNC_THREADS"] = str(self.threads)
+        return env
+
+    def pin(self):
+        """Restrict the calling process to this slot's cores (usable as preexec_fn)."""
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, self.cores)
+
+    def popen_kwargs(self) -> Dict:
+        """Keyword arguments for subprocess.run/Popen that keep the child in this slot."""
+        return {"env": self.env(), "preexec_fn": self.pin}
+
+    def apply(self):
+        """Pin the current process and size its torch/OpenCV thread pools."""
+        self.pin()
+        for name in THREAD_ENV_VARS:
+            os.environ[name] = str(self.threads)
+        apply_thread_count(self.threads)
+
+
+def apply_thread_count(threads: int):
+    """Set torch intra/inter-op and OpenCV thread counts, if those libraries are installed."""
+    try:
+        import torch
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # Only allowed before the first parallel op; keep whatever is set.
+            pass
+    except ImportError:
+        pass
+    try:
+        import cv2
+        cv2.setNumThreads(threads)
+    except ImportError:
+        pass
+
+
+def plan_cpu_slots(workers: int, cores: Optional[List[int]] = None, numa: bool = False) -> List[CpuSlot]:
+    """Split the node's cores into ``workers`` disjoint, contiguous slots.
+
+    With ``numa=True`` workers are spread round-robin over NUMA nodes and each
+    node's cores are divided among the workers placed on it.
+    """
+    workers = max(1, workers)
+    if numa:
+        nodes = numa_nodes()
+        node_ids = sorted(nodes)
+        placement = {n: [] for n in node_ids}
+        for w in range(workers):
+            placement[node_ids[w % len(node_ids)]].append(w)
+        slots = []
+        for node, members in placement.items():
+            for part, w in zip(_split(nodes[node], len(members)), members):
+                slots.append(CpuSlot(index=w, cores=part, numa_node=node))
+        return sorted(slots, key=lambda s: s.index)
+
+    cores = cores if cores is not None else available_cores()
+    return [CpuSlot(index=w, cores=part) for w, part in enumerate(_split(cores, workers))]
+
+
+def _split(cores: List[int], parts: int) -> List[List[int]]:
+    # More workers than cores: workers share cores round-robin, one thread each.
+    if parts > len(cores):
+        return [[cores[i % len(cores)]] for i in range(parts)]
+    size, extra = divmod(len(cores), parts)
+    out, start = [], 0
+    for i in range(parts):
+        end = start + size + (1 if i < extra else 0)
+        out.append(cores[start:end])
+        start = end
+    return out
+
+
+def claim_cpu_slot(workers: int, numa: bool = False, lock_dir: str = "/tmp") -> CpuSlot:
+    """Claim the first free slot on this node using non-blocking file locks.
+
+    Works for workers started independently (uvicorn --workers, several
+    containers sharing /tmp): the lock is released when the process exits.
+    """
+    slots = plan_cpu_slots(workers, numa=numa)
+    for slot in slots:
+        path = os.path.join(lock_dir, f"lip2sync-cpu-slot-{workers}-{slot.index}.lock")
+        fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            continue
+        slot._lock_fd = fd
+        return slot
+    raise RuntimeError(f"all {workers} CPU slots are taken; raise LIP2SYNC_CPU_WORKERS")
+
+
+_slot: Optional[CpuSlot] = None
+_slot_loaded = False
+
+
+def get_cpu_slot() -> Optional[CpuSlot]:
+    """The slot for this worker process, claimed and applied on first call.
+
+    Returns None when LIP2SYNC_CPU_WORKERS is not set.
+    """
+    global _slot, _slot_loaded
+    if not _slot_loaded:
+        _slot_loaded = True
+        workers = os.environ.get("LIP2SYNC_CPU_WORKERS")
+        if workers:
+            _slot = claim_cpu_slot(
+                int(workers),
+                numa=os.environ.get("LIP2SYNC_CPU_NUMA") == "1",
+                lock_dir=os.environ.get("LIP2SYNC_CPU_LOCK_DIR", "/tmp"),
+            )
+            _slot.apply()
+    return _slot
@@ -0,0 +1,169 @@
+# app/utils/scheduler.py
+"""
+Render queue ordering: shortest-job-first with aging, weighted fair sharing
+across tenants and a per-request priority.
+
+When a render slot frees, the waiting job with the lowest score starts:
+
+    score = tenant_vtime + cost_s / weight      (virtual finish time)
+            - aging_rate * waited_s             (long jobs cannot starve)
+            - priority * priority_step_s        (explicit priority)
+
+``cost_s`` is the admission estimate, so short jobs go first. Each tenant's
+virtual time advances by cost/weight whenever one of its jobs starts. A
+tenant that has used a lot of the node waits behind tenants that have used
+less, and a tenant with weight 2 gets about twice the render time of one with
+weight 1. Tenants returning from idle start at the current virtual clock, so
+they cannot bank credit while away.
+
+Configuration (environment):
+  LIP2SYNC_SCHEDULER          "fair" (default) or "fifo"
+  LIP2SYNC_AGING_RATE         score seconds forgiven per second waited (default 0.25)
+  LIP2SYNC_PRIORITY_STEP_S    score seconds per priority level (default 60)
+  LIP2SYNC_TENANT_WEIGHTS     "keyA=2,keyB=0.5"; unlisted tenants weigh 1
+"""
+import asyncio
+import itertools
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from app.utils import metrics
+
+MODES = ("fair", "fifo")
+DEFAULT_TENANT = "anonymous"
+
+
+@dataclass
+class QueuedJob:
+    cost_s: float
+    tenant: str = DEFAULT_TENANT
+    priority: int = 0
+    enqueued_at: float = 0.0
+    seq: int = 0
+    payload: object = field(default=None, repr=False)
+
+
+def parse_weights(text: Optional[str]) -> Dict[str, float]:
+    weights = {}
+    for part in (text or "").split(","):
+        key, sep, value = part.strip().rpartition("=")
+        if sep and key:
+            weights[key] = float(value)
+    return weights
+
+
+class FairQueue:
+    """The ordering policy on its own, with an explicit clock, so it can be simulated."""
+
+    def __init__(self, mode: str = "fair", aging_rate: float = 0.25, priority_step_s: float = 60.0,
+                 weights: Optional[Dict[str, float]] = None):
+        if mode not in MODES:
+            raise ValueError(f"unknown scheduler mode {mode!r}; expected one of {MODES}")
+        self.mode = mode
+        self.aging_rate = aging_rate
+        self.priority_step_s = priority_step_s
+        self.weights = weights or {}
+        self.vtime: Dict[str, float] = {}
+        self.waiting: List[QueuedJob] = []
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self.waiting)
+
+    def weight(self, tenant: str) -> float:
+        return max(1e-6, self.weights.get(tenant, 1.0))
+
+    def _clock(self) -> float:
+        """Virtual clock: the least-served tenant that has work waiting."""
+        backlogged = {j.tenant for j in self.waiting}
+        return min((self.vtime.get(t, 0.0) for t in backlogged), default=0.0)
+
+    def push(self, job: QueuedJob, now: float) -> QueuedJob:
+        job.enqueued_at = now
+        job.seq = next(self._seq)
+        if not any(j.tenant == job.tenant for j in self.waiting):
+            # Back from idle: no credit for the time away.
+            clock = self._clock() if self.waiting else max(self.vtime.values(), default=0.0)
+            self.vtime[job.tenant] = max(self.vtime.get(job.tenant, 0.0), clock)
+        self.waiting.append(job)
+        return job
+
+    def score(self, job: QueuedJob, now: float) -> float:
+        finish = self.vtime.get(job.tenant, 0.0) + job.cost_s / self.weight(job.tenant)
+        return finish - self.aging_rate * (now - job.enqueued_at) - job.priority * self.priority_step_s
+
+    def pop(self, now: float) -> Optional[QueuedJob]:
+        if not self.waiting:
+            return None
+        if self.mode == "fifo":
+            job = self.waiting[0]
+        else:
+            job = min(self.waiting, key=lambda j: (self.score(j, now), j.seq))
+        self.waiting.remove(job)
+        self.vtime[job.tenant] = self.vtime.get(job.tenant, 0.0) + job.cost_s / self.weight(job.tenant)
+        return job
+
+    def refund(self, job: QueuedJob):
+        """Undo the virtual time ``pop`` charged for a job that did not start after all."""
+        self.vtime[job.tenant] = self.vtime.get(job.tenant, 0.0) - job.cost_s / self.weight(job.tenant)
+
+    def remove(self, job: QueuedJob) -> bool:
+        try:
+            self.waiting.remove(job)
+            return True
+        except ValueError:
+            return False
+
+
+class RenderScheduler:
+    """``slots`` concurrent renders; waiting jobs start in FairQueue order. Event-loop only, not thread-safe."""
+
+    def __init__(self, slots: int = 1, queue: Optional[FairQueue] = None):
+        self.slots = max(1, slots)
+        self.running = 0
+        self.queue = queue or FairQueue()
+
+    @classmethod
+    def from_env(cls, slots: int) -> "RenderScheduler":
+        env = os.environ.get
+        return cls(slots, FairQueue(
+            mode=env("LIP2SYNC_SCHEDULER", "fair"),
+            aging_rate=float(env("LIP2SYNC_AGING_RATE", "0.25")),
+            priority_step_s=float(env("LIP2SYNC_PRIORITY_STEP_S", "60")),
+            weights=parse_weights(env("LIP2SYNC_TENANT_WEIGHTS")),
+        ))
+
+    async def acquire(self, cost_s: float, tenant: str = DEFAULT_TENANT, priority: int = 0):
+        """Wait until this job may start. Jobs only skip the queue when nothing is waiting."""
+        if self.running < self.slots and not self.queue:
+            self.running += 1
+            return
+        job = self.queue.push(QueuedJob(cost_s, tenant, priority,
+                                        payload=asyncio.get_running_loop().create_future()), time.monotonic())
+        metrics.QUEUE_DEPTH.set(len(self.queue))
+        try:
+            await job.payload
+        except asyncio.CancelledError:
+            # Client went away while queued. If release() had already handed it the slot, pass the
+            # slot on; a future cancelled before release() got to it was skipped there.
+            if not self.queue.remove(job) and not job.payload.cancelled():
+                self.release()
+            metrics.QUEUE_DEPTH.set(len(self.queue))
+            raise
+
+    def release(self):
+        while True:
+            job = self.queue.pop(time.monotonic())
+            if job is None:
+                self.running -= 1
+                break
+            # A cancelled waiter's cleanup runs a loop iteration after its future is cancelled.
+            if job.payload.done():
+                self.queue.refund(job)
+                continue
+            # The slot passes straight to the next job; running stays the same.
+            job.payload.set_result(None)
+            break
+        metrics.QUEUE_DEPTH.set(len(self.queue))
@@ -0,0 +1,90 @@
+# app/utils/singleflight.py
+"""
+Single-flight coalescing of identical in-flight render requests.
+
+A retry or double-submit that arrives while the first render is still
+running attaches to it instead of starting a second infer.py pipeline. The
+render runs as its own task, so it finishes for the remaining callers even
+if the caller that started it disconnects. The shared output file is
+cleaned up only after the last caller has released it.
+"""
+import asyncio
+import hashlib
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.utils import metrics
+
+
+def request_key(kind: str, *blobs: Optional[bytes], **params) -> str:
+    """Identity of a render: engine, a hash of every input and the parameters that change the output."""
+    h = hashlib.sha256(kind.encode())
+    for blob in blobs:
+        h.update(b"\0" if blob is None else hashlib.sha256(blob).digest())
+    for name in sorted(params):
+        h.update(f"\0{name}={params[name]!r}".encode())
+    return h.hexdigest()
+
+
+def remove_output(result: Dict):
+    """Cleanup for engine results: delete the per-job output file, if the render produced one."""
+    path = result.get("output_path") if isinstance(result, dict) else None
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+class _Flight:
+    def __init__(self, task: "asyncio.Task", cleanup: Optional[Callable[[Any], None]]):
+        self.task = task
+        self.cleanup = cleanup
+        self.refs = 0
+        self.cleaned = False
+
+    def release(self):
+        self.refs -= 1
+        self._maybe_cleanup()
+
+    def _maybe_cleanup(self):
+        if self.refs > 0 or not self.task.done() or self.cleaned:
+            return
+        self.cleaned = True
+        if self.cleanup and not self.task.cancelled() and self.task.exception() is None:
+            self.cleanup(self.task.result())
+
+
+class SingleFlight:
+    """Run ``fn`` once per key among concurrent callers. Event-loop only, not thread-safe."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[str, _Flight] = {}
+
+    def __len__(self):
+        return len(self._flights)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]],
+                 cleanup: Optional[Callable[[Any], None]] = None) -> Tuple[Any, Callable[[], None]]:
+        """Return ``(result, release)``. Call ``release()`` once the result (e.g. its file) is no longer needed.
+
+        ``cleanup(result)`` runs after the render finished and every caller released it.
+        Exceptions from ``fn`` reach every caller.
+        """
+        flight = self._flights.get(key)
+        metrics.COALESCED.labels(self.name, "joined" if flight else "started").inc()
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(fn()), cleanup)
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _, k=key, f=flight: self._finished(k, f))
+        flight.refs += 1
+        try:
+            result = await asyncio.shield(flight.task)
+        except BaseException:
+            flight.release()
+            raise
+        return result, flight.release
+
+    def _finished(self, key: str, flight: _Flight):
+        # Later identical requests start a new render (results are not cached here).
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        flight._maybe_cleanup()
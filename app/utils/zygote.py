@@ -0,0 +1,82 @@
+# app/utils/zygote.py
+"""
+Client of the infer.py fork-server (models/wav2lip/zygote.py).
+
+When LIP2SYNC_ZYGOTE names the zygote's unix socket, run_infer() asks the
+zygote to fork a warm child for the render, so the render skips the imports
+and weight loading of a fresh `python3 infer.py`. It is still isolated in
+its own process. The child gets this process's working directory, the
+slot's environment and cores, and this process's stdout/stderr. Without
+the variable, or when the zygote cannot be reached, the command runs as a
+plain subprocess. Either way the render's own CPU time and peak RSS are
+charged to the open JobProfiler stage.
+"""
+import json
+import os
+import socket
+import subprocess
+import sys
+from typing import List, Optional
+
+from app.utils.profiling import record_child_usage, run_child
+from app.utils.resources import CpuSlot
+
+
+def socket_path() -> Optional[str]:
+    return os.environ.get("LIP2SYNC_ZYGOTE") or None
+
+
+def _read_message(conn: socket.socket, buffer: bytearray) -> dict:
+    while b"\n" not in buffer:
+        chunk = conn.recv(4096)
+        if not chunk:
+            raise ConnectionError("zygote closed the connection")
+        buffer += chunk
+    line, _, rest = bytes(buffer).partition(b"\n")
+    buffer[:] = rest
+    return json.loads(line)
+
+
+def run_via_zygote(path: str, command: List[str], cpu_slot: Optional[CpuSlot] = None,
+                   stdout: Optional[int] = None, stderr: Optional[int] = None) -> int:
+    """Run ``python3 <script> <args...>`` (``command``) in a child of the zygote at ``path``; its exit code.
+
+    ``stdout``/``stderr`` are file descriptors for the child (default: this process's).
+    """
+    request = {
+        "script": command[1],
+        "argv": command[2:],
+        "cwd": os.getcwd(),
+        "env": cpu_slot.env() if cpu_slot else dict(os.environ),
+        "cores": cpu_slot.cores if cpu_slot else None,
+    }
+    sys.stdout.flush()
+    sys.stderr.flush()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(path)
+        fds = [sys.stdout.fileno() if stdout is None else stdout, sys.stderr.fileno() if stderr is None else stderr]
+        socket.send_fds(conn, [(json.dumps(request) + "\n").encode()], fds)
+        buffer = bytearray()
+        _read_message(conn, buffer)  # {"pid": ...}
+        # The render has started; losing the zygote now must not start it a second time.
+        try:
+            result = _read_message(conn, buffer)
+        except (OSError, ValueError):
+            return -1
+        record_child_usage(result.get("cpu_s", 0.0), result.get("peak_rss_mb", 0.0))
+        return result["returncode"]
+
+
+def run_infer(command: List[str], cpu_slot: Optional[CpuSlot] = None):
+    """subprocess.run(command, check=True) inside ``cpu_slot``, forked from the zygote when one is configured."""
+    path = socket_path()
+    if path:
+        try:
+            returncode = run_via_zygote(path, command, cpu_slot)
+        except (OSError, ValueError) as e:
+            print(f"zygote at {path} unavailable ({e}); starting infer.py directly", file=sys.stderr)
+        else:
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, command)
+            return
+    run_child(command, **(cpu_slot.popen_kwargs() if cpu_slot else {}))
@@ -0,0 +1,83 @@
+"""Aggregate Wav2Lip frames/sec as CPU workers are added, with and without CpuSlot pinning.
+
+Each worker runs the Wav2Lip forward pass (random weights) plus a paste-back
+resize in a loop for a fixed time. "default" leaves every library at its own
+thread count, "managed" gives each worker a disjoint core slot.
+
+    python benchmarks/bench_cpu_workers.py --max_workers 8 --seconds 10
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def worker(index, workers, mode, seconds, batch_size, barrier, results):
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.join(ROOT, 'models', 'wav2lip_src'))
+    if mode == 'managed':
+        from app.utils.resources import plan_cpu_slots
+        plan_cpu_slots(workers)[index].apply()
+
+    import cv2
+    import numpy as np
+    import torch
+    from models import Wav2Lip
+
+    model = Wav2Lip().eval()
+    mel = torch.randn(batch_size, 1, 80, 16)
+    img = torch.rand(batch_size, 6, 96, 96)
+    frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+
+    with torch.no_grad():
+        model(mel, img)
+        barrier.wait()
+        frames, start = 0, time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            pred = model(mel, img).numpy().transpose(0, 2, 3, 1) * 255.
+            for p in pred:
+                frame[200:456, 500:756] = cv2.resize(p.astype(np.uint8), (256, 256))
+            frames += batch_size
+    results.put(frames / (time.perf_counter() - start))
+
+
+def run(workers, mode, seconds, batch_size):
+    ctx = mp.get_context('spawn')
+    barrier, results = ctx.Barrier(workers), ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(i, workers, mode, seconds, batch_size, barrier, results))
+             for i in range(workers)]
+    for p in procs:
+        p.start()
+    rates = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return sum(rates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--max_workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seconds', type=float, default=10.)
+    parser.add_argument('--batch_size', type=int, default=16)
+    parser.add_argument('--modes', nargs='+', default=['default', 'managed'])
+    parser.add_argument('--json', type=str, default=None, help='Write the curve to this file')
+    args = parser.parse_args()
+
+    curve = {mode: {} for mode in args.modes}
+    print('{:>8} '.format('workers') + ' '.join('{:>12}'.format(m) for m in args.modes))
+    for workers in range(1, args.max_workers + 1):
+        for mode in args.modes:
+            curve[mode][workers] = run(workers, mode, args.seconds, args.batch_size)
+        print('{:>8} '.format(workers) + ' '.join('{:>9.1f} fps'.format(curve[m][workers]) for m in args.modes))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(curve, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Batch assembly for the Wav2Lip forward pass: list/float64 path vs preallocated buffers.
+
+    python benchmarks/bench_datagen.py --batch_size 128 --batches 20
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models', 'wav2lip'))
+from batching import Wav2LipBatch  # noqa: E402
+
+IMG_SIZE = 96
+
+
+def legacy_batch(faces, mels):
+    img_batch, mel_batch = np.asarray(faces), np.asarray(mels)
+
+    img_masked = img_batch.copy()
+    img_masked[:, IMG_SIZE // 2:] = 0
+
+    img_batch = np.concatenate((img_masked, img_batch), axis=3) / 255.
+    mel_batch = np.reshape(mel_batch, [len(mel_batch), mel_batch.shape[1], mel_batch.shape[2], 1])
+
+    img_batch = torch.FloatTensor(np.transpose(img_batch, (0, 3, 1, 2)))
+    mel_batch = torch.FloatTensor(np.transpose(mel_batch, (0, 3, 1, 2)))
+    return img_batch, mel_batch
+
+
+def buffered_batch(batch, faces, mels):
+    batch.reset()
+    for face, mel in zip(faces, mels):
+        batch.add(face, mel)
+    img_batch, mel_batch = batch.prepare()
+    return torch.from_numpy(img_batch), torch.from_numpy(mel_batch)
+
+
+def timeit(fn, batches):
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(batches):
+        fn()
+    return (time.perf_counter() - t0) / batches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch_size', type=int, default=128)
+    parser.add_argument('--batches', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    faces = [rng.integers(0, 256, (IMG_SIZE, IMG_SIZE, 3), dtype=np.uint8) for _ in range(args.batch_size)]
+    mels = [rng.standard_normal((80, 16)) for _ in range(args.batch_size)]
+
+    ref_img, ref_mel = legacy_batch(faces, mels)
+    batch = Wav2LipBatch(args.batch_size, IMG_SIZE)
+    img, mel = buffered_batch(batch, faces, mels)
+    assert torch.allclose(ref_img, img) and torch.allclose(ref_mel, mel)
+
+    legacy = timeit(lambda: legacy_batch(faces, mels), args.batches)
+    buffered = timeit(lambda: buffered_batch(batch, faces, mels), args.batches)
+
+    print('batch_size={}'.format(args.batch_size))
+    print('legacy   {:8.2f} ms/batch'.format(legacy * 1e3))
+    print('buffered {:8.2f} ms/batch  ({:.1f}x)'.format(buffered * 1e3, legacy / buffered))
+
+
+if __name__ == '__main__':
+    main()
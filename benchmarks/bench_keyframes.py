@@ -0,0 +1,104 @@
+"""Speed vs lip-sync quality of infer.py --keyframe_interval.
+
+Renders the same face + audio once per interval and reads the per-stage
+times from infer.py's --profile_out report. With --syncnet_dir, each output
+is also scored with the LSE-D / LSE-C metrics of
+models/wav2lip_src/evaluation (a syncnet_python checkout with the
+scores_LSE scripts copied in, as described in evaluation/README.md).
+Lower LSE-D and higher LSE-C mean better sync. --syncnet_python selects
+the interpreter of SyncNet's separate environment.
+
+    python benchmarks/bench_keyframes.py --checkpoint models/wav2lip/checkpoints/wav2lip.pth \\
+        --face face.mp4 --audio speech.wav --intervals 1 2 3 4 --syncnet_dir ~/syncnet_python
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+INFER = os.path.join(ROOT, 'models', 'wav2lip', 'infer.py')
+# audio.py, hparams.py and models/ only exist in wav2lip_src
+SRC_DIR = os.path.join(ROOT, 'models', 'wav2lip_src')
+
+
+def render(args, interval, outdir):
+    outfile = os.path.join(outdir, 'k{}.mp4'.format(interval))
+    profile = os.path.join(outdir, 'k{}_profile.json'.format(interval))
+    command = [sys.executable, INFER, '--checkpoint_path', args.checkpoint, '--face', args.face,
+               '--audio', args.audio, '--outfile', outfile, '--profile_out', profile,
+               '--wav2lip_batch_size', str(args.batch_size), '--keyframe_interval', str(interval)]
+    command += args.infer_args
+    start = time.perf_counter()
+    # infer.py writes temp/ relative to its working directory
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [SRC_DIR, os.environ.get('PYTHONPATH')])))
+    subprocess.run(command, check=True, cwd=outdir, env=env, stdout=subprocess.DEVNULL)
+    wall = time.perf_counter() - start
+    with open(profile) as f:
+        report = json.load(f)
+    frames = report['counters']['frames']
+    forward = report['stages']['wav2lip_forward']['wall_s']
+    return outfile, {'wall_s': round(wall, 3), 'forward_s': round(forward, 3),
+                     'frames': frames, 'fps': round(frames / wall, 2)}
+
+
+def lse_scores(args, video, reference):
+    """(LSE-D, LSE-C) averaged over the face tracks SyncNet finds in ``video``."""
+    data_dir = os.path.join(args.out, 'syncnet_tmp')
+    common = ['--videofile', os.path.abspath(video), '--reference', reference, '--data_dir', data_dir]
+    subprocess.run([args.syncnet_python, 'run_pipeline.py'] + common, check=True, cwd=args.syncnet_dir,
+                   stdout=subprocess.DEVNULL)
+    out = subprocess.run([args.syncnet_python, 'calculate_scores_real_videos.py'] + common, check=True,
+                         cwd=args.syncnet_dir, stdout=subprocess.PIPE, text=True).stdout
+    dists, confs = [], []
+    for line in out.splitlines():
+        parts = line.split()
+        try:
+            dist, conf = float(parts[0]), float(parts[1])
+        except (IndexError, ValueError):
+            continue
+        dists.append(dist)
+        confs.append(conf)
+    if not dists:
+        return None, None
+    return round(statistics.mean(dists), 3), round(statistics.mean(confs), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--checkpoint', required=True)
+    parser.add_argument('--face', required=True)
+    parser.add_argument('--audio', required=True)
+    parser.add_argument('--intervals', nargs='+', type=int, default=[1, 2, 3, 4])
+    parser.add_argument('--batch_size', type=int, default=32)
+    parser.add_argument('--out', type=str, default='bench_keyframes')
+    parser.add_argument('--syncnet_dir', type=str, default=None, help='syncnet_python checkout; skip LSE if unset')
+    parser.add_argument('--syncnet_python', type=str, default=sys.executable)
+    parser.add_argument('--json', type=str, default=None, help='Write the results to this file')
+    parser.add_argument('infer_args', nargs=argparse.REMAINDER, help='Extra infer.py arguments after --')
+    args = parser.parse_args()
+    args.out = os.path.abspath(args.out)
+    args.checkpoint, args.face, args.audio = (os.path.abspath(p) for p in (args.checkpoint, args.face, args.audio))
+    args.infer_args = [a for a in args.infer_args if a != '--']
+    os.makedirs(args.out, exist_ok=True)
+
+    results = {}
+    print('{:>8} {:>10} {:>10} {:>10} {:>8} {:>8}'.format('interval', 'wall_s', 'forward_s', 'fps', 'LSE-D', 'LSE-C'))
+    for interval in args.intervals:
+        video, row = render(args, interval, args.out)
+        if args.syncnet_dir:
+            row['lse_d'], row['lse_c'] = lse_scores(args, video, 'k{}'.format(interval))
+        results[interval] = row
+        print('{:>8} {:>10} {:>10} {:>10} {:>8} {:>8}'.format(interval, row['wall_s'], row['forward_s'], row['fps'],
+                                                         row.get('lse_d', '-'), row.get('lse_c', '-')))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Start-to-first-frame latency of infer.py: fresh interpreter vs a child forked from models/wav2lip/zygote.py.
+
+Each run renders the same face + audio and reports, from the moment the
+render is requested:
+
+    first_frame_s   until the first output frame is written (infer.py's
+                    first_frame_at in its --profile_out report)
+    wall_s          until the process has exited
+
+"cold" runs ``python infer.py`` as the engines do without a zygote; "zygote"
+asks a zygote (started here, with the same checkpoints) to fork the render.
+
+    python benchmarks/bench_zygote.py --checkpoint models/wav2lip/checkpoints/wav2lip.pth \\
+        --face face.mp4 --audio speech.wav --runs 5 -- --box 0 200 0 300
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+PIPELINE_DIR = os.path.join(ROOT, 'models', 'wav2lip')
+INFER = os.path.join(PIPELINE_DIR, 'infer.py')
+# audio.py, hparams.py and models/ only exist in wav2lip_src
+SRC_DIR = os.path.join(ROOT, 'models', 'wav2lip_src')
+
+sys.path.append(ROOT)
+
+from app.utils.zygote import run_via_zygote  # noqa: E402
+
+
+def infer_command(args, profile):
+    command = [sys.executable, INFER, '--checkpoint_path', args.checkpoint, '--face', args.face,
+               '--audio', args.audio, '--outfile', os.path.join(args.out, 'result.mp4'), '--profile_out', profile]
+    if args.detector:
+        command += ['--detector_path', args.detector]
+    return command + args.infer_args
+
+
+def timed(run, args, profile):
+    if os.path.exists(profile):
+        os.remove(profile)
+    start = time.time()
+    returncode = run()
+    wall = time.time() - start
+    if returncode != 0:
+        raise RuntimeError('render failed with exit code {}'.format(returncode))
+    with open(profile) as f:
+        report = json.load(f)
+    return {'first_frame_s': report['counters']['first_frame_at'] - start, 'wall_s': wall}
+
+
+def start_zygote(args, env, socket_path):
+    command = [sys.executable, os.path.join(PIPELINE_DIR, 'zygote.py'), '--socket', socket_path,
+               '--checkpoint_path', args.checkpoint]
+    if args.detector:
+        command += ['--detector_path', args.detector]
+    proc = subprocess.Popen(command, env=env, cwd=args.out, stdout=subprocess.PIPE, text=True)
+    start = time.time()
+    line = proc.stdout.readline()  # "Zygote <pid> ready on <socket>"
+    if 'ready' not in line:
+        proc.kill()
+        raise RuntimeError('zygote did not start')
+    return proc, time.time() - start
+
+
+def summary(rows):
+    return {key: round(statistics.median(row[key] for row in rows), 3) for key in rows[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--checkpoint', required=True)
+    parser.add_argument('--detector', default=None, help='S3FD weights (preloaded by the zygote)')
+    parser.add_argument('--face', required=True)
+    parser.add_argument('--audio', required=True)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--out', type=str, default='bench_zygote')
+    parser.add_argument('--json', type=str, default=None, help='Write the results to this file')
+    parser.add_argument('infer_args', nargs=argparse.REMAINDER, help='Extra infer.py arguments after --')
+    args = parser.parse_args()
+    args.out = os.path.abspath(args.out)
+    args.checkpoint, args.face, args.audio = (os.path.abspath(p) for p in (args.checkpoint, args.face, args.audio))
+    args.detector = args.detector and os.path.abspath(args.detector)
+    args.infer_args = [a for a in args.infer_args if a != '--']
+    os.makedirs(os.path.join(args.out, 'temp'), exist_ok=True)
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [SRC_DIR, os.environ.get('PYTHONPATH')])))
+    profile = os.path.join(args.out, 'profile.json')
+    command = infer_command(args, profile)
+    # infer.py writes temp/ relative to its working directory
+    os.chdir(args.out)
+
+    cold = [timed(lambda: subprocess.call(command, env=env, stdout=subprocess.DEVNULL), args, profile)
+            for _ in range(args.runs)]
+
+    socket_dir = tempfile.mkdtemp(prefix='lip2sync_zygote_')
+    socket_path = os.path.join(socket_dir, 'zygote.sock')
+    zygote, startup = start_zygote(args, env, socket_path)
+    try:
+        os.environ.update(env)
+        with open(os.devnull, 'w') as devnull:
+            warm = [timed(lambda: run_via_zygote(socket_path, command, stdout=devnull.fileno()), args, profile)
+                    for _ in range(args.runs)]
+    finally:
+        zygote.terminate()
+        zygote.wait()
+        shutil.rmtree(socket_dir, ignore_errors=True)
+
+    results = {'cold': summary(cold), 'zygote': summary(warm), 'zygote_startup_s': round(startup, 3)}
+    print('{:>8} {:>14} {:>10}'.format('', 'first_frame_s', 'wall_s'))
+    for name in ('cold', 'zygote'):
+        print('{:>8} {:>14} {:>10}'.format(name, results[name]['first_frame_s'], results[name]['wall_s']))
+    print('zygote startup (imports + weights, paid once): {} s'.format(results['zygote_startup_s']))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
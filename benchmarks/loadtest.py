@@ -0,0 +1,311 @@
+"""Load generator for /api/sync/wav2lip and /api/sync/single_image: concurrent multipart uploads, latency percentiles.
+
+Closed loop by default (``--concurrency`` clients, each sending its next
+request when the previous one returns); ``--rate`` switches to an open loop
+with Poisson arrivals. Uploads are synthetic clips from ``synthetic.py``.
+
+``--start_server`` launches uvicorn on a free port in a scratch workspace.
+With ``--stub`` that server uses the stub engine (LIP2SYNC_ENGINE=stub), which
+blocks for ``--stub_overhead + --stub_rtf * <audio seconds>`` instead of
+rendering, so the HTTP, upload and queueing layers are measured on their own.
+
+    python benchmarks/loadtest.py --start_server --stub --concurrency 8 --requests 200
+    python benchmarks/loadtest.py --url http://gpu-node:8000 --endpoint wav2lip --rate 0.5 --duration 600
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic  # noqa: E402
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+ENDPOINTS = {
+    'wav2lip': ('/api/sync/wav2lip', (('video', 'video.mp4', 'video/mp4'), ('audio', 'audio.wav', 'audio/wav'))),
+    'single_image': ('/api/sync/single_image', (('image', 'image.png', 'image/png'), ('audio', 'audio.wav', 'audio/wav'))),
+}
+
+
+def multipart_body(fields):
+    """Encode ``[(name, filename, content_type, data)]`` as multipart/form-data; returns (body, content_type)."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, filename, content_type, data in fields:
+        parts.append('--{}\r\nContent-Disposition: form-data; name="{}"; filename="{}"\r\n'
+                     'Content-Type: {}\r\n\r\n'.format(boundary, name, filename, content_type).encode())
+        parts.append(data)
+        parts.append(b'\r\n')
+    parts.append('--{}--\r\n'.format(boundary).encode())
+    return b''.join(parts), 'multipart/form-data; boundary={}'.format(boundary)
+
+
+class Payloads:
+    """Pre-encoded request bodies per endpoint, so the generator spends no time encoding.
+
+    ``body(endpoint, n)`` stamps ``n`` into the last audio samples, making every
+    request a distinct render; the server coalesces byte-identical uploads.
+    """
+
+    def __init__(self, seconds, height, workdir):
+        paths, _, _ = synthetic.make_inputs(os.path.join(workdir, 'inputs'), seconds, height)
+        files = {}
+        for key, path in paths.items():
+            with open(path, 'rb') as f:
+                files[os.path.basename(path)] = f.read()
+        self.bodies = {}
+        for endpoint, (path, fields) in ENDPOINTS.items():
+            body, content_type = multipart_body(
+                [(name, filename, ctype, files[filename]) for name, filename, ctype in fields])
+            # audio.wav is the last part: its samples end just before the closing boundary.
+            audio_end = body.rindex(b'\r\n--' + content_type.split('=')[1].encode())
+            self.bodies[endpoint] = (path, body, content_type, audio_end)
+
+    def body(self, endpoint, n=None):
+        path, body, content_type, audio_end = self.bodies[endpoint]
+        if n is not None:
+            body = bytearray(body)
+            body[audio_end - 8:audio_end] = struct.pack('<q', n)
+            body = bytes(body)
+        return path, body, content_type
+
+
+def send(base_url, path, body, content_type, timeout):
+    """One upload on a fresh connection; returns (status, seconds, response bytes). Status 0 = transport error."""
+    url = urllib.parse.urlsplit(base_url)
+    conn_cls = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+    start = time.perf_counter()
+    try:
+        conn = conn_cls(url.hostname, url.port, timeout=timeout)
+        try:
+            conn.request('POST', url.path.rstrip('/') + path, body=body,
+                         headers={'Content-Type': content_type, 'Content-Length': str(len(body))})
+            resp = conn.getresponse()
+            size = len(resp.read())
+            return resp.status, time.perf_counter() - start, size
+        finally:
+            conn.close()
+    except (OSError, http.client.HTTPException):
+        return 0, time.perf_counter() - start, 0
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(math.ceil(q / 100. * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = []
+
+    def add(self, endpoint, status, seconds, size):
+        with self.lock:
+            self.samples.append((endpoint, status, seconds, size))
+
+    def summary(self, wall_s, upload_bytes):
+        def stats(samples):
+            ok = sorted(s for _, status, s, _ in samples if 200 <= status < 300)
+            codes = {}
+            for _, status, _, _ in samples:
+                codes[str(status)] = codes.get(str(status), 0) + 1
+            total = len(samples)
+            return {
+                'requests': total,
+                'ok': len(ok),
+                'error_rate': round(1 - len(ok) / float(total), 4) if total else None,
+                'status_codes': codes,
+                'throughput_rps': round(len(ok) / wall_s, 3) if wall_s else None,
+                'latency_s': {
+                    'p50': percentile(ok, 50), 'p95': percentile(ok, 95), 'p99': percentile(ok, 99),
+                    'max': ok[-1] if ok else None, 'mean': sum(ok) / len(ok) if ok else None,
+                },
+            }
+
+        report = {'wall_s': round(wall_s, 3), 'upload_mb': round(upload_bytes / 1e6, 2),
+                  'overall': stats(self.samples), 'endpoints': {}}
+        for endpoint in sorted({e for e, _, _, _ in self.samples}):
+            report['endpoints'][endpoint] = stats([s for s in self.samples if s[0] == endpoint])
+        return report
+
+
+def run_load(base_url, payloads, endpoints, concurrency, requests=None, duration=None, rate=None,
+             timeout=600., seed=0, duplicates=0.):
+    """Drive the server and return the summary report. Stops after ``requests`` sends or ``duration`` seconds.
+
+    A ``duplicates`` fraction of requests repeat the previous upload byte for byte, like client retries.
+    """
+    rng = random.Random(seed)
+    recorder = Recorder()
+    sent = [0]
+    uploaded = [0]
+    last = [None]
+    lock = threading.Lock()
+    start = time.perf_counter()
+
+    def next_request():
+        """(endpoint, payload number) for the next send, or None when the run is over."""
+        with lock:
+            if requests is not None and sent[0] >= requests:
+                return None
+            if duration is not None and time.perf_counter() - start >= duration:
+                return None
+            sent[0] += 1
+            if last[0] is None or rng.random() >= duplicates:
+                last[0] = (rng.choice(endpoints), sent[0])
+            return last[0]
+
+    def fire(item):
+        endpoint, n = item
+        path, body, content_type = payloads.body(endpoint, n)
+        status, seconds, size = send(base_url, path, body, content_type, timeout)
+        with lock:
+            uploaded[0] += len(body)
+        recorder.add(endpoint, status, seconds, size)
+
+    if rate:
+        # Open loop: arrivals do not wait for earlier responses; concurrency only caps sockets.
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            while True:
+                item = next_request()
+                if item is None:
+                    break
+                pool.submit(fire, item)
+                time.sleep(rng.expovariate(rate))
+    else:
+        def client():
+            while True:
+                item = next_request()
+                if item is None:
+                    return
+                fire(item)
+
+        threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    return recorder.summary(time.perf_counter() - start, uploaded[0])
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(workspace, stub, stub_rtf, stub_overhead, workers=1):
+    """uvicorn api:app on a free local port, with the scratch workspace as its working directory."""
+    port = _free_port()
+    env = dict(os.environ, WORKSPACE=workspace)
+    if stub:
+        env.update(LIP2SYNC_ENGINE='stub', LIP2SYNC_STUB_RTF=str(stub_rtf), LIP2SYNC_STUB_OVERHEAD_S=str(stub_overhead))
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'api:app', '--app-dir', ROOT, '--host', '127.0.0.1',
+         '--port', str(port), '--workers', str(workers), '--log-level', 'warning'],
+        cwd=workspace, env=env)
+    base_url = 'http://127.0.0.1:{}'.format(port)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError('server exited with status {}'.format(proc.returncode))
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            conn.close()
+            return proc, base_url
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError('server did not start within 60 s')
+
+
+def print_report(report):
+    print('wall {:.1f} s, uploaded {:.1f} MB'.format(report['wall_s'], report['upload_mb']))
+    print('{:<14} {:>8} {:>8} {:>8} {:>9} {:>8} {:>8} {:>8}'.format(
+        'endpoint', 'requests', 'errors', 'err%', 'ok req/s', 'p50 s', 'p95 s', 'p99 s'))
+    rows = list(report['endpoints'].items()) + [('overall', report['overall'])]
+    for name, s in rows:
+        lat = s['latency_s']
+        fmt = lambda v: '{:8.3f}'.format(v) if v is not None else '       -'  # noqa: E731
+        print('{:<14} {:>8} {:>8} {:>7.1f}% {:>9.2f} {} {} {}'.format(
+            name, s['requests'], s['requests'] - s['ok'], 100 * (s['error_rate'] or 0), s['throughput_rps'] or 0,
+            fmt(lat['p50']), fmt(lat['p95']), fmt(lat['p99'])))
+    codes = report['overall']['status_codes']
+    print('status codes: ' + ', '.join('{}={}'.format(k, v) for k, v in sorted(codes.items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--url', type=str, default=None, help='Target server (default: --start_server)')
+    parser.add_argument('--start_server', action='store_true', help='Launch a local uvicorn server for the run')
+    parser.add_argument('--server_workers', type=int, default=1)
+    parser.add_argument('--stub', action='store_true', help='Started server uses the stub engine')
+    parser.add_argument('--stub_rtf', type=float, default=0.5, help='Stub compute seconds per input second')
+    parser.add_argument('--stub_overhead', type=float, default=0.2, help='Stub fixed seconds per job')
+    parser.add_argument('--endpoint', choices=list(ENDPOINTS) + ['mix'], default='mix')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=None, help='Total requests (default 50 without --duration)')
+    parser.add_argument('--duration', type=float, default=None, help='Stop sending after this many seconds')
+    parser.add_argument('--rate', type=float, default=None, help='Open loop: mean arrivals per second')
+    parser.add_argument('--timeout', type=float, default=600.)
+    parser.add_argument('--audio_seconds', type=float, default=5., help='Length of the uploaded clip')
+    parser.add_argument('--height', type=int, default=360, help='Height of the uploaded video/image')
+    parser.add_argument('--duplicates', type=float, default=0.,
+                        help='Fraction of requests that repeat the previous upload exactly (retries)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', type=str, default=None, help='Write the report to this file')
+    args = parser.parse_args()
+
+    if not args.url and not args.start_server:
+        parser.error('give --url or --start_server')
+    if args.requests is None and args.duration is None:
+        args.requests = 50
+
+    workdir = tempfile.mkdtemp(prefix='lip2sync_load_')
+    proc = None
+    try:
+        payloads = Payloads(args.audio_seconds, args.height, workdir)
+        base_url = args.url
+        if args.start_server:
+            workspace = os.path.join(workdir, 'workspace')
+            os.makedirs(workspace)
+            proc, base_url = start_server(workspace, args.stub, args.stub_rtf, args.stub_overhead, args.server_workers)
+
+        endpoints = list(ENDPOINTS) if args.endpoint == 'mix' else [args.endpoint]
+        report = run_load(base_url, payloads, endpoints, args.concurrency, args.requests, args.duration,
+                          args.rate, args.timeout, args.seed, args.duplicates)
+        report['config'] = {k: v for k, v in vars(args).items() if k != 'json'}
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
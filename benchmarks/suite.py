@@ -0,0 +1,541 @@
+"""CPU benchmark suite for the Wav2Lip pipeline hot spots, with JSON results and a regression check.
+
+Every benchmark runs on synthetic inputs from ``synthetic.py`` and random
+model weights unless real checkpoints are given, so a run is reproducible
+from its config alone:
+
+    melspectrogram   audio.melspectrogram over the whole clip
+    mel_stream       melchunks.MelChunkStream: the same windows, read and computed block by block
+    mel_windows      per-frame window index of the clip's spectrogram: list of slices vs melchunks.MelWindows
+    s3fd_batch       SFDDetector.detect_from_batch on one detection batch
+    nms              bbox.nms on a clustered set of candidate boxes
+    smooth_boxes     smoothing.smooth_boxes over the clip, per mode
+    datagen          infer.datagen building every Wav2Lip batch of the clip
+    wav2lip_forward  Wav2Lip.forward on one batch
+    checkpoint_load  Wav2Lip weights into a fresh model: torch.load of a .pth vs weights.py's mapped safetensors
+    paste_back       infer.paste_back for one batch of predictions
+    frame_handoff    one batch of frames to a child process: pickled multiprocessing.Queue vs framering.FrameRing
+    frame_store      decode the clip and read every frame as datagen does: a list of frames vs a new
+                     framestore store vs reopening an existing one (a retry)
+    end_to_end       Wav2LipEngine.run on the synthetic video + audio
+                     (needs ffmpeg and checkpoints/wav2lip.pth; skipped otherwise)
+
+    python benchmarks/suite.py run --out bench.json
+    python benchmarks/suite.py run --out new.json --baseline bench.json
+    python benchmarks/suite.py compare bench.json new.json --threshold 0.1
+
+``compare`` (and ``run --baseline``) exits with status 1 when any benchmark's
+median got slower than the threshold allows.
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+PIPELINE_DIR = os.path.join(ROOT, 'models', 'wav2lip')
+SRC_DIR = os.path.join(ROOT, 'models', 'wav2lip_src')
+
+# infer.py and its helpers first, then audio/models, which only exist in wav2lip_src.
+# The repo root goes last so its models/ directory does not shadow wav2lip_src/models.
+sys.path[:0] = [PIPELINE_DIR, SRC_DIR, os.path.dirname(os.path.abspath(__file__))]
+sys.path.append(ROOT)
+
+import numpy as np  # noqa: E402
+import torch  # noqa: E402
+
+import synthetic  # noqa: E402
+
+BENCHMARKS = ('melspectrogram', 'mel_stream', 'mel_windows', 's3fd_batch', 'nms', 'smooth_boxes', 'datagen',
+              'wav2lip_forward', 'checkpoint_load', 'paste_back', 'frame_handoff', 'frame_store', 'end_to_end')
+
+
+class Skip(Exception):
+    pass
+
+
+def measure(fn, repeats, warmup=1, items=1):
+    """Time ``fn()`` ``repeats`` times after ``warmup`` untimed calls; summary in milliseconds."""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000.)
+    times.sort()
+    median = statistics.median(times)
+    return {
+        'median_ms': round(median, 4),
+        'mean_ms': round(statistics.mean(times), 4),
+        'min_ms': round(times[0], 4),
+        'p90_ms': round(times[min(len(times) - 1, int(0.9 * len(times)))], 4),
+        'stdev_ms': round(statistics.stdev(times), 4) if len(times) > 1 else 0.,
+        'repeats': repeats,
+        'items': items,
+        'items_per_s': round(items * 1000. / median, 3) if median else None,
+    }
+
+
+class Inputs:
+    """Synthetic clip and the derived arrays the benchmarks share, built once per run."""
+
+    def __init__(self, cfg, workdir):
+        import audio
+        import melchunks
+
+        self.cfg = cfg
+        self.paths, self.frames, self.boxes = synthetic.make_inputs(
+            os.path.join(workdir, 'inputs'), cfg.seconds, cfg.height, None, cfg.fps, cfg.seed)
+        self.wav = audio.load_wav(self.paths['audio'], 16000)
+        self.mel = audio.melspectrogram(self.wav)
+        self.mel_chunks = melchunks.MelWindows(self.mel, cfg.fps)
+        self.face_det_results = [[f[y1:y2, x1:x2], (y1, y2, x1, x2)] for f, (y1, y2, x1, x2) in
+                                 zip(self.frames, self.boxes)]
+
+    @staticmethod
+    def _mel_chunks(mel, fps, step=16):
+        # infer.py's former while-loop chunker, the baseline of bench_mel_windows
+        chunks, i = [], 0
+        while True:
+            start = int(i * 80. / fps)
+            if start + step > mel.shape[1]:
+                chunks.append(mel[:, mel.shape[1] - step:])
+                return chunks
+            chunks.append(mel[:, start:start + step])
+            i += 1
+
+
+def _import_infer(inputs, cfg):
+    """Import infer.py as a module; its argparse runs at import time, so give it a synthetic command line."""
+    if 'infer' in sys.modules:
+        return sys.modules['infer']
+    argv = sys.argv
+    sys.argv = ['infer.py', '--checkpoint_path', '', '--face', inputs.paths['video'],
+                '--audio', inputs.paths['audio'], '--autotune_cache', '',
+                '--wav2lip_batch_size', str(cfg.batch_size)]
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            import infer
+    finally:
+        sys.argv = argv
+    return infer
+
+
+def _random_s3fd_weights(path):
+    """S3FD weights with random features and classifiers biased to background, so NMS sees few candidates."""
+    from face_detection.detection.sfd.net_s3fd import s3fd
+
+    torch.manual_seed(0)
+    net = s3fd()
+    for name, module in net.named_modules():
+        if name.endswith('mbox_conf'):
+            torch.nn.init.zeros_(module.weight)
+            module.bias.data.fill_(10.)
+            module.bias.data[-1] = 0.
+    torch.save(net.state_dict(), path)
+    return path
+
+
+def bench_melspectrogram(inputs, cfg, workdir):
+    import audio
+    return {'': measure(lambda: audio.melspectrogram(inputs.wav), cfg.repeats, items=len(inputs.mel_chunks))}
+
+
+def bench_mel_stream(inputs, cfg, workdir):
+    import melchunks
+
+    def run():
+        for _ in melchunks.MelChunkStream(inputs.paths['audio'], cfg.fps, block_s=1.):
+            pass
+    return {'': measure(run, cfg.repeats, items=len(inputs.mel_chunks))}
+
+
+def bench_mel_windows(inputs, cfg, workdir):
+    import melchunks
+
+    items = len(inputs.mel_chunks)
+    return {'list': measure(lambda: Inputs._mel_chunks(inputs.mel, cfg.fps), cfg.repeats, items=items),
+            'index': measure(lambda: melchunks.MelWindows(inputs.mel, cfg.fps), cfg.repeats, items=items)}
+
+
+def bench_s3fd_batch(inputs, cfg, workdir):
+    from face_detection.detection.sfd.sfd_detector import SFDDetector
+
+    weights = cfg.s3fd or _random_s3fd_weights(os.path.join(workdir, 's3fd_random.pth'))
+    detector = SFDDetector('cpu', path_to_detector=weights)
+    batch = np.array(inputs.frames[:cfg.face_det_batch_size])
+    return {'': measure(lambda: detector.detect_from_batch(batch), cfg.repeats, items=len(batch))}
+
+
+def bench_nms(inputs, cfg, workdir):
+    from face_detection.detection.sfd.bbox import nms
+
+    rng = np.random.default_rng(cfg.seed)
+    per_cluster = cfg.nms_boxes // 4
+    dets = []
+    for cy, cx in rng.uniform(100, cfg.height - 100, size=(4, 2)):
+        centre = np.array([cx, cy, cx, cy]) + np.array([-60, -80, 60, 80])
+        boxes = centre + rng.normal(0, 12, size=(per_cluster, 4))
+        dets.append(np.hstack([boxes, rng.uniform(0.05, 1., size=(per_cluster, 1))]))
+    dets = np.concatenate(dets)
+    return {'': measure(lambda: nms(dets, 0.3), cfg.repeats, items=len(dets))}
+
+
+def bench_smooth_boxes(inputs, cfg, workdir):
+    import smoothing
+
+    rng = np.random.default_rng(cfg.seed)
+    boxes = inputs.boxes[:, [2, 0, 3, 1]] + rng.integers(-4, 5, size=inputs.boxes.shape)
+    return {mode: measure(lambda: smoothing.smooth_boxes(boxes, T=5, mode=mode, fps=cfg.fps), cfg.repeats,
+                          items=len(boxes))
+            for mode in smoothing.MODES}
+
+
+def bench_datagen(inputs, cfg, workdir):
+    infer = _import_infer(inputs, cfg)
+
+    def run():
+        for _ in infer.datagen(inputs.frames, inputs.mel_chunks, inputs.face_det_results):
+            pass
+
+    return {'': measure(run, cfg.repeats, items=len(inputs.mel_chunks))}
+
+
+def bench_wav2lip_forward(inputs, cfg, workdir):
+    from models import Wav2Lip
+
+    torch.manual_seed(cfg.seed)
+    model = Wav2Lip().eval()
+    if cfg.checkpoint:
+        state = torch.load(cfg.checkpoint, map_location='cpu')['state_dict']
+        model.load_state_dict({k.replace('module.', ''): v for k, v in state.items()})
+    mel = torch.randn(cfg.batch_size, 1, 80, 16)
+    img = torch.rand(cfg.batch_size, 6, 96, 96)
+
+    def run():
+        with torch.no_grad():
+            model(mel, img)
+
+    return {'': measure(run, cfg.repeats, items=cfg.batch_size)}
+
+
+def bench_checkpoint_load(inputs, cfg, workdir):
+    import weights
+    from models import Wav2Lip
+
+    torch.manual_seed(cfg.seed)
+    pth = cfg.checkpoint
+    if not pth:
+        pth = os.path.join(workdir, 'wav2lip.pth')
+        torch.save({'state_dict': Wav2Lip().state_dict()}, pth)
+    # Not next to the .pth: weights.resolve would then map it for run_pth too.
+    mapped = os.path.join(workdir, 'wav2lip_mapped' + weights.SUFFIX)
+    weights.save_file(weights.strip_prefix(torch.load(pth, map_location='cpu')), mapped)
+
+    # Model construction is the same for both and not part of the comparison.
+    models = Wav2Lip(), Wav2Lip()
+
+    def run_pth():
+        weights.load_into(models[0], pth)
+
+    def run_mapped():
+        weights.load_into(models[1], mapped)
+
+    return {'torch_load': measure(run_pth, cfg.repeats), 'mmap': measure(run_mapped, cfg.repeats)}
+
+
+def bench_paste_back(inputs, cfg, workdir):
+    infer = _import_infer(inputs, cfg)
+
+    rng = np.random.default_rng(cfg.seed)
+    n = min(cfg.batch_size, len(inputs.frames))
+    pred = rng.uniform(0, 255, size=(n, 96, 96, 3)).astype(np.float32)
+    frames = [f.copy() for f in inputs.frames[:n]]
+    coords = [c for _, c in inputs.face_det_results[:n]]
+
+    def run():
+        for p, f, c in zip(pred, frames, coords):
+            infer.paste_back(p, f, c)
+
+    return {'': measure(run, cfg.repeats, items=n)}
+
+
+def _drain_queue(frames, batch, acks):
+    received = 0
+    while frames.get() is not None:
+        received += 1
+        if received % batch == 0:
+            acks.put(received)
+
+
+def _drain_ring(ring, batch, acks):
+    received = 0
+    for slot in ring:
+        ring.release(slot)
+        received += 1
+        if received % batch == 0:
+            acks.put(received)
+
+
+def bench_frame_handoff(inputs, cfg, workdir):
+    import multiprocessing
+    import framering
+
+    ctx = multiprocessing.get_context('fork')
+    frames = inputs.frames[:cfg.batch_size]
+    n = len(frames)
+    queue, ring = ctx.Queue(), framering.FrameRing(n, frames[0].shape, ctx=ctx)
+    acks = ctx.Queue()
+    workers = [ctx.Process(target=_drain_queue, args=(queue, n, acks), daemon=True),
+               ctx.Process(target=_drain_ring, args=(ring, n, acks), daemon=True)]
+    for w in workers:
+        w.start()
+
+    def run_queue():
+        for f in frames:
+            queue.put(f)
+        acks.get()
+
+    def run_ring():
+        for f in frames:
+            slot = ring.acquire()
+            np.copyto(ring[slot], f)
+            ring.publish(slot)
+        acks.get()
+
+    try:
+        return {'queue': measure(run_queue, cfg.repeats, items=n), 'ring': measure(run_ring, cfg.repeats, items=n)}
+    finally:
+        queue.put(None)
+        ring.finish()
+        for w in workers:
+            w.join()
+        ring.close()
+
+
+def bench_frame_store(inputs, cfg, workdir):
+    import cv2
+    import framestore
+
+    coords = [c for _, c in inputs.face_det_results]
+
+    def decode(add):
+        cap = cv2.VideoCapture(inputs.paths['video'])
+        try:
+            while True:
+                still_reading, frame = cap.read()
+                if not still_reading:
+                    return
+                add(frame)
+        finally:
+            cap.release()
+
+    def consume(frames):
+        # datagen's reads: the face crop and a copy of the frame to paste into
+        for frame, (y1, y2, x1, x2) in zip(frames, coords):
+            frame[y1:y2, x1:x2].copy()
+            frame.copy()
+
+    def run_list():
+        frames = []
+        decode(frames.append)
+        consume(frames)
+
+    store_dir = os.path.join(workdir, 'frame_store')
+
+    def run_store():
+        shutil.rmtree(store_dir, ignore_errors=True)
+        writer = framestore.FrameStoreWriter(store_dir)
+        decode(writer.append)
+        consume(writer.close())
+
+    def run_reopen():
+        consume(framestore.FrameStore.open(store_dir))
+
+    n = len(inputs.frames)
+    return {'list': measure(run_list, cfg.repeats, items=n), 'store': measure(run_store, cfg.repeats, items=n),
+            'reopen': measure(run_reopen, cfg.repeats, items=n)}
+
+
+def bench_end_to_end(inputs, cfg, workdir):
+    if shutil.which('ffmpeg') is None:
+        raise Skip('ffmpeg not found')
+    checkpoint = os.path.join(cfg.model_path, 'checkpoints', 'wav2lip.pth')
+    if not os.path.exists(checkpoint):
+        raise Skip('no checkpoint at {}'.format(checkpoint))
+
+    from app.engines.wav2lip.engine import Wav2LipEngine
+
+    # A source checkout keeps audio.py and the model package in wav2lip_src.
+    if not os.path.exists(os.path.join(cfg.model_path, 'audio.py')):
+        os.environ['PYTHONPATH'] = os.pathsep.join(filter(None, [SRC_DIR, os.environ.get('PYTHONPATH')]))
+
+    engine = Wav2LipEngine(model_path=cfg.model_path, workspace=os.path.join(workdir, 'workspace'))
+    with open(inputs.paths['video'], 'rb') as f:
+        video = f.read()
+    with open(inputs.paths['audio'], 'rb') as f:
+        wav = f.read()
+
+    def run():
+        result = engine.run(video, wav)
+        if result.get('status') != 'success':
+            raise RuntimeError(result.get('details'))
+
+    return {'': measure(run, cfg.e2e_repeats, warmup=0, items=len(inputs.mel_chunks))}
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(cfg):
+    if cfg.threads:
+        torch.set_num_threads(cfg.threads)
+        import cv2
+        cv2.setNumThreads(cfg.threads)
+    np.random.seed(cfg.seed)
+    torch.manual_seed(cfg.seed)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'host': platform.node(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'python': platform.python_version(),
+            'torch': torch.__version__,
+            'numpy': np.__version__,
+            'torch_threads': torch.get_num_threads(),
+        },
+        'config': {k: v for k, v in vars(cfg).items()
+                   if k not in ('command', 'out', 'baseline', 'only', 'threshold', 'min_delta_ms')},
+        'results': {},
+        'skipped': {},
+    }
+
+    workdir = tempfile.mkdtemp(prefix='lip2sync_bench_')
+    try:
+        inputs = Inputs(cfg, workdir)
+        for name in cfg.only or BENCHMARKS:
+            print('{:<24}'.format(name), end='', flush=True)
+            try:
+                entries = globals()['bench_' + name](inputs, cfg, workdir)
+            except Skip as e:
+                report['skipped'][name] = str(e)
+                print('skipped: {}'.format(e))
+                continue
+            for variant, stats in entries.items():
+                key = '{}[{}]'.format(name, variant) if variant else name
+                report['results'][key] = stats
+            print('  '.join('{}{:.2f} ms'.format(variant + ' ' if variant else '', s['median_ms'])
+                            for variant, s in entries.items()))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def compare(baseline, current, threshold=0.1, min_delta_ms=0.05):
+    """Rows of (name, base_ms, new_ms, ratio, verdict) for benchmarks present in both reports."""
+    rows = []
+    for name, new in current['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            continue
+        base_ms, new_ms = old['median_ms'], new['median_ms']
+        ratio = new_ms / base_ms if base_ms else float('inf')
+        verdict = 'ok'
+        if ratio > 1 + threshold and new_ms - base_ms > min_delta_ms:
+            verdict = 'REGRESSION'
+        elif ratio < 1 - threshold and base_ms - new_ms > min_delta_ms:
+            verdict = 'improved'
+        rows.append((name, base_ms, new_ms, ratio, verdict))
+    return rows
+
+
+def print_comparison(baseline, current, threshold, min_delta_ms):
+    for key in ('commit', 'host', 'torch', 'torch_threads'):
+        a, b = baseline['meta'].get(key), current['meta'].get(key)
+        if a != b and key != 'commit':
+            print('warning: {} differs ({} vs {}); timings may not be comparable'.format(key, a, b))
+    if baseline['config'] != current['config']:
+        print('warning: benchmark config differs from the baseline')
+
+    rows = compare(baseline, current, threshold, min_delta_ms)
+    print('{:<28} {:>12} {:>12} {:>8}  {}'.format('benchmark', 'base ms', 'new ms', 'ratio', ''))
+    for name, base_ms, new_ms, ratio, verdict in rows:
+        print('{:<28} {:>12.3f} {:>12.3f} {:>7.2f}x  {}'.format(name, base_ms, new_ms, ratio, verdict))
+    regressions = [r for r in rows if r[4] == 'REGRESSION']
+    print('{} regression(s) at threshold {:.0%}'.format(len(regressions), threshold))
+    return regressions
+
+
+def _load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run_p = sub.add_parser('run', help='Run the suite and write a JSON report')
+    run_p.add_argument('--out', type=str, default='bench_results.json')
+    run_p.add_argument('--baseline', type=str, default=None, help='Compare against this report after the run')
+    run_p.add_argument('--only', nargs='+', choices=BENCHMARKS, default=None)
+    run_p.add_argument('--seconds', type=float, default=8., help='Length of the synthetic clip')
+    run_p.add_argument('--height', type=int, default=720, help='Synthetic video height (16:9)')
+    run_p.add_argument('--fps', type=float, default=25.)
+    run_p.add_argument('--seed', type=int, default=0)
+    run_p.add_argument('--repeats', type=int, default=5)
+    run_p.add_argument('--e2e_repeats', type=int, default=1)
+    run_p.add_argument('--threads', type=int, default=0, help='torch/OpenCV threads (0 = library default)')
+    run_p.add_argument('--batch_size', type=int, default=32, help='Wav2Lip batch size')
+    run_p.add_argument('--face_det_batch_size', type=int, default=4)
+    run_p.add_argument('--nms_boxes', type=int, default=2000)
+    run_p.add_argument('--checkpoint', type=str, default=None, help='Wav2Lip weights (default: random)')
+    run_p.add_argument('--s3fd', type=str, default=None, help='S3FD weights (default: random)')
+    run_p.add_argument('--model_path', type=str, default=PIPELINE_DIR, help='Engine model_path for end_to_end')
+
+    cmp_p = sub.add_parser('compare', help='Compare two JSON reports')
+    cmp_p.add_argument('baseline')
+    cmp_p.add_argument('current')
+
+    for p in (run_p, cmp_p):
+        p.add_argument('--threshold', type=float, default=0.1, help='Allowed median slowdown (0.1 = 10%%)')
+        p.add_argument('--min_delta_ms', type=float, default=0.05, help='Ignore slowdowns smaller than this')
+
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        baseline, current = _load(args.baseline), _load(args.current)
+    else:
+        current = run_suite(args)
+        with open(args.out, 'w') as f:
+            json.dump(current, f, indent=2)
+        print('wrote {}'.format(args.out))
+        if not args.baseline:
+            return
+        baseline = _load(args.baseline)
+
+    if print_comparison(baseline, current, args.threshold, args.min_delta_ms):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
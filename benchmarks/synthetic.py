@@ -0,0 +1,136 @@
+"""Deterministic synthetic inputs for benchmarks: a talking-head-like video, a still image and speech-like audio.
+
+The "face" is a skin-toned ellipse with eyes and a mouth whose opening follows
+the audio envelope, drifting slowly across a gradient background. That is
+enough texture for S3FD, Wav2Lip and the encoders to do realistic work, and
+every file is reproducible from (seed, duration, resolution).
+
+    python benchmarks/synthetic.py --out /tmp/bench_inputs --seconds 10 --height 720
+"""
+import argparse
+import os
+import wave
+
+import cv2
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+
+def speech_like_audio(seconds, sample_rate=SAMPLE_RATE, seed=0):
+    """Voiced harmonics with a wandering pitch, gated at a syllable rate, plus breath noise. float32 in [-1, 1]."""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sample_rate)
+    t = np.arange(n) / sample_rate
+
+    pitch = 120. + 20. * np.sin(2 * np.pi * 0.3 * t) + 5. * rng.standard_normal() * np.sin(2 * np.pi * 1.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 12))
+
+    syllables = np.clip(np.sin(2 * np.pi * 4. * t + rng.uniform(0, np.pi)), 0, None) ** 2
+    pauses = (np.sin(2 * np.pi * 0.25 * t) > -0.7).astype(np.float64)
+    envelope = syllables * pauses
+
+    signal = envelope * voiced + 0.02 * rng.standard_normal(n)
+    return (0.5 * signal / np.abs(signal).max()).astype(np.float32)
+
+
+def write_wav(path, samples, sample_rate=SAMPLE_RATE):
+    pcm = (np.clip(samples, -1, 1) * 32767).astype('<i2')
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm.tobytes())
+
+
+def mouth_openness(samples, frames, fps, sample_rate=SAMPLE_RATE):
+    """Per-frame RMS of the audio, scaled to [0, 1]."""
+    hop = sample_rate / fps
+    rms = np.array([np.sqrt(np.mean(samples[int(i * hop):int((i + 1) * hop)] ** 2) + 1e-12) for i in range(frames)])
+    return rms / (rms.max() + 1e-12)
+
+
+def face_box(i, height, width, fps):
+    """(y1, y2, x1, x2) of the face in frame ``i``: about a third of the frame height, drifting slowly."""
+    size = height // 3
+    cx = width // 2 + int(0.05 * width * np.sin(2 * np.pi * 0.2 * i / fps))
+    cy = height // 2 + int(0.03 * height * np.sin(2 * np.pi * 0.13 * i / fps))
+    return cy - size // 2, cy + size // 2, cx - size * 3 // 8, cx + size * 3 // 8
+
+
+def _background(height, width):
+    ramp_y = np.linspace(40, 120, height, dtype=np.float32)[:, None]
+    ramp_x = np.linspace(60, 160, width, dtype=np.float32)[None, :]
+    bg = np.empty((height, width, 3), dtype=np.uint8)
+    bg[..., 0] = ramp_y + 0 * ramp_x
+    bg[..., 1] = (ramp_y + ramp_x) / 2
+    bg[..., 2] = ramp_x + 0 * ramp_y
+    return bg
+
+
+def render_frame(background, box, openness):
+    frame = background.copy()
+    y1, y2, x1, x2 = box
+    cy, cx = (y1 + y2) // 2, (x1 + x2) // 2
+    ry, rx = (y2 - y1) // 2, (x2 - x1) // 2
+    cv2.ellipse(frame, (cx, cy), (rx, ry), 0, 0, 360, (120, 160, 210), -1)
+    for dx in (-rx // 2, rx // 2):
+        cv2.circle(frame, (cx + dx, cy - ry // 4), max(2, rx // 8), (40, 40, 40), -1)
+    mouth_h = max(1, int(ry * (0.05 + 0.25 * openness)))
+    cv2.ellipse(frame, (cx, cy + ry // 2), (rx // 3, mouth_h), 0, 0, 360, (30, 30, 120), -1)
+    return frame
+
+
+def talking_head_frames(seconds, height=720, width=None, fps=25., seed=0, samples=None):
+    """Frames (BGR uint8) and per-frame face boxes (y1, y2, x1, x2) of a synthetic talking head."""
+    width = width or int(round(height * 16 / 9 / 2)) * 2
+    n = int(round(seconds * fps))
+    samples = speech_like_audio(seconds, seed=seed) if samples is None else samples
+    openness = mouth_openness(samples, n, fps)
+    background = _background(height, width)
+    boxes = [face_box(i, height, width, fps) for i in range(n)]
+    frames = [render_frame(background, box, o) for box, o in zip(boxes, openness)]
+    return frames, np.array(boxes)
+
+
+def write_video(path, frames, fps=25.):
+    h, w = frames[0].shape[:2]
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
+    for f in frames:
+        out.write(f)
+    out.release()
+
+
+def make_inputs(out_dir, seconds=10., height=720, width=None, fps=25., seed=0):
+    """Write video.mp4, audio.wav and image.png to ``out_dir``; return their paths, the frames and the face boxes."""
+    os.makedirs(out_dir, exist_ok=True)
+    samples = speech_like_audio(seconds, seed=seed)
+    frames, boxes = talking_head_frames(seconds, height, width, fps, seed, samples)
+    paths = {
+        'video': os.path.join(out_dir, 'video.mp4'),
+        'audio': os.path.join(out_dir, 'audio.wav'),
+        'image': os.path.join(out_dir, 'image.png'),
+    }
+    write_video(paths['video'], frames, fps)
+    write_wav(paths['audio'], samples)
+    cv2.imwrite(paths['image'], frames[0])
+    return paths, frames, boxes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--out', required=True)
+    parser.add_argument('--seconds', type=float, default=10.)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--width', type=int, default=None)
+    parser.add_argument('--fps', type=float, default=25.)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    paths, _, _ = make_inputs(args.out, args.seconds, args.height, args.width, args.fps, args.seed)
+    for kind, path in paths.items():
+        print('{:6s} {}'.format(kind, path))
+
+
+if __name__ == '__main__':
+    main()
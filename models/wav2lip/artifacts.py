@@ -0,0 +1,66 @@
+"""Intermediate results of one render, kept so a later render of the same inputs can skip that work.
+
+A quick preview render (``infer.py --save_artifacts DIR``) leaves in DIR:
+
+    frames.raw + frames.json   every decoded source frame (before --resize_factor) as a
+                               framestore.py store, unless the video is larger than the size cap
+    rects.npz                  raw S3FD boxes (x1, y1, x2, y2) in source pixels, with the
+                               source frame index of each, before padding and smoothing
+    audio/                     an audiocache.AudioCache directory with the mel spectrogram
+
+The full render (``--reuse_artifacts DIR``) memory-maps the frames instead of
+decoding the video again, and interpolates the boxes to its own frames
+instead of running face detection. Any missing piece is simply recomputed.
+Both renders must use the same --crop and --rotate.
+"""
+import os
+
+import numpy as np
+
+import framestore
+
+RECTS_FILE = 'rects.npz'
+AUDIO_DIR = 'audio'
+
+
+def audio_dir(directory):
+    return os.path.join(directory, AUDIO_DIR)
+
+
+def frame_writer(directory, max_bytes):
+    """A ``framestore.FrameStoreWriter`` for the decoded source frames."""
+    return framestore.FrameStoreWriter(directory, max_bytes)
+
+
+def load_frames(directory, count=None):
+    """Read-only ``(n, h, w, 3)`` memmap of the recorded frames, or None if they stop short of ``count``."""
+    store = framestore.FrameStore.open(directory)
+    if store is None or (count is not None and not store.covers(count)):
+        return None
+    return store.frames
+
+
+def save_rects(directory, indices, rects, scale=1):
+    """``rects`` in the detected frames' pixels; ``scale`` converts them to source pixels."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, RECTS_FILE)
+    tmp = path + '.tmp.npz'
+    np.savez(tmp, indices=np.asarray(indices, dtype=np.int64), rects=np.asarray(rects, dtype=np.float64) * scale)
+    os.replace(tmp, path)
+
+
+def load_rects(directory, indices, scale=1):
+    """Boxes for source frames ``indices``, in pixels divided by ``scale``, or None.
+
+    Frames that the saving render did not detect on (e.g. it kept every
+    other frame) get the linear interpolation of the nearest detected boxes.
+    """
+    try:
+        data = np.load(os.path.join(directory, RECTS_FILE))
+    except (OSError, ValueError):
+        return None
+    known, rects = data['indices'], data['rects'] / scale
+    if not len(known):
+        return None
+    columns = [np.interp(indices, known, rects[:, c]) for c in range(4)]
+    return [tuple(int(round(v)) for v in rect) for rect in np.stack(columns, axis=1)]
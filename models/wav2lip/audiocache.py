@@ -0,0 +1,179 @@
+"""Cache of the face-independent half of Wav2Lip: mel spectrograms and per-frame audio embeddings.
+
+A clip that is rendered onto many faces (a library of prompts or jingles)
+produces the same spectrogram and the same ``Wav2Lip.encode_audio`` output
+every time. Entries are keyed by the SHA-256 of the audio file:
+
+    mel        (num_mels, columns) float32, independent of fps and model
+    embedding  (frames, 512) float32, per fps and checkpoint
+
+``AudioCache`` keeps recently used entries in memory up to ``max_bytes``
+and spills the least recently used ones to ``directory`` as .npy files,
+where the next process finds them. The directory is pruned to
+``max_disk_bytes`` by last use.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+EMBEDDING_DIM = 512
+
+
+def file_digest(path, chunk=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def checkpoint_tag(path):
+    """Identifies a checkpoint file by path, size and mtime, without hashing hundreds of MB."""
+    st = os.stat(path)
+    return '{}:{}:{}'.format(os.path.realpath(path), st.st_size, st.st_mtime_ns)
+
+
+def mel_key(digest):
+    return 'mel-' + digest
+
+
+def embedding_key(digest, fps, model_tag):
+    tag = hashlib.sha256('{!r}|{}'.format(float(fps), model_tag).encode()).hexdigest()[:16]
+    return 'emb-{}-{}'.format(digest, tag)
+
+
+def compute_embeddings(model, windows, device, batch_size):
+    """``model.encode_audio`` for every window of a ``melchunks.MelWindows``, as a (frames, 512) float32 array."""
+    out = np.empty((len(windows), EMBEDDING_DIM), dtype=np.float32)
+    buf = np.empty((batch_size, 1) + windows.view.shape[1:], dtype=np.float32)
+    with torch.no_grad():
+        for start in range(0, len(windows), batch_size):
+            stop = min(start + batch_size, len(windows))
+            mel_batch = buf[:stop - start]
+            windows.gather(start, stop, out=mel_batch[:, 0])
+            emb = model.encode_audio(torch.from_numpy(mel_batch).to(device))
+            out[start:stop] = emb.reshape(stop - start, EMBEDDING_DIM).cpu().numpy()
+    return out
+
+
+class AudioCache:
+    """Byte-bounded LRU of numpy arrays in memory, spilling to .npy files in ``directory``.
+
+    ``directory=None`` keeps the cache in memory only. Call ``close`` before
+    the process exits so entries still in memory reach the disk.
+    """
+
+    def __init__(self, directory=None, max_bytes=256 << 20, max_disk_bytes=4 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._unsaved = set()  # keys whose entry exists only in memory
+        self._bytes = 0
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+    def get(self, key):
+        """The cached array, or None. Disk hits are promoted to memory."""
+        with self._lock:
+            array = self._entries.get(key)
+            if array is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return array
+        array = self._load(key)
+        with self._lock:
+            if array is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._insert(key, array, saved=True)
+        return array
+
+    def put(self, key, array):
+        self._insert(key, np.ascontiguousarray(array), saved=False)
+
+    def _insert(self, key, array, saved):
+        spill = []
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key).nbytes
+            self._entries[key] = array
+            self._bytes += array.nbytes
+            if saved:
+                self._unsaved.discard(key)
+            else:
+                self._unsaved.add(key)
+            # An entry larger than the whole budget goes straight to disk.
+            while self._bytes > self.max_bytes and self._entries:
+                old_key, old = self._entries.popitem(last=False)
+                self._bytes -= old.nbytes
+                if old_key in self._unsaved:
+                    self._unsaved.discard(old_key)
+                    spill.append((old_key, old))
+        for old_key, old in spill:
+            self._save(old_key, old)
+        if spill:
+            self._prune()
+
+    def _load(self, key):
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            array = np.load(path)
+        except (OSError, ValueError):
+            return None
+        os.utime(path)  # last use, for _prune
+        return array
+
+    def _save(self, key, array):
+        if not self.directory:
+            return
+        path = self._path(key)
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp, path)
+
+    def _prune(self):
+        if not self.directory or not self.max_disk_bytes:
+            return
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.npy'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
+
+    def close(self):
+        """Write the entries that exist only in memory to ``directory``."""
+        with self._lock:
+            pending = [(key, self._entries[key]) for key in self._unsaved]
+            self._unsaved.clear()
+        for key, array in pending:
+            self._save(key, array)
+        if pending:
+            self._prune()
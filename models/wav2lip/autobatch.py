@@ -0,0 +1,184 @@
+"""Batch sizes for S3FD and Wav2Lip derived from a memory budget.
+
+The budget gives an upper bound per stage: frames x H x W x bytes-per-pixel
+for S3FD, measured activation bytes per item for Wav2Lip. Within that bound
+``AutoTuner`` times a few candidates once per (stage, device, resolution
+bucket) and remembers the fastest in a JSON cache, so a node type is tuned
+on its first job and reuses the answer afterwards. On the CPU the bound is
+also capped at ``CPU_MAX_BATCH``: throughput stops improving long before
+memory runs out, and every candidate costs two forward passes.
+"""
+import json
+import os
+import time
+
+import numpy as np
+import torch
+
+# Used when activation memory cannot be measured (CPU inference).
+S3FD_BYTES_PER_PIXEL = 1200
+WAV2LIP_BYTES_PER_ITEM = 24 << 20
+CPU_MAX_BATCH = 64
+
+RESOLUTION_BUCKETS = (240, 360, 480, 720, 1080, 1440, 2160)
+
+
+def resolution_bucket(height, width):
+    side = min(height, width)
+    for bucket in RESOLUTION_BUCKETS:
+        if side <= bucket:
+            return bucket
+    return RESOLUTION_BUCKETS[-1]
+
+
+def device_name(device):
+    if 'cuda' in device and torch.cuda.is_available():
+        return torch.cuda.get_device_name(torch.device(device)).replace(' ', '_')
+    return 'cpu{}'.format(torch.get_num_threads())
+
+
+def memory_budget(device, budget_mb=None, fraction=0.8):
+    """Bytes a single stage may use for activations."""
+    if budget_mb:
+        return int(budget_mb) << 20
+    if 'cuda' in device and torch.cuda.is_available():
+        free, _ = torch.cuda.mem_get_info(torch.device(device))
+        return int(free * fraction)
+    try:
+        available = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        available = 4 << 30
+    return int(available * fraction)
+
+
+def measure_peak_bytes(fn, device):
+    """Peak CUDA memory allocated while running ``fn()``; None when not on CUDA."""
+    if 'cuda' not in device or not torch.cuda.is_available():
+        return None
+    dev = torch.device(device)
+    torch.cuda.synchronize(dev)
+    base = torch.cuda.memory_allocated(dev)
+    torch.cuda.reset_peak_memory_stats(dev)
+    fn()
+    torch.cuda.synchronize(dev)
+    return max(0, torch.cuda.max_memory_allocated(dev) - base)
+
+
+def s3fd_batch_size(height, width, budget_bytes, bytes_per_pixel=S3FD_BYTES_PER_PIXEL, max_batch=256):
+    per_frame = height * width * bytes_per_pixel
+    return int(max(1, min(max_batch, budget_bytes // max(1, per_frame))))
+
+
+def wav2lip_batch_size(budget_bytes, bytes_per_item=WAV2LIP_BYTES_PER_ITEM, max_batch=512):
+    return int(max(1, min(max_batch, budget_bytes // max(1, bytes_per_item))))
+
+
+def device_limit(device, limit):
+    return limit if 'cuda' in device else min(limit, CPU_MAX_BATCH)
+
+
+def candidate_sizes(limit, count=4):
+    """``limit`` and up to ``count - 1`` successive halvings of it."""
+    sizes = []
+    while limit >= 1 and len(sizes) < count:
+        sizes.append(int(limit))
+        limit //= 2
+    return sizes
+
+
+class AutoTuner:
+    """Pick the highest-throughput batch size and cache it per key."""
+
+    def __init__(self, cache_path=None, repeats=1):
+        self.cache_path = cache_path
+        self.repeats = repeats
+        self.results = {}
+        if cache_path and os.path.isfile(cache_path):
+            try:
+                with open(cache_path) as f:
+                    self.results = json.load(f)
+            except (OSError, ValueError):
+                self.results = {}
+
+    def _save(self):
+        if not self.cache_path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        tmp = '{}.{}.tmp'.format(self.cache_path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(self.results, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.cache_path)
+
+    def best(self, key, run, candidates):
+        """Return the cached choice for ``key`` or time ``run(batch_size)`` for each candidate.
+
+        A cached choice never exceeds the largest candidate: it may have been
+        tuned under a larger memory budget than the current one.
+        """
+        if key in self.results:
+            return min(int(self.results[key]), max(candidates))
+
+        best_size, best_rate = min(candidates), 0.
+        for size in sorted(set(candidates)):
+            try:
+                run(size)
+                start = time.perf_counter()
+                for _ in range(self.repeats):
+                    run(size)
+                rate = size * self.repeats / (time.perf_counter() - start)
+            except RuntimeError:
+                # Out of memory: larger candidates will not fit either.
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+                break
+            if rate > best_rate:
+                best_size, best_rate = size, rate
+
+        self.results[key] = best_size
+        self._save()
+        return best_size
+
+    def best_within(self, key, run, limit, max_items=None):
+        """``best`` over ``candidate_sizes(limit)`` for an input of ``max_items`` items.
+
+        An input no longer than the smallest candidate runs as one batch
+        without tuning. Other short inputs reuse the full result for ``key``
+        if there is one. Otherwise their candidates stop at the largest power
+        of two within the input, and the result is cached under that cap, so
+        a short clip is tuned once per cap rather than on every job.
+        """
+        candidates = candidate_sizes(limit)
+        if not max_items or max_items >= limit:
+            return self.best(key, run, candidates)
+        if max_items <= min(candidates):
+            return max_items
+        if key in self.results:
+            return min(int(self.results[key]), max_items)
+        cap = 1 << (max_items.bit_length() - 1)
+        return self.best('{}/max{}'.format(key, cap), run, candidate_sizes(cap))
+
+
+def tune_s3fd(detector, height, width, device, tuner, budget_bytes, max_items=None):
+    def run(size):
+        detector.get_detections_for_batch(np.zeros((size, height, width, 3), dtype=np.uint8))
+
+    peak = measure_peak_bytes(lambda: run(1), device)
+    per_pixel = peak / float(height * width) if peak else S3FD_BYTES_PER_PIXEL
+    limit = device_limit(device, s3fd_batch_size(height, width, budget_bytes, per_pixel))
+
+    key = 's3fd/{}/{}'.format(device_name(device), resolution_bucket(height, width))
+    return tuner.best_within(key, run, limit, max_items)
+
+
+def tune_wav2lip(model, device, tuner, budget_bytes, img_size=96, max_items=None):
+    def run(size):
+        with torch.no_grad():
+            model(torch.zeros(size, 1, 80, 16, device=device),
+                  torch.zeros(size, 6, img_size, img_size, device=device))
+
+    peak = measure_peak_bytes(lambda: run(2), device)
+    per_item = peak / 2. if peak else WAV2LIP_BYTES_PER_ITEM
+    limit = device_limit(device, wav2lip_batch_size(budget_bytes, per_item))
+
+    key = 'wav2lip/{}/{}'.format(device_name(device), img_size)
+    return tuner.best_within(key, run, limit, max_items)
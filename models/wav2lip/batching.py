@@ -0,0 +1,59 @@
+import numpy as np
+import cv2
+
+
+class Wav2LipBatch:
+    """Preallocated input buffers for one Wav2Lip forward pass.
+
+    Faces are collected as uint8 and mel windows as float32; ``prepare`` then
+    does the masking, channel concatenation, [0, 1] scaling and NHWC -> NCHW
+    transpose in a single float32 pass, writing straight into the arrays that
+    are handed to ``torch.from_numpy``. The buffers are reused for every batch,
+    so the returned arrays are only valid until the next ``reset``.
+
+    Faces larger than ``img_size`` are resized with ``downscale``; crops taken
+    from full-resolution frames want ``cv2.INTER_AREA`` there.
+    """
+
+    def __init__(self, batch_size, img_size=96, mel_shape=(80, 16), downscale=cv2.INTER_LINEAR):
+        self.batch_size = batch_size
+        self.img_size = img_size
+        self.downscale = downscale
+        self.size = 0
+
+        self.faces = np.empty((batch_size, img_size, img_size, 3), dtype=np.uint8)
+        self.img_input = np.empty((batch_size, 6, img_size, img_size), dtype=np.float32)
+        self.mel_input = np.empty((batch_size, 1) + tuple(mel_shape), dtype=np.float32)
+
+    def __len__(self):
+        return self.size
+
+    def full(self):
+        return self.size >= self.batch_size
+
+    def add(self, face, mel=None):
+        """Queue one face; ``mel=None`` leaves its window to be written into ``mel_input`` by the caller."""
+        if face.shape[:2] != (self.img_size, self.img_size):
+            shrink = face.shape[0] > self.img_size and face.shape[1] > self.img_size
+            face = cv2.resize(face, (self.img_size, self.img_size),
+                              interpolation=self.downscale if shrink else cv2.INTER_LINEAR)
+        self.faces[self.size] = face
+        if mel is not None:
+            self.mel_input[self.size, 0] = mel
+        self.size += 1
+
+    def prepare(self):
+        """Return ``(img_batch, mel_batch)`` as float32 NCHW views of length ``len(self)``."""
+        n = self.size
+        img = self.img_input[:n]
+
+        # Reference half (channels 3:6) is the face itself, scaled to [0, 1].
+        np.divide(self.faces[:n].transpose(0, 3, 1, 2), np.float32(255.), out=img[:, 3:])
+        # Masked half (channels 0:3) is the same face with the lower half zeroed.
+        img[:, :3] = img[:, 3:]
+        img[:, :3, self.img_size // 2:] = 0
+
+        return img, self.mel_input[:n]
+
+    def reset(self):
+        self.size = 0
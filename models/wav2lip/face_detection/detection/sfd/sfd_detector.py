@@ -1,7 +1,13 @@
 import os
 import cv2
+import torch
 from torch.utils.model_zoo import load_url
 
+try:
+    import weights  # models/wav2lip/weights.py, on sys.path when run from infer.py or the engines
+except ImportError:
+    weights = None
+
 from ..core import FaceDetector
 
 from .net_s3fd import s3fd
@@ -18,13 +24,16 @@ class SFDDetector(FaceDetector):
         super(SFDDetector, self).__init__(device, verbose)
 
         # Initialise the face detector
+        self.face_detector = s3fd()
+        # Memory-maps s3fd.safetensors instead when it has been converted (see weights.py)
+        if weights is not None:
+            path_to_detector = weights.resolve(path_to_detector)
         if not os.path.isfile(path_to_detector):
-            model_weights = load_url(models_urls['s3fd'])
+            self.face_detector.load_state_dict(load_url(models_urls['s3fd']))
+        elif weights is not None:
+            weights.load_into(self.face_detector, path_to_detector)
         else:
-            model_weights = torch.load(path_to_detector)
-
-        self.face_detector = s3fd()
-        self.face_detector.load_state_dict(model_weights)
+            self.face_detector.load_state_dict(torch.load(path_to_detector))
         self.face_detector.to(device)
         self.face_detector.eval()
 
@@ -0,0 +1,156 @@
+"""Fixed-size frames handed between processes through shared memory instead of pickled queues.
+
+``FrameRing`` is a ``multiprocessing.shared_memory`` block of ``slots``
+frames of one shape. Only slot numbers travel through the queues:
+
+    producer                          consumer
+    i = ring.acquire()                for i in ring:
+    np.copyto(ring[i], frame)             use(ring[i])
+    ring.publish(i)                       ring.release(i)
+    ...
+    ring.finish()
+
+``acquire`` blocks while every slot is in flight, which bounds memory and
+applies backpressure to the producer. Slots are published and consumed in
+order. A ring is passed to a Process of the context it was created with, as
+an argument; the child attaches to the same block.
+
+``EncoderProcess`` uses a ring to run a ``cv2.VideoWriter``-like sink in a
+child process, so encoding overlaps the next Wav2Lip batch on another core.
+The child is spawned, not forked: by then the parent has run torch and
+OpenCV, and a fork copies their thread pools' locks but not the threads.
+"""
+import multiprocessing
+import os
+import queue
+import sys
+from multiprocessing import shared_memory
+
+import numpy as np
+
+_END = -1
+
+
+def _attach(name):
+    # Processes started from the creator share its resource tracker, so attaching adds no second owner.
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+class FrameRing:
+    def __init__(self, slots, shape, dtype=np.uint8, ctx=None):
+        ctx = ctx or multiprocessing.get_context('fork')
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        size = slots * int(np.prod(self.shape)) * self.dtype.itemsize
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, size))
+        self._owner = os.getpid()  # forked children inherit this object but must not unlink the block
+        self._free = ctx.Queue()
+        self._ready = ctx.Queue()
+        for i in range(slots):
+            self._free.put(i)
+        self._map()
+
+    def _map(self):
+        self._frames = np.ndarray((self.slots,) + self.shape, dtype=self.dtype, buffer=self._shm.buf)
+
+    def __getstate__(self):
+        return {'name': self._shm.name, 'slots': self.slots, 'shape': self.shape, 'dtype': self.dtype.str,
+                'free': self._free, 'ready': self._ready}
+
+    def __setstate__(self, state):
+        self.slots, self.shape, self.dtype = state['slots'], state['shape'], np.dtype(state['dtype'])
+        self._free, self._ready = state['free'], state['ready']
+        self._shm = _attach(state['name'])
+        self._owner = None
+        self._map()
+
+    def __getitem__(self, slot):
+        return self._frames[slot]
+
+    def acquire(self, timeout=None):
+        """A free slot for the producer to fill; blocks while all slots are in flight."""
+        return self._free.get(timeout=timeout)
+
+    def publish(self, slot):
+        self._ready.put(slot)
+
+    def finish(self):
+        """Tell the consumer that no more slots will be published."""
+        self._ready.put(_END)
+
+    def release(self, slot):
+        self._free.put(slot)
+
+    def __iter__(self):
+        while True:
+            slot = self._ready.get()
+            if slot == _END:
+                return
+            yield slot
+
+    def close(self):
+        self._frames = None
+        self._shm.close()
+        if self._owner == os.getpid():
+            self._shm.unlink()
+
+
+def _encode(ring, open_sink, result):
+    sink = open_sink()
+    count = 0
+    for slot in ring:
+        sink.write(ring[slot])
+        ring.release(slot)
+        count += 1
+    result.send((sink.release(), count))
+    result.close()
+    ring.close()
+
+
+class EncoderProcess:
+    """Write-only frame sink that runs ``open_sink()`` (e.g. a cv2.VideoWriter) in a child process.
+
+    ``write`` copies the frame into a ring slot and returns; only the slot
+    number is sent to the child. ``release`` waits for the child to encode
+    every frame and returns the sink's own ``release()`` result.
+    ``open_sink`` is pickled to the spawned child, so it must be importable
+    by name (e.g. a functools.partial of cv2.VideoWriter).
+    """
+
+    def __init__(self, open_sink, shape, slots=16):
+        ctx = multiprocessing.get_context('spawn')
+        self.frames = 0
+        self.ring = FrameRing(slots, shape, ctx=ctx)
+        self._result, child_end = ctx.Pipe(duplex=False)
+        self._proc = ctx.Process(target=_encode, args=(self.ring, open_sink, child_end), daemon=True)
+        self._proc.start()
+        child_end.close()
+
+    def write(self, frame):
+        while True:
+            try:
+                slot = self.ring.acquire(timeout=1.)
+                break
+            except queue.Empty:
+                if not self._proc.is_alive():
+                    self.ring.close()
+                    raise RuntimeError('encoder process exited with code {}'.format(self._proc.exitcode))
+        np.copyto(self.ring[slot], frame)
+        self.ring.publish(slot)
+        self.frames += 1
+
+    def release(self):
+        self.ring.finish()
+        try:
+            code, count = self._result.recv()
+        except EOFError:
+            raise RuntimeError('encoder process exited with code {}'.format(self._proc.exitcode))
+        finally:
+            self._proc.join()
+            self.ring.close()
+        if count != self.frames:
+            raise RuntimeError('encoder process wrote {} of {} frames'.format(count, self.frames))
+        return code
@@ -0,0 +1,198 @@
+"""Decoded frames in one uint8 file, memory-mapped by every stage and process that needs them.
+
+A store is a directory with:
+
+    frames.raw    N x H x W x 3 uint8 BGR frames, back to back
+    frames.json   {"count", "shape", "fps", "complete", ...}
+
+``FrameStoreWriter`` appends frames as they are decoded and republishes the
+header every ``publish_every`` frames. ``FrameStore`` maps the file as an
+``(N, H, W, 3)`` array. Indexing it gives views into the page cache, and
+pickling a FrameStore sends only its path, so detection workers, generation
+workers and the compositor in other processes share one decode without
+copying or pickling frames. ``refresh`` picks up frames written since the
+store was opened. A complete store is kept as a cache, keyed by
+``store_key``, and is reused when the same video is decoded again, e.g. by a
+retried job that passes the same upload digest.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+FRAMES_FILE = 'frames.raw'
+META_FILE = 'frames.json'
+
+
+def _replace_json(path, data):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def store_key(path, digest=None, **transform):
+    """Cache key for the frames of video ``path`` after ``transform`` (resize, crop, ...).
+
+    ``digest`` identifies the content, e.g. a hash taken when the video was
+    uploaded. Without it the file is identified by path, size and mtime, so
+    the video is never read just to key it.
+    """
+    if digest is None:
+        st = os.stat(path)
+        digest = '{}|{}|{}'.format(os.path.realpath(path), st.st_size, st.st_mtime_ns)
+    h = hashlib.sha256(digest.encode())
+    h.update(json.dumps(transform, sort_keys=True).encode())
+    return h.hexdigest()[:32]
+
+
+def read_meta(directory):
+    try:
+        with open(os.path.join(directory, META_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class FrameStoreWriter:
+    """Appends frames to a new store; gives up (and deletes the frames) beyond ``max_bytes``."""
+
+    def __init__(self, directory, max_bytes=None, publish_every=32, **info):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.publish_every = publish_every
+        self.info = info
+        self.count = 0
+        self.shape = None
+        self._path = os.path.join(directory, FRAMES_FILE)
+        self._file = open(self._path, 'wb')
+
+    @property
+    def ok(self):
+        return self._file is not None
+
+    def append(self, frame):
+        if self._file is None:
+            return False
+        if self.shape is None:
+            self.shape = tuple(frame.shape)
+        if tuple(frame.shape) != self.shape or (self.max_bytes and (self.count + 1) * frame.nbytes > self.max_bytes):
+            self.abandon()
+            return False
+        self._file.write(np.ascontiguousarray(frame, dtype=np.uint8).tobytes())
+        self.count += 1
+        if self.count % self.publish_every == 0:
+            self._publish(complete=False)
+        return True
+
+    def _publish(self, complete):
+        self._file.flush()
+        _replace_json(os.path.join(self.directory, META_FILE),
+                      dict(self.info, count=self.count, shape=list(self.shape or ()), complete=complete))
+
+    def abandon(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        for name in (FRAMES_FILE, META_FILE):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def close(self, move_to=None, **info):
+        """Mark the store complete; returns it opened read-only, or None if it was abandoned or empty.
+
+        ``info`` is added to the header, e.g. ``exhausted=False`` when
+        decoding stopped before the end of the video.
+        ``move_to`` renames the finished store into place. When another
+        process got there first, its store is kept and this one is dropped.
+        """
+        if self._file is None:
+            return None
+        self.info.update(info)
+        self._publish(complete=True)
+        self._file.close()
+        self._file = None
+        if move_to:
+            try:
+                os.rename(self.directory, move_to)
+            except OSError:
+                shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = move_to
+        return FrameStore.open(self.directory)
+
+
+class FrameStore:
+    """``(N, H, W, 3)`` uint8 memmap of a store; ``mode='r+'`` lets a stage write frames in place."""
+
+    def __init__(self, directory, mode='r'):
+        self.directory = directory
+        self.mode = mode
+        self.meta = {}
+        self.frames = None
+        self.refresh()
+
+    @classmethod
+    def open(cls, directory, mode='r', complete=True):
+        """The store in ``directory``, or None if there is none (or it is still being written and ``complete``)."""
+        meta = read_meta(directory)
+        if not meta or not meta.get('count') or (complete and not meta.get('complete')):
+            return None
+        os.utime(os.path.join(directory, META_FILE))  # last use, for prune
+        return cls(directory, mode)
+
+    def refresh(self):
+        """Re-read the header and map any frames appended since."""
+        self.meta = read_meta(self.directory) or {'count': 0, 'shape': []}
+        if self.meta['count']:
+            shape = (self.meta['count'],) + tuple(self.meta['shape'])
+            self.frames = np.memmap(os.path.join(self.directory, FRAMES_FILE), dtype=np.uint8, mode=self.mode,
+                                    shape=shape)
+        return self
+
+    @property
+    def complete(self):
+        return bool(self.meta.get('complete'))
+
+    def covers(self, count):
+        """Whether the store has ``count`` frames, or all the frames there are (the video ended first)."""
+        return len(self) >= count or self.meta.get('exhausted', True)
+
+    def __len__(self):
+        return 0 if self.frames is None else len(self.frames)
+
+    def __getitem__(self, idx):
+        return self.frames[idx]
+
+    def __getstate__(self):
+        # Only the location crosses process boundaries; the receiver maps the same file.
+        return {'directory': self.directory, 'mode': self.mode}
+
+    def __setstate__(self, state):
+        self.__init__(state['directory'], state['mode'])
+
+
+def prune(root, max_bytes, keep=()):
+    """Delete the least recently used stores under ``root`` until they fit in ``max_bytes``."""
+    stores = []
+    for name in os.listdir(root):
+        directory = os.path.join(root, name)
+        try:
+            used = os.stat(os.path.join(directory, META_FILE)).st_mtime
+            size = os.stat(os.path.join(directory, FRAMES_FILE)).st_size
+        except OSError:
+            continue
+        stores.append((used, size, directory))
+    total = sum(size for _, size, _ in stores)
+    for _, size, directory in sorted(stores):
+        if total <= max_bytes:
+            break
+        if directory in keep:
+            continue
+        shutil.rmtree(directory, ignore_errors=True)
+        total -= size
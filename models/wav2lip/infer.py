@@ -1,11 +1,14 @@
 from os import listdir, path
 import numpy as np
 import scipy, cv2, os, sys, argparse, audio
-import json, subprocess, random, string
+import json, subprocess, random, string, functools, shutil, time, tempfile
 from tqdm import tqdm
 from glob import glob
 import torch, face_detection
 from models import Wav2Lip
+from batching import Wav2LipBatch
+from stage_profiler import StageProfiler
+import autobatch, smoothing, stream_sink, melchunks, audiocache, keyframes, artifacts, framestore, framering, zygote, weights
 import platform
 
 parser = argparse.ArgumentParser(description='Inference code to lip-sync videos in the wild using Wav2Lip models')
@@ -19,6 +22,9 @@ parser.add_argument('--audio', type=str,
 					help='Filepath of video/audio file to use as raw audio source', required=True)
 parser.add_argument('--outfile', type=str, help='Video path to save result. See default for an e.g.', 
 								default='results/result_voice.mp4')
+parser.add_argument('--tmp_dir', type=str, default=None,
+					help='Directory for this render\'s intermediate files (extracted audio, silent video). '
+					'Default: a new directory under temp/, removed once the render succeeds')
 
 parser.add_argument('--static', type=bool, 
 					help='If True, then use only first video frame for inference', default=False)
@@ -28,12 +34,30 @@ parser.add_argument('--fps', type=float, help='Can be specified only if input is
 parser.add_argument('--pads', nargs='+', type=int, default=[0, 10, 0, 0], 
 					help='Padding (top, bottom, left, right). Please adjust to include chin at least')
 
+parser.add_argument('--detector_path', type=str, default=None,
+					help='Path to the S3FD weights (default: face_detection/detection/sfd/s3fd.pth, downloaded if missing)')
 parser.add_argument('--face_det_batch_size', type=int, 
 					help='Batch size for face detection', default=16)
 parser.add_argument('--wav2lip_batch_size', type=int, help='Batch size for Wav2Lip model(s)', default=128)
+parser.add_argument('--auto_batch', default=False, action='store_true',
+					help='Derive both batch sizes from a memory budget and pick the fastest one per resolution bucket. '
+					'Overrides --face_det_batch_size and --wav2lip_batch_size')
+parser.add_argument('--mem_budget_mb', type=int, default=None,
+					help='Activation memory budget per stage for --auto_batch (default: 80%% of free device memory)')
+parser.add_argument('--autotune_cache', type=str, default=os.path.expanduser('~/.cache/lip2sync/autobatch.json'),
+					help='JSON file where --auto_batch remembers the tuned batch sizes for this node')
 
 parser.add_argument('--resize_factor', default=1, type=int, 
 			help='Reduce the resolution by this factor. Sometimes, best results are obtained at 480p or 720p')
+parser.add_argument('--frame_step', default=1, type=int,
+					help='Keep every n-th video frame and render at fps / n, e.g. for quick low-fps previews')
+parser.add_argument('--detect_scale', default=1., type=float,
+					help='Run face detection on frames scaled by this factor (e.g. 0.5) and scale the boxes back')
+
+parser.add_argument('--proxy_height', type=int, default=None,
+					help='Work like a render at this height (e.g. 480) but output at full resolution: faces are detected on '
+					'frames scaled down to it, padding and face crops match that height, and the mouths are pasted into the '
+					'full-resolution frames')
 
 parser.add_argument('--crop', nargs='+', type=int, default=[0, -1, 0, -1], 
 					help='Crop video to a smaller region (top, bottom, left, right). Applied after resize_factor and rotate arg. ' 
@@ -47,8 +71,68 @@ parser.add_argument('--rotate', default=False, action='store_true',
 					help='Sometimes videos taken from a phone can be flipped 90deg. If true, will flip video right by 90deg.'
 					'Use if you get a flipped result, despite feeding a normal looking video')
 
+parser.add_argument('--threads', type=int, default=int(os.environ.get('LIP2SYNC_THREADS', 0)),
+					help='Threads for torch, OpenCV and ffmpeg (default: $LIP2SYNC_THREADS, 0 = library defaults)')
+
+parser.add_argument('--profile_out', type=str, default=None,
+					help='Write a JSON report with wall time, CPU time and peak RSS per pipeline stage to this path')
+parser.add_argument('--torch_trace', type=str, default=None,
+					help='Write a torch.profiler Chrome trace of the generation loop to this path')
+
 parser.add_argument('--nosmooth', default=False, action='store_true',
 					help='Prevent smoothing face detections over a short temporal window')
+parser.add_argument('--smooth', type=str, default='window', choices=smoothing.MODES,
+					help='How face detections are smoothed over time. "legacy" reproduces the original in-place smoothing')
+parser.add_argument('--smooth_window', type=int, default=5,
+					help='Number of frames in the smoothing window')
+
+parser.add_argument('--keyframe_interval', type=int, default=1,
+					help='Throughput mode: run Wav2Lip on every k-th frame only and interpolate the predicted faces in between. '
+					'Compositing and the output stay at full fps; 1 = a forward pass for every frame')
+
+parser.add_argument('--stream_mel', default=False, action='store_true',
+					help='Compute the mel spectrogram block by block while generating instead of for the whole audio up front. '
+					'Same windows to ~1e-15; memory no longer grows with the audio length. Needs mono audio at 16 kHz')
+
+parser.add_argument('--audio_cache', type=str, default=os.environ.get('LIP2SYNC_AUDIO_CACHE') or None,
+					help='Directory caching the mel spectrogram and audio embeddings per audio file (by content), so '
+					'repeated audio runs only the face encoder and decoder (default: $LIP2SYNC_AUDIO_CACHE, off if unset)')
+parser.add_argument('--audio_cache_mb', type=int, default=256,
+					help='In-memory part of --audio_cache; least recently used entries beyond it are spilled to disk')
+
+parser.add_argument('--frame_store', type=str, default=os.environ.get('LIP2SYNC_FRAME_STORE') or None,
+					help='Directory where decoded (resized, cropped) frames are kept as memory-mapped stores, one per video '
+					'content and frame options, so every stage shares one decode and a retry skips it '
+					'(default: $LIP2SYNC_FRAME_STORE, off if unset; see framestore.py)')
+parser.add_argument('--frame_store_mb', type=int, default=8192,
+					help='Least recently used stores in --frame_store beyond this size are deleted')
+parser.add_argument('--face_digest', type=str, default=None,
+					help='Content hash of --face taken by the caller (e.g. at upload). Keys --frame_store by content, so '
+					'a retry with a new copy of the video finds its store; without it the store is keyed by path, size and mtime')
+
+parser.add_argument('--save_artifacts', type=str, default=None,
+					help='Keep the decoded frames, face boxes and mel spectrogram in this directory for a later render '
+					'of the same inputs (see artifacts.py)')
+parser.add_argument('--reuse_artifacts', type=str, default=None,
+					help='Directory written by --save_artifacts; its frames, boxes and mel are used instead of recomputing them')
+parser.add_argument('--artifact_frames_mb', type=int, default=2048,
+					help='Decoded frames larger than this are not kept by --save_artifacts')
+parser.add_argument('--encoder_preset', type=str, default=None,
+					help='libx264 preset for the output, e.g. ultrafast for previews (default: ffmpeg\'s / veryfast when streaming)')
+
+parser.add_argument('--encode_process', default=False, action='store_true',
+					help='Encode the result in a child process fed through a shared-memory ring of frames, so encoding '
+					'overlaps generation on another core. --stream_dir already encodes in a separate ffmpeg process')
+parser.add_argument('--ring_slots', type=int, default=32,
+					help='Frames in flight between generation and the --encode_process encoder')
+
+parser.add_argument('--stream_dir', type=str, default=None,
+					help='Also stream the result into this directory while rendering (HLS playlist or fragmented MP4). '
+					'Faces are then detected just ahead of generation instead of for the whole video up front')
+parser.add_argument('--stream_format', type=str, default='hls', choices=stream_sink.FORMATS,
+					help='Container for --stream_dir')
+parser.add_argument('--segment_seconds', type=float, default=2.,
+					help='Target HLS segment length for --stream_dir; the first segment is cut after one second')
 
 args = parser.parse_args()
 args.img_size = 96
@@ -56,225 +140,519 @@ args.img_size = 96
 if os.path.isfile(args.face) and args.face.split('.')[1] in ['jpg', 'png', 'jpeg']:
 	args.static = True
 
-def get_smoothened_boxes(boxes, T):
-	for i in range(len(boxes)):
-		if i + T > len(boxes):
-			window = boxes[len(boxes) - T:]
-		else:
-			window = boxes[i : i + T]
-		boxes[i] = np.mean(window, axis=0)
-	return boxes
+ffmpeg_threads = ''
+if args.threads > 0:
+	torch.set_num_threads(args.threads)
+	torch.set_num_interop_threads(1)
+	cv2.setNumThreads(args.threads)
+	ffmpeg_threads = '-threads {} '.format(args.threads)
 
-def face_detect(images):
-	detector = face_detection.FaceAlignment(face_detection.LandmarksType._2D, 
-											flip_input=False, device=device)
+def load_detector(images):
+	detector = face_detection.get_face_alignment(device=device, path_to_detector=args.detector_path)
 
 	batch_size = args.face_det_batch_size
-	
-	while 1:
-		predictions = []
+	if args.auto_batch:
+		h, w = (int(d * args.detect_scale) for d in images[0].shape[:2])
+		batch_size = autobatch.tune_s3fd(detector, h, w, device, tuner, autobatch.memory_budget(device, args.mem_budget_mb),
+										max_items=len(images))
+		print('Face detection batch size: {}'.format(batch_size))
+	return detector, batch_size
+
+def use_proxy(frame):
+	"""--proxy_height: detect and crop faces as a render at that height would, keeping ``frame``'s resolution."""
+	scale = args.proxy_height / float(frame.shape[0])
+	if scale >= 1: return
+	args.detect_scale *= scale
+	args.pads = [int(round(p / scale)) for p in args.pads]
+	print('Detecting faces at {}p; the output stays at {}p'.format(args.proxy_height, frame.shape[0]))
+
+def detection_batch(images):
+	if args.detect_scale == 1:
+		return np.array(images)
+	return np.array([cv2.resize(image, None, fx=args.detect_scale, fy=args.detect_scale,
+								interpolation=cv2.INTER_AREA) for image in images])
+
+def unscale_rect(rect):
+	if rect is None or args.detect_scale == 1:
+		return rect
+	return tuple(int(round(v / args.detect_scale)) for v in rect)
+
+def detect_rects(detector, images, batch_size, progress=None):
+	# On OOM, halve the batch and carry on from the current frame instead of starting over.
+	predictions = []
+	while len(predictions) < len(images):
+		i = len(predictions)
 		try:
-			for i in tqdm(range(0, len(images), batch_size)):
-				predictions.extend(detector.get_detections_for_batch(np.array(images[i:i + batch_size])))
+			rects = detector.get_detections_for_batch(detection_batch(images[i:i + batch_size]))
+			predictions.extend(unscale_rect(rect) for rect in rects)
 		except RuntimeError:
 			if batch_size == 1: 
 				raise RuntimeError('Image too big to run face detection on GPU. Please use the --resize_factor argument')
 			batch_size //= 2
+			if device == 'cuda': torch.cuda.empty_cache()
 			print('Recovering from OOM error; New batch size: {}'.format(batch_size))
 			continue
-		break
+		if progress is not None: progress.update(len(predictions) - i)
+	return predictions, batch_size
+
+def pad_rect(rect, image):
+	if rect is None:
+		cv2.imwrite(temp_path('faulty_frame.jpg'), image) # check this frame where the face was not detected.
+		raise ValueError('Face not detected! Ensure the video contains a face in all the frames.')
 
-	results = []
 	pady1, pady2, padx1, padx2 = args.pads
-	for rect, image in zip(predictions, images):
-		if rect is None:
-			cv2.imwrite('temp/faulty_frame.jpg', image) # check this frame where the face was not detected.
-			raise ValueError('Face not detected! Ensure the video contains a face in all the frames.')
-
-		y1 = max(0, rect[1] - pady1)
-		y2 = min(image.shape[0], rect[3] + pady2)
-		x1 = max(0, rect[0] - padx1)
-		x2 = min(image.shape[1], rect[2] + padx2)
-		
-		results.append([x1, y1, x2, y2])
-
-	boxes = np.array(results)
-	if not args.nosmooth: boxes = get_smoothened_boxes(boxes, T=5)
+	y1 = max(0, rect[1] - pady1)
+	y2 = min(image.shape[0], rect[3] + pady2)
+	x1 = max(0, rect[0] - padx1)
+	x2 = min(image.shape[1], rect[2] + padx2)
+	return [x1, y1, x2, y2]
+
+def saved_rects(count):
+	"""Boxes for the first ``count`` frames from --reuse_artifacts, or None."""
+	if not args.reuse_artifacts:
+		return None
+	rects = artifacts.load_rects(args.reuse_artifacts, np.arange(count) * args.frame_step, args.resize_factor)
+	count_lookup('artifacts', rects is not None)
+	return rects
+
+def save_rects(predictions):
+	if args.save_artifacts and not args.static:
+		artifacts.save_rects(args.save_artifacts, np.arange(len(predictions)) * args.frame_step, predictions,
+							args.resize_factor)
+
+def face_detect(images, fps):
+	predictions = saved_rects(len(images))
+	if predictions is not None:
+		print('Using the face boxes of {}'.format(args.reuse_artifacts))
+	else:
+		detector, batch_size = load_detector(images)
+		with tqdm(total=len(images)) as progress:
+			predictions, _ = detect_rects(detector, images, batch_size, progress)
+
+	boxes = np.array([pad_rect(rect, image) for rect, image in zip(predictions, images)])
+	save_rects(predictions)
+	if not args.nosmooth: boxes = smoothing.smooth_boxes(boxes, T=args.smooth_window, mode=args.smooth, fps=fps)
 	results = [[image[y1: y2, x1:x2], (y1, y2, x1, x2)] for image, (x1, y1, x2, y2) in zip(images, boxes)]
 
-	del detector
 	return results 
 
-def datagen(frames, mels):
-	img_batch, mel_batch, frame_batch, coords_batch = [], [], [], []
-
+class IncrementalFaceDetections:
+	"""face_detect results as a list that fills in as it is read, for --stream_dir.
+
+	Each read past the end detects the next batch of frames, so generation
+	starts after the first batch instead of after the whole video. Boxes are
+	released once their smoothing window is complete, which keeps the result
+	identical to face_detect. The detection time is charged to the
+	face_detection stage, nested inside batch_prep.
+	"""
+
+	def __init__(self, images, fps):
+		self.images = images
+		self.results = []
+		self.detector, self.batch_size = load_detector(images)
+		self.detected = 0
+		self.rects = []
+		self.smoother = None
+		if not args.nosmooth:
+			self.smoother = smoothing.StreamingSmoother(T=args.smooth_window, mode=args.smooth, fps=fps)
+
+	def __len__(self):
+		return len(self.images)
+
+	def __getitem__(self, idx):
+		if idx >= len(self.images): raise IndexError(idx)
+		while idx >= len(self.results):
+			with profiler.stage('face_detection'):
+				self._advance()
+		return self.results[idx]
+
+	def _advance(self):
+		chunk = self.images[self.detected:self.detected + self.batch_size]
+		predictions, self.batch_size = detect_rects(self.detector, chunk, self.batch_size)
+		boxes = [pad_rect(rect, image) for rect, image in zip(predictions, chunk)]
+		self.detected += len(chunk)
+		self.rects += predictions
+		if self.detected == len(self.images): save_rects(self.rects)
+
+		if self.smoother is not None:
+			boxes = self.smoother.push(np.array(boxes))
+			if self.detected == len(self.images): boxes += self.smoother.flush()
+		for x1, y1, x2, y2 in boxes:
+			image = self.images[len(self.results)]
+			self.results.append([image[y1: y2, x1:x2], (y1, y2, x1, x2)])
+
+def detect_faces(frames, fps):
 	if args.box[0] == -1:
-		if not args.static:
-			face_det_results = face_detect(frames) # BGR2RGB for CNN face detection
-		else:
-			face_det_results = face_detect([frames[0]])
-	else:
-		print('Using the specified bounding box instead of face detection...')
-		y1, y2, x1, x2 = args.box
-		face_det_results = [[f[y1: y2, x1:x2], (y1, y2, x1, x2)] for f in frames]
-
-	for i, m in enumerate(mels):
+		images = frames if not args.static else [frames[0]] # BGR2RGB for CNN face detection
+		if args.stream_dir and not (args.reuse_artifacts and os.path.exists(os.path.join(args.reuse_artifacts, artifacts.RECTS_FILE))):
+			return IncrementalFaceDetections(images, fps)
+		return face_detect(images, fps)
+
+	print('Using the specified bounding box instead of face detection...')
+	y1, y2, x1, x2 = args.box
+	return [[f[y1: y2, x1:x2], (y1, y2, x1, x2)] for f in frames]
+
+def prepare_batch(batch, mels, stop):
+	# Precomputed windows are gathered into the batch buffer in one step; streamed ones were added per frame.
+	if isinstance(mels, melchunks.MelWindows):
+		mels.gather(stop - len(batch), stop, out=batch.mel_input[:len(batch), 0])
+	return batch.prepare()
+
+def datagen(frames, mels, face_det_results, batch_size=None):
+	# Crops from full-resolution frames (--proxy_height) are area-averaged down to the model input.
+	batch = Wav2LipBatch(batch_size or args.wav2lip_batch_size, args.img_size,
+						downscale=cv2.INTER_AREA if args.proxy_height else cv2.INTER_LINEAR)
+	frame_batch, coords_batch = [], []
+	indexed = isinstance(mels, melchunks.MelWindows)
+
+	for i, m in enumerate(range(len(mels)) if indexed else mels):
 		idx = 0 if args.static else i%len(frames)
 		frame_to_save = frames[idx].copy()
-		face, coords = face_det_results[idx].copy()
+		face, coords = face_det_results[idx]
 
-		face = cv2.resize(face, (args.img_size, args.img_size))
-			
-		img_batch.append(face)
-		mel_batch.append(m)
+		batch.add(face, None if indexed else m)
 		frame_batch.append(frame_to_save)
 		coords_batch.append(coords)
 
-		if len(img_batch) >= args.wav2lip_batch_size:
-			img_batch, mel_batch = np.asarray(img_batch), np.asarray(mel_batch)
-
-			img_masked = img_batch.copy()
-			img_masked[:, args.img_size//2:] = 0
-
-			img_batch = np.concatenate((img_masked, img_batch), axis=3) / 255.
-			mel_batch = np.reshape(mel_batch, [len(mel_batch), mel_batch.shape[1], mel_batch.shape[2], 1])
-
+		if batch.full():
+			img_batch, mel_batch = prepare_batch(batch, mels, i + 1)
 			yield img_batch, mel_batch, frame_batch, coords_batch
-			img_batch, mel_batch, frame_batch, coords_batch = [], [], [], []
-
-	if len(img_batch) > 0:
-		img_batch, mel_batch = np.asarray(img_batch), np.asarray(mel_batch)
-
-		img_masked = img_batch.copy()
-		img_masked[:, args.img_size//2:] = 0
-
-		img_batch = np.concatenate((img_masked, img_batch), axis=3) / 255.
-		mel_batch = np.reshape(mel_batch, [len(mel_batch), mel_batch.shape[1], mel_batch.shape[2], 1])
+			batch.reset()
+			frame_batch, coords_batch = [], []
 
+	if len(batch) > 0:
+		img_batch, mel_batch = prepare_batch(batch, mels, len(mels))
 		yield img_batch, mel_batch, frame_batch, coords_batch
 
+def paste_back(pred, frame, coords):
+	y1, y2, x1, x2 = coords
+	frame[y1:y2, x1:x2] = cv2.resize(pred.astype(np.uint8), (x2 - x1, y2 - y1))
+	return frame
+
 mel_step_size = 16
 device = 'cuda' if torch.cuda.is_available() else 'cpu'
 print('Using {} for inference.'.format(device))
-
-def _load(checkpoint_path):
-	if device == 'cuda':
-		checkpoint = torch.load(checkpoint_path)
-	else:
-		checkpoint = torch.load(checkpoint_path,
-								map_location=lambda storage, loc: storage)
-	return checkpoint
+tuner = autobatch.AutoTuner(args.autotune_cache) if args.auto_batch else None
+# Without --audio_cache, a render that saves or reuses artifacts keeps its mel spectrogram with them.
+if not args.audio_cache and (args.save_artifacts or args.reuse_artifacts):
+	args.audio_cache = artifacts.audio_dir(args.save_artifacts or args.reuse_artifacts)
+audio_cache = audiocache.AudioCache(args.audio_cache, args.audio_cache_mb << 20) if args.audio_cache else None
+profiler = StageProfiler()
+ffmpeg_failures = []
+cache_lookups = {}  # cache -> {'hit': n, 'miss': n}, reported for the API's cache metrics
+
+def count_lookup(cache, hit):
+	counts = cache_lookups.setdefault(cache, {'hit': 0, 'miss': 0})
+	counts['hit' if hit else 'miss'] += 1
 
 def load_model(path):
-	model = Wav2Lip()
-	print("Load checkpoint from: {}".format(path))
-	checkpoint = _load(path)
-	s = checkpoint["state_dict"]
-	new_s = {}
-	for k, v in s.items():
-		new_s[k.replace('module.', '')] = v
-	model.load_state_dict(new_s)
+	# Forked by zygote.py: the weights are already in memory, shared with the zygote.
+	model = zygote.preloaded_model(path)
+	if model is not None:
+		print("Using the preloaded checkpoint: {}".format(path))
+		return model.to(device).eval()
+
+	# A converted .safetensors checkpoint is mapped: one physical copy for every worker on the node.
+	print("Load checkpoint from: {}".format(weights.resolve(path)))
+	model = weights.load_into(Wav2Lip(), path)
 
 	model = model.to(device)
 	return model.eval()
 
-def main():
+def video_frames(video_stream):
+	while 1:
+		still_reading, frame = video_stream.read()
+		if not still_reading:
+			return
+		yield frame
+
+def frame_store_dir():
+	"""Where --frame_store keeps the frames of --face as this render would decode them."""
+	key = framestore.store_key(args.face, args.face_digest, resize_factor=args.resize_factor, rotate=args.rotate,
+								crop=args.crop, frame_step=args.frame_step)
+	return os.path.join(args.frame_store, key)
+
+def is_image():
 	if not os.path.isfile(args.face):
 		raise ValueError('--face argument must be a valid path to video/image file')
-
-	elif args.face.split('.')[1] in ['jpg', 'png', 'jpeg']:
-		full_frames = [cv2.imread(args.face)]
-		fps = args.fps
-
+	return args.face.split('.')[1] in ['jpg', 'png', 'jpeg']
+
+def output_fps():
+	"""fps of the rendered video, known before any frame is decoded."""
+	if is_image():
+		return args.fps / args.frame_step
+	video_stream = cv2.VideoCapture(args.face)
+	fps = video_stream.get(cv2.CAP_PROP_FPS)
+	video_stream.release()
+	return fps / args.frame_step
+
+def read_frames(count):
+	"""The first ``count`` frames of --face, or all of them if the video is shorter; only these are decoded.
+
+	A static face needs its first frame only. Audio longer than the video
+	loops over these frames by index (see datagen).
+	"""
+	if is_image():
+		return [cv2.imread(args.face)]
+	if args.static:
+		count = 1
+
+	store_dir = frame_store_dir() if args.frame_store else None
+	store = framestore.FrameStore.open(store_dir) if store_dir else None
+	if store_dir: count_lookup('frame_store', store is not None and store.covers(count))
+	if store is not None and store.covers(count):
+		print('Using the decoded frames in {}'.format(store_dir))
+		return store.frames[:count]
+	if store is not None:
+		# Decoded for shorter audio; decode again, further this time.
+		shutil.rmtree(store_dir, ignore_errors=True)
+
+	# --save_artifacts records source frames, so the stop point is counted in source frames.
+	needed = count * args.frame_step
+	source = artifacts.load_frames(args.reuse_artifacts, needed) if args.reuse_artifacts else None
+	if args.reuse_artifacts: count_lookup('artifacts', source is not None)
+	video_stream = None
+	recorder = None
+	if source is not None:
+		print('Using the decoded frames of {}'.format(args.reuse_artifacts))
 	else:
+		print('Reading video frames...')
 		video_stream = cv2.VideoCapture(args.face)
-		fps = video_stream.get(cv2.CAP_PROP_FPS)
+		source = video_frames(video_stream)
+		if args.save_artifacts:
+			recorder = artifacts.frame_writer(args.save_artifacts, args.artifact_frames_mb << 20)
+
+	# With --frame_store, frames are written straight to the store instead of being kept in memory.
+	writer = None
+	if store_dir:
+		writer = framestore.FrameStoreWriter('{}.{}.tmp'.format(store_dir, os.getpid()), fps=output_fps())
+
+	full_frames = []
+	exhausted = True
+	for index, frame in enumerate(source):
+		if index == needed:
+			exhausted = False
+			break
+		if recorder is not None: recorder.append(frame)
+		if index % args.frame_step: continue
+		if args.resize_factor > 1:
+			frame = cv2.resize(frame, (frame.shape[1]//args.resize_factor, frame.shape[0]//args.resize_factor))
 
-		print('Reading video frames...')
+		if args.rotate:
+			frame = cv2.rotate(frame, cv2.cv2.ROTATE_90_CLOCKWISE)
 
-		full_frames = []
-		while 1:
-			still_reading, frame = video_stream.read()
-			if not still_reading:
-				video_stream.release()
-				break
-			if args.resize_factor > 1:
-				frame = cv2.resize(frame, (frame.shape[1]//args.resize_factor, frame.shape[0]//args.resize_factor))
+		y1, y2, x1, x2 = args.crop
+		if x2 == -1: x2 = frame.shape[1]
+		if y2 == -1: y2 = frame.shape[0]
 
-			if args.rotate:
-				frame = cv2.rotate(frame, cv2.cv2.ROTATE_90_CLOCKWISE)
+		frame = frame[y1:y2, x1:x2]
 
-			y1, y2, x1, x2 = args.crop
-			if x2 == -1: x2 = frame.shape[1]
-			if y2 == -1: y2 = frame.shape[0]
+		if writer is not None:
+			writer.append(frame)
+		else:
+			full_frames.append(frame)
 
-			frame = frame[y1:y2, x1:x2]
+	if video_stream is not None: video_stream.release()
+	if recorder is not None: recorder.close(exhausted=exhausted)
+	if writer is not None:
+		store = writer.close(move_to=store_dir, exhausted=exhausted)
+		if store is None:
+			raise ValueError('Could not store the frames of {} in {}'.format(args.face, store_dir))
+		framestore.prune(args.frame_store, args.frame_store_mb << 20, keep=(store_dir,))
+		return store.frames[:count]
+	return full_frames
 
-			full_frames.append(frame)
+def temp_path(name):
+	return os.path.join(args.tmp_dir, name)
 
-	print ("Number of frames available for inference: "+str(len(full_frames)))
+def main():
+	# Renders run side by side in one working directory, so each keeps its intermediates apart.
+	own_tmp_dir = args.tmp_dir is None
+	if own_tmp_dir:
+		os.makedirs('temp', exist_ok=True)
+		args.tmp_dir = tempfile.mkdtemp(prefix='render_', dir='temp')
+	else:
+		os.makedirs(args.tmp_dir, exist_ok=True)
 
-	if not args.audio.endswith('.wav'):
-		print('Extracting raw audio...')
-		command = 'ffmpeg -y -i {} -strict -2 {}'.format(args.audio, 'temp/temp.wav')
+	fps = output_fps()
 
-		subprocess.call(command, shell=True)
-		args.audio = 'temp/temp.wav'
+	mel = None
+	if audio_cache is not None:
+		with profiler.stage('audio_cache'):
+			audio_digest = audiocache.file_digest(args.audio)
+			mel = audio_cache.get(audiocache.mel_key(audio_digest))
+		if mel is not None:
+			print('Using the cached mel spectrogram of {}'.format(args.audio))
+		if args.stream_mel:
+			print('--audio_cache keeps the whole spectrogram; ignoring --stream_mel')
 
-	wav = audio.load_wav(args.audio, 16000)
-	mel = audio.melspectrogram(wav)
-	print(mel.shape)
+	if mel is None and not args.audio.endswith('.wav'):
+		print('Extracting raw audio...')
+		command = 'ffmpeg -y -i {} -strict -2 {}{}'.format(args.audio, ffmpeg_threads, temp_path('temp.wav'))
+
+		with profiler.stage('audio_extract'):
+			if subprocess.call(command, shell=True) != 0: ffmpeg_failures.append('audio_extract')
+		args.audio = temp_path('temp.wav')
+
+	stream_mel = args.stream_mel and audio_cache is None
+	if stream_mel and not melchunks.can_stream(args.audio):
+		print('--stream_mel needs mono {} Hz audio; computing the whole spectrogram instead'.format(16000))
+	if stream_mel and melchunks.can_stream(args.audio):
+		# Windows are computed lazily inside datagen; their time is charged to the mel stage.
+		mel_chunks = melchunks.MelChunkStream(args.audio, fps, stage=profiler.stage)
+	else:
+		if mel is None:
+			with profiler.stage('mel'):
+				wav = audio.load_wav(args.audio, 16000)
+				mel = audio.melspectrogram(wav)
 
-	if np.isnan(mel.reshape(-1)).sum() > 0:
-		raise ValueError('Mel contains nan! Using a TTS voice? Add a small epsilon noise to the wav file and try again')
+			if np.isnan(mel.reshape(-1)).sum() > 0:
+				raise ValueError('Mel contains nan! Using a TTS voice? Add a small epsilon noise to the wav file and try again')
+			if audio_cache is not None:
+				audio_cache.put(audiocache.mel_key(audio_digest), mel.astype(np.float32))
+		print(mel.shape)
 
-	mel_chunks = []
-	mel_idx_multiplier = 80./fps 
-	i = 0
-	while 1:
-		start_idx = int(i * mel_idx_multiplier)
-		if start_idx + mel_step_size > len(mel[0]):
-			mel_chunks.append(mel[:, len(mel[0]) - mel_step_size:])
-			break
-		mel_chunks.append(mel[:, start_idx : start_idx + mel_step_size])
-		i += 1
+		mel_chunks = melchunks.MelWindows(mel, fps, mel_step_size)
 
 	print("Length of mel chunks: {}".format(len(mel_chunks)))
 
-	full_frames = full_frames[:len(mel_chunks)]
+	# Frames past the end of the audio are never decoded.
+	with profiler.stage('decode'):
+		full_frames = read_frames(len(mel_chunks))
 
-	batch_size = args.wav2lip_batch_size
-	gen = datagen(full_frames.copy(), mel_chunks)
+	print ("Number of frames available for inference: "+str(len(full_frames)))
+	if args.proxy_height: use_proxy(full_frames[0])
+
+	frame_h, frame_w = full_frames[0].shape[:-1]
+	encoder = None
+	if args.encode_process and not args.stream_dir:
+		# Started here: the spawned child re-imports this script, which overlaps model loading and face detection.
+		open_writer = functools.partial(cv2.VideoWriter, temp_path('result.avi'), cv2.VideoWriter_fourcc(*'DIVX'), fps,
+										(frame_w, frame_h))
+		encoder = framering.EncoderProcess(open_writer, (frame_h, frame_w, 3), args.ring_slots)
+
+	with profiler.stage('model_load'):
+		model = load_model(args.checkpoint_path)
+	print ("Model loaded")
+
+	if args.auto_batch:
+		with profiler.stage('autotune'):
+			args.wav2lip_batch_size = autobatch.tune_wav2lip(model, device, tuner,
+									autobatch.memory_budget(device, args.mem_budget_mb), args.img_size, max_items=len(mel_chunks))
+		print('Wav2Lip batch size: {}'.format(args.wav2lip_batch_size))
+
+	embeddings = None
+	if audio_cache is not None:
+		emb_key = audiocache.embedding_key(audio_digest, fps, audiocache.checkpoint_tag(args.checkpoint_path))
+		with profiler.stage('audio_cache'):
+			embeddings = audio_cache.get(emb_key)
+		if embeddings is None:
+			with profiler.stage('audio_embed'):
+				embeddings = audiocache.compute_embeddings(model, mel_chunks, device, args.wav2lip_batch_size)
+			audio_cache.put(emb_key, embeddings)
+		else:
+			print('Using cached audio embeddings; running only the face encoder and decoder')
+
+	with profiler.stage('face_detection'):
+		face_det_results = detect_faces(full_frames, fps)
+
+	# With keyframes, each prepared batch holds keyframe_interval x batch_size frames so the forward batch stays full.
+	interp = None
+	if args.keyframe_interval > 1:
+		interp = keyframes.KeyframeInterpolator(len(mel_chunks), args.keyframe_interval)
+	batch_size = args.wav2lip_batch_size * max(1, args.keyframe_interval)
+	gen = profiler.iterate('batch_prep', datagen(full_frames, mel_chunks, face_det_results, batch_size))
+
+	if args.stream_dir:
+		out = stream_sink.StreamSink(args.stream_dir, frame_w, frame_h, fps, args.audio, args.stream_format,
+									args.segment_seconds, threads=args.threads, preset=args.encoder_preset or 'veryfast')
+	elif encoder is not None:
+		out = encoder
+	else:
+		out = cv2.VideoWriter(temp_path('result.avi'), 
+								cv2.VideoWriter_fourcc(*'DIVX'), fps, (frame_w, frame_h))
 
+	trace = None
+	if args.torch_trace:
+		activities = [torch.profiler.ProfilerActivity.CPU]
+		if device == 'cuda': activities.append(torch.profiler.ProfilerActivity.CUDA)
+		trace = torch.profiler.profile(activities=activities)
+		trace.start()
+
+	done = 0
 	for i, (img_batch, mel_batch, frames, coords) in enumerate(tqdm(gen, 
 											total=int(np.ceil(float(len(mel_chunks))/batch_size)))):
+		keys = interp.keyframe_mask(done, len(frames)) if interp is not None else slice(None)
+		with profiler.stage('wav2lip_forward'):
+			img_batch = torch.from_numpy(img_batch[keys]).to(device)
+
+			with torch.no_grad():
+				if embeddings is not None:
+					emb_batch = torch.from_numpy(embeddings[done:done + len(frames)][keys]).to(device)
+					pred = model.decode_embedding(emb_batch[:, :, None, None], model.encode_face(img_batch))
+				else:
+					mel_batch = torch.from_numpy(mel_batch[keys]).to(device)
+					pred = model(mel_batch, img_batch)
+
+			pred = pred.cpu().numpy().transpose(0, 2, 3, 1) * 255.
+
+		ready = zip(pred, frames, coords)
+		if interp is not None:
+			with profiler.stage('interpolate'):
+				key_preds = iter(pred)
+				ready = []
+				for j, (f, c) in enumerate(zip(frames, coords)):
+					ready += interp.push(done + j, f, c, next(key_preds) if keys[j] else None)
+		done += len(frames)
+
+		for p, f, c in ready:
+			with profiler.stage('paste_back'):
+				paste_back(p, f, c)
+			with profiler.stage('encode'):
+				out.write(f)
 		if i == 0:
-			model = load_model(args.checkpoint_path)
-			print ("Model loaded")
-
-			frame_h, frame_w = full_frames[0].shape[:-1]
-			out = cv2.VideoWriter('temp/result.avi', 
-									cv2.VideoWriter_fourcc(*'DIVX'), fps, (frame_w, frame_h))
-
-		img_batch = torch.FloatTensor(np.transpose(img_batch, (0, 3, 1, 2))).to(device)
-		mel_batch = torch.FloatTensor(np.transpose(mel_batch, (0, 3, 1, 2))).to(device)
+			profiler.count('first_frame_s', round(profiler.elapsed(), 4))
+			profiler.count('first_frame_at', time.time())
 
-		with torch.no_grad():
-			pred = model(mel_batch, img_batch)
-
-		pred = pred.cpu().numpy().transpose(0, 2, 3, 1) * 255.
-		
-		for p, f, c in zip(pred, frames, coords):
-			y1, y2, x1, x2 = c
-			p = cv2.resize(p.astype(np.uint8), (x2 - x1, y2 - y1))
-
-			f[y1:y2, x1:x2] = p
-			out.write(f)
-
-	out.release()
-
-	command = 'ffmpeg -y -i {} -i {} -strict -2 -q:v 1 {}'.format(args.audio, 'temp/result.avi', args.outfile)
-	subprocess.call(command, shell=platform.system() != 'Windows')
+	if args.stream_dir:
+		with profiler.stage('encode'):
+			if out.release() != 0: ffmpeg_failures.append('stream')
+	else:
+		# With --encode_process this waits for the frames still in the ring.
+		with profiler.stage('encode'):
+			out.release()
+	if trace is not None:
+		trace.stop()
+		trace.export_chrome_trace(args.torch_trace)
+
+	with profiler.stage('mux'):
+		if args.stream_dir:
+			# The stream already has the audio; copy it into the final file instead of encoding twice.
+			if 'stream' not in ffmpeg_failures and out.remux(args.outfile) != 0: ffmpeg_failures.append('mux')
+		else:
+			preset = '-preset {} '.format(args.encoder_preset) if args.encoder_preset else ''
+			# On an audio-cache hit args.audio is still the upload, which may carry a video stream of its own.
+			command = 'ffmpeg -y -i {} -i {} -map 1:v:0 -map 0:a:0 -strict -2 -q:v 1 {}{}{}'.format(args.audio, temp_path('result.avi'), preset, ffmpeg_threads, args.outfile)
+			if subprocess.call(command, shell=platform.system() != 'Windows') != 0: ffmpeg_failures.append('mux')
+	if args.stream_dir:
+		out.finish(not ffmpeg_failures, frames_expected=len(mel_chunks), ffmpeg_failures=ffmpeg_failures)
+
+	if audio_cache is not None:
+		audio_cache.close()
+		profiler.count('audio_cache_hits', audio_cache.hits)
+		cache_lookups['audio'] = {'hit': audio_cache.hits, 'miss': audio_cache.misses}
+
+	if args.profile_out:
+		profiler.count('frames', len(mel_chunks))
+		profiler.count('fps', fps)
+		profiler.count('frame_size', [frame_w, frame_h])
+		profiler.count('keyframe_interval', max(1, args.keyframe_interval))
+		profiler.count('ffmpeg_failures', ffmpeg_failures)
+		profiler.count('cache_lookups', cache_lookups)
+		profiler.write(args.profile_out)
+
+	if own_tmp_dir and not ffmpeg_failures:
+		shutil.rmtree(args.tmp_dir, ignore_errors=True)
 
 if __name__ == '__main__':
 	main()
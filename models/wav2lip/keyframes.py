@@ -0,0 +1,51 @@
+"""Throughput mode: run Wav2Lip on every k-th frame and interpolate the mouth frames in between.
+
+Frame ``i`` of ``total`` is a keyframe when ``i % interval == 0``. The last
+frame is always a keyframe, so every in-between frame has a prediction on
+both sides. An in-between frame gets the linear blend of the two
+neighbouring 96x96 predictions, weighted by its distance to each. It is
+then pasted into its own video frame and encoded like any other, so
+compositing and the output stay at full fps.
+"""
+import numpy as np
+
+
+class KeyframeInterpolator:
+    """Turns predictions for keyframes into a prediction for every frame, in frame order.
+
+    ``push`` takes every frame in order, with ``pred`` for keyframes only,
+    and returns the ``(pred, frame, coords)`` triples that can now be
+    composited. In-between frames wait (at most ``interval - 1`` of them)
+    until the next keyframe's prediction arrives.
+    """
+
+    def __init__(self, total, interval):
+        self.total = total
+        self.interval = max(1, int(interval))
+        self._prev = None  # (index, pred) of the last keyframe
+        self._pending = []  # (index, frame, coords) waiting for the next keyframe
+
+    def is_keyframe(self, index):
+        return index % self.interval == 0 or index == self.total - 1
+
+    def keyframe_mask(self, start, count):
+        """Boolean mask over frames ``start:start + count``."""
+        index = np.arange(start, start + count)
+        return (index % self.interval == 0) | (index == self.total - 1)
+
+    def push(self, index, frame, coords, pred=None):
+        if pred is None:
+            self._pending.append((index, frame, coords))
+            return []
+
+        ready = []
+        if self._pending:
+            prev_index, prev_pred = self._prev
+            span = float(index - prev_index)
+            for i, f, c in self._pending:
+                t = (i - prev_index) / span
+                ready.append(((1. - t) * prev_pred + t * pred, f, c))
+            self._pending = []
+        ready.append((pred, frame, coords))
+        self._prev = (index, pred)
+        return ready
@@ -0,0 +1,161 @@
+"""Per-frame mel windows: the ``mel_chunks`` of infer.py, without holding the whole spectrogram.
+
+Frame ``i`` of a video at ``fps`` uses the ``mel_step_size`` (16) columns
+starting at ``int(i * 80 / fps)``. When a window would run past the end, one
+last window is aligned to the end of the spectrogram and the sequence stops.
+``window_starts`` computes every start index in one vectorized step and
+``MelWindows`` exposes the windows of a whole spectrogram as a zero-copy
+strided view. ``MelWindower`` applies the same rule to columns arriving in
+blocks. ``MelChunkStream`` feeds it from ``audio.StreamingMelSpectrogram``
+while reading the audio file in blocks.
+"""
+import numpy as np
+import soundfile
+
+import audio
+from hparams import hparams as hp
+
+MEL_STEP = 16
+
+
+def window_start(i, fps):
+    return int(i * (hp.sample_rate / float(audio.get_hop_size())) / fps)
+
+
+def window_starts(n_columns, fps, step=MEL_STEP):
+    """Start column of every window for a spectrogram with ``n_columns`` columns, as an int64 array.
+
+    Same values as calling ``window_start`` until a window runs past the end,
+    then appending ``n_columns - step`` for the end-aligned last window.
+    """
+    if n_columns < step:
+        raise ValueError('Audio is too short: {} mel columns, at least {} are needed'.format(n_columns, step))
+    multiplier = hp.sample_rate / float(audio.get_hop_size()) / fps
+    # Enough candidates to pass the end; float rounding can put int(i * multiplier) one column either side.
+    candidates = (np.arange(int((n_columns - step + 1) / multiplier) + 2) * multiplier).astype(np.int64)
+    starts = candidates[:np.count_nonzero(candidates + step <= n_columns)]
+    return np.append(starts, n_columns - step)
+
+
+def chunk_count(n_columns, fps, step=MEL_STEP):
+    """len(mel_chunks) for a spectrogram with ``n_columns`` columns."""
+    return len(window_starts(n_columns, fps, step))
+
+
+class MelWindows:
+    """The per-frame windows of a whole spectrogram, without copying them.
+
+    ``windows[i]`` is a ``(num_mels, step)`` view into the spectrogram, and
+    ``gather(start, stop, out)`` copies a run of consecutive windows into a
+    preallocated batch buffer in one call. The spectrogram is kept as float32,
+    the dtype of the model input, so no cast happens per batch.
+    """
+
+    def __init__(self, mel, fps, step=MEL_STEP):
+        self.mel = np.ascontiguousarray(mel, dtype=np.float32)
+        self.starts = window_starts(self.mel.shape[1], fps, step)
+        # (n_columns - step + 1, num_mels, step): window j starts at column j.
+        self.view = np.lib.stride_tricks.sliding_window_view(self.mel, step, axis=1).transpose(1, 0, 2)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        return self.view[self.starts[i]]
+
+    def __iter__(self):
+        for start in self.starts:
+            yield self.view[start]
+
+    def gather(self, start, stop, out):
+        """Copy windows ``start:stop`` into ``out``, shaped ``(stop - start, num_mels, step)``."""
+        np.take(self.view, self.starts[start:stop], axis=0, out=out)
+        return out
+
+
+class MelWindower:
+    """Per-frame windows from mel columns pushed in order; keeps only the columns later windows need."""
+
+    def __init__(self, fps, step=MEL_STEP):
+        self.fps = fps
+        self.step = step
+        self.index = 0  # windows emitted so far
+        self.finished = False
+        self._cols = np.zeros((hp.num_mels, 0))
+        self._offset = 0  # absolute column index of _cols[:, 0]
+
+    def push(self, block, last=False):
+        """Add columns; returns the windows that are now complete. ``last`` marks the end of the spectrogram."""
+        self._cols = np.concatenate([self._cols, block], axis=1)
+        total = self._offset + self._cols.shape[1]
+        windows = []
+        while not self.finished:
+            start = window_start(self.index, self.fps)
+            if start + self.step > total:
+                if not last:
+                    break
+                self.finished = True
+                if total < self.step:
+                    break
+                start = total - self.step
+            lo = start - self._offset
+            windows.append(self._cols[:, lo:lo + self.step])
+            self.index += 1
+
+        keep_from = max(self._offset, min(window_start(self.index, self.fps), total - self.step))
+        self._cols = self._cols[:, keep_from - self._offset:]
+        self._offset = keep_from
+        return windows
+
+
+def can_stream(path):
+    """Streaming reads the file as is, so it must already be mono at hp.sample_rate (no resampling)."""
+    try:
+        info = soundfile.info(path)
+    except RuntimeError:
+        return False
+    return info.samplerate == hp.sample_rate and info.channels == 1
+
+
+class MelChunkStream:
+    """Iterable with the windows of infer.py's ``mel_chunks`` list (equal to ~1e-15, see audio.py).
+
+    The audio file is read ``block_s`` seconds at a time, and the spectrogram
+    is never held in full. ``stage``, if given, is a context manager factory
+    that is charged with the mel computation (e.g. ``profiler.stage``).
+    """
+
+    def __init__(self, path, fps, block_s=10., stage=None):
+        self.path = path
+        self.fps = fps
+        self.blocksize = int(block_s * hp.sample_rate)
+        self.stage = stage
+        n_columns = 1 + soundfile.info(path).frames // audio.get_hop_size()
+        self.count = chunk_count(n_columns, fps)
+
+    def __len__(self):
+        return self.count
+
+    def _compute(self, fn, *args):
+        if self.stage is None:
+            return fn(*args)
+        with self.stage('mel'):
+            return fn(*args)
+
+    def __iter__(self):
+        mel = audio.StreamingMelSpectrogram()
+        windower = MelWindower(self.fps)
+        for block in soundfile.blocks(self.path, blocksize=self.blocksize, dtype='float32'):
+            columns = self._compute(mel.push, block)
+            self._check(columns)
+            for window in windower.push(columns):
+                yield window
+        columns = self._compute(mel.end)
+        self._check(columns)
+        for window in windower.push(columns, last=True):
+            yield window
+
+    @staticmethod
+    def _check(columns):
+        if np.isnan(columns).any():
+            raise ValueError('Mel contains nan! Using a TTS voice? Add a small epsilon noise to the wav file and try again')
@@ -0,0 +1,278 @@
+"""Real-time Wav2Lip for one registered face: PCM chunks in, lip-synced frames out.
+
+The face is detected once, and the Wav2Lip face-encoder features of its
+masked/reference input are computed once per session. Each video frame then
+costs one audio-encoder + decoder pass and a paste-back. Mel columns are
+computed as audio arrives (audio.StreamingMelSpectrogram, independent of the
+chunk sizes). Frame ``i`` is rendered as soon as its 16-column window
+(``mel_step_size``) exists, cut the same way as infer.py (melchunks.py). The
+only algorithmic delay is that lookahead: 16 hops plus half an STFT window,
+225 ms at 16 kHz.
+
+Everything here is synchronous and framework-free. The API's WebSocket route
+(app/routes/realtime.py) runs it in a worker thread.
+"""
+import subprocess
+import threading
+import time
+from collections import OrderedDict, deque
+
+import cv2
+import numpy as np
+import torch
+
+import audio
+from batching import Wav2LipBatch
+from hparams import hparams as hp
+from melchunks import MEL_STEP, MelWindower
+
+IMG_SIZE = 96
+STAGES = ('mel', 'forward', 'paste', 'encode', 'send')
+
+
+def mel_fps():
+    return hp.sample_rate / float(audio.get_hop_size())
+
+
+def lookahead_s():
+    """Audio that must have arrived after a frame's start before it can be rendered."""
+    return MEL_STEP / mel_fps() + hp.n_fft / 2. / hp.sample_rate
+
+
+def pcm16_to_float(data):
+    return np.frombuffer(data, dtype='<i2').astype(np.float32) / 32768.
+
+
+class RegisteredFace:
+    """A face image with its detected box and the Wav2Lip input prepared once."""
+
+    def __init__(self, image, coords):
+        self.image = image
+        self.coords = tuple(int(c) for c in coords)
+        y1, y2, x1, x2 = self.coords
+        batch = Wav2LipBatch(1, IMG_SIZE)
+        batch.add(image[y1:y2, x1:x2], np.zeros((hp.num_mels, MEL_STEP), dtype=np.float32))
+        img_input, _ = batch.prepare()
+        self.img_input = img_input.copy()
+
+    @classmethod
+    def detect(cls, image, detector, pads=(0, 10, 0, 0)):
+        rect = detector.get_detections_for_batch(np.array([image]))[0]
+        if rect is None:
+            raise ValueError('Face not detected in the image')
+        pady1, pady2, padx1, padx2 = pads
+        y1 = max(0, rect[1] - pady1)
+        y2 = min(image.shape[0], rect[3] + pady2)
+        x1 = max(0, rect[0] - padx1)
+        x2 = min(image.shape[1], rect[2] + padx2)
+        return cls(image, (y1, y2, x1, x2))
+
+
+class LatencyTracker:
+    """Per-stage and end-to-end latency, summarised against the per-frame budget of 1 / fps.
+
+    ``observer(stage, seconds)``, if given, also receives every sample, e.g. to feed a metrics histogram.
+    """
+
+    def __init__(self, fps, window=500, observer=None):
+        self.fps = fps
+        self.observer = observer
+        self.frames = 0
+        self.stage_s = OrderedDict((name, 0.) for name in STAGES)
+        self._e2e = deque(maxlen=window)
+        self._batches = {name: deque(maxlen=window) for name in STAGES}
+
+    def add(self, stage, seconds):
+        self.stage_s[stage] += seconds
+        self._batches[stage].append(seconds)
+        if self.observer:
+            self.observer(stage, seconds)
+
+    def frames_done(self, count, arrived_at, now=None):
+        """``count`` frames are encoded; the audio that completed their windows arrived at ``arrived_at``."""
+        latency = (now or time.perf_counter()) - arrived_at
+        self.frames += count
+        self._e2e.extend([latency] * count)
+        if self.observer:
+            self.observer('end_to_end', latency)
+
+    @staticmethod
+    def _pct(values, q):
+        if not values:
+            return None
+        values = sorted(values)
+        return values[min(len(values) - 1, int(q / 100. * len(values)))]
+
+    def report(self):
+        budget_ms = 1000. / self.fps
+        stages = OrderedDict()
+        for name, total in self.stage_s.items():
+            per_frame = 1000. * total / self.frames if self.frames else 0.
+            stages[name] = {'per_frame_ms': round(per_frame, 2),
+                            'batch_p95_ms': round(1000. * (self._pct(self._batches[name], 95) or 0.), 2),
+                            'budget_share': round(per_frame / budget_ms, 3)}
+        compute = sum(s['per_frame_ms'] for s in stages.values())
+        e2e = list(self._e2e)
+        return {
+            'frames': self.frames,
+            'fps': self.fps,
+            'frame_budget_ms': round(budget_ms, 2),
+            'compute_per_frame_ms': round(compute, 2),
+            # Above 1 the session cannot keep up with real time and latency grows.
+            'realtime_load': round(compute / budget_ms, 3),
+            'lookahead_ms': round(1000. * lookahead_s(), 1),
+            'end_to_end_p50_ms': round(1000. * self._pct(e2e, 50), 1) if e2e else None,
+            'end_to_end_p95_ms': round(1000. * self._pct(e2e, 95), 1) if e2e else None,
+            'stages': stages,
+        }
+
+
+class JpegEncoder:
+    """One JPEG per frame."""
+
+    def __init__(self, width, height, fps, quality=80):
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+
+    def encode(self, frame):
+        ok, buf = cv2.imencode('.jpg', frame, self.params)
+        if not ok:
+            raise RuntimeError('JPEG encoding failed')
+        return [buf.tobytes()]
+
+    def close(self):
+        return []
+
+
+class H264Encoder:
+    """Annex-B H.264 from an ffmpeg/libx264 subprocess tuned for zero latency.
+
+    ``encode`` returns whatever NAL units the encoder has produced so far.
+    With zerolatency that is normally the previous frame's, so the frame
+    written now arrives in the next call's output.
+    """
+
+    def __init__(self, width, height, fps, threads=0):
+        cmd = ['ffmpeg', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'bgr24',
+               '-s', '{}x{}'.format(width, height), '-r', str(fps), '-i', 'pipe:0',
+               '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-c:v', 'libx264', '-preset', 'ultrafast',
+               '-tune', 'zerolatency', '-pix_fmt', 'yuv420p', '-g', str(int(round(fps))),
+               '-flush_packets', '1', '-f', 'h264', 'pipe:1']
+        if threads > 0:
+            cmd[1:1] = ['-threads', str(threads)]
+        self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self._out = deque()
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        while True:
+            data = self._proc.stdout.read1(1 << 16)
+            if not data:
+                return
+            self._out.append(data)
+
+    def _drain(self):
+        chunks = []
+        while self._out:
+            chunks.append(self._out.popleft())
+        return chunks
+
+    def encode(self, frame):
+        self._proc.stdin.write(frame.tobytes())
+        self._proc.stdin.flush()
+        return self._drain()
+
+    def close(self):
+        self._proc.stdin.close()
+        self._proc.wait()
+        self._reader.join()
+        return self._drain()
+
+
+ENCODERS = {'jpeg': JpegEncoder, 'h264': H264Encoder}
+
+
+class RealtimeSession:
+    """Incremental lip-sync of one audio stream onto one registered face.
+
+    ``push`` takes PCM (s16le mono at hp.sample_rate) and returns a list of
+    encoded chunks for every frame that became renderable. A chunk may end
+    mid-sample; the odd byte is carried over to the next one. ``end`` flushes
+    the tail the same way infer.py handles the end of a file.
+    """
+
+    def __init__(self, model, face, device='cpu', fps=25., encoder='jpeg', max_batch=8, observer=None):
+        self.model = model
+        self.face = face
+        self.device = device
+        self.fps = fps
+        self.max_batch = max_batch
+        self.mel = audio.StreamingMelSpectrogram()
+        self.windower = MelWindower(fps)
+        self.latency = LatencyTracker(fps, observer=observer)
+        self.frame_index = 0
+        self._closed = False
+        self._odd_byte = b''
+        h, w = face.image.shape[:2]
+        self.encoder = ENCODERS[encoder](w, h, fps)
+        with torch.no_grad():
+            self.feats = model.encode_face(torch.from_numpy(face.img_input).to(device))
+
+    def push(self, pcm):
+        arrived = time.perf_counter()
+        t0 = time.perf_counter()
+        if self._odd_byte or len(pcm) % 2:
+            pcm = self._odd_byte + bytes(pcm)
+            whole = len(pcm) & ~1
+            pcm, self._odd_byte = pcm[:whole], pcm[whole:]
+        block = self.mel.push(pcm16_to_float(pcm))
+        self.latency.add('mel', time.perf_counter() - t0)
+        return self._render(block, arrived)
+
+    def end(self):
+        arrived = time.perf_counter()
+        t0 = time.perf_counter()
+        block = self.mel.end()
+        self.latency.add('mel', time.perf_counter() - t0)
+        out = self._render(block, arrived, last=True)
+        self._closed = True
+        return out + self.encoder.close()
+
+    def close(self):
+        """Release the encoder of a stream that was abandoned before ``end``."""
+        if not self._closed:
+            self._closed = True
+            self.encoder.close()
+
+    def _render(self, block, arrived, last=False):
+        windows = self.windower.push(block, last)
+        out = []
+        for b in range(0, len(windows), self.max_batch):
+            out += self._render_batch(windows[b:b + self.max_batch], arrived)
+        return out
+
+    def _render_batch(self, windows, arrived):
+        t0 = time.perf_counter()
+        mel_batch = np.stack(windows)[:, None].astype(np.float32)
+        with torch.no_grad():
+            pred = self.model.decode(torch.from_numpy(mel_batch).to(self.device), self.feats)
+        pred = pred.cpu().numpy().transpose(0, 2, 3, 1) * 255.
+        t1 = time.perf_counter()
+        self.latency.add('forward', t1 - t0)
+
+        y1, y2, x1, x2 = self.face.coords
+        frames = []
+        for p in pred:
+            frame = self.face.image.copy()
+            frame[y1:y2, x1:x2] = cv2.resize(p.astype(np.uint8), (x2 - x1, y2 - y1))
+            frames.append(frame)
+        t2 = time.perf_counter()
+        self.latency.add('paste', t2 - t1)
+
+        out = []
+        for frame in frames:
+            out += self.encoder.encode(frame)
+        self.latency.add('encode', time.perf_counter() - t2)
+        self.frame_index += len(windows)
+        self.latency.frames_done(len(windows), arrived)
+        return out
@@ -0,0 +1,81 @@
+import json
+import os
+import resource
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+def _rusage():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+    # ru_maxrss is in KiB on Linux
+    peak_rss_mb = max(own.ru_maxrss, children.ru_maxrss) / 1024.
+    return cpu, peak_rss_mb
+
+
+class StageProfiler:
+    """Wall time, CPU time and peak RSS per named pipeline stage.
+
+    A stage can be entered many times (e.g. once per batch); its times are
+    summed. CPU time includes finished child processes such as ffmpeg. Peak RSS
+    is the process high-water mark when the stage last finished, so a stage
+    that raises it is the one that allocated the memory.
+    """
+
+    def __init__(self):
+        self.stages = OrderedDict()
+        self.counters = OrderedDict()
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        wall0 = time.perf_counter()
+        cpu0, _ = _rusage()
+        try:
+            yield
+        finally:
+            cpu1, peak = _rusage()
+            self.add(name, time.perf_counter() - wall0, cpu1 - cpu0, peak)
+
+    def add(self, name, wall_s, cpu_s=0., peak_rss_mb=None):
+        entry = self.stages.setdefault(name, {'wall_s': 0., 'cpu_s': 0., 'peak_rss_mb': 0., 'calls': 0})
+        entry['wall_s'] += wall_s
+        entry['cpu_s'] += cpu_s
+        if peak_rss_mb is not None:
+            entry['peak_rss_mb'] = max(entry['peak_rss_mb'], peak_rss_mb)
+        entry['calls'] += 1
+
+    def iterate(self, name, iterable):
+        """Yield from ``iterable``, charging the time spent producing each item to ``name``."""
+        it = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+            yield item
+
+    def elapsed(self):
+        """Seconds since the profiler was created."""
+        return time.perf_counter() - self._start
+
+    def count(self, name, value):
+        self.counters[name] = value
+
+    def report(self):
+        stages = OrderedDict()
+        for name, entry in self.stages.items():
+            stages[name] = {k: round(v, 4) if isinstance(v, float) else v for k, v in entry.items()}
+        return {
+            'total_wall_s': round(self.elapsed(), 4),
+            'stages': stages,
+            'counters': dict(self.counters),
+        }
+
+    def write(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
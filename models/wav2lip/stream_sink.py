@@ -0,0 +1,98 @@
+"""Progressive output: encode finished frames into HLS or fragmented MP4 while rendering continues.
+
+Frames are piped as raw BGR into one ffmpeg process. That process also reads
+the audio track, so every segment it closes already carries its matching
+audio slice. A keyframe is forced every ``keyframe_s`` seconds so segments
+can be cut early; the first one closes after about a second of video.
+
+Layout of ``out_dir``:
+    hls  -- index.m3u8 (an EVENT playlist that gains entries as segments
+            close, and ``#EXT-X-ENDLIST`` when done), init.mp4, seg_00000.m4s, ...
+    fmp4 -- stream.mp4, a fragmented MP4 that can be read while it grows.
+
+``STATUS_FILE`` is written last, so a reader knows the stream is complete
+without parsing the playlist.
+"""
+import json
+import os
+import subprocess
+
+FORMATS = ('hls', 'fmp4')
+PLAYLIST = 'index.m3u8'
+FMP4_FILE = 'stream.mp4'
+STATUS_FILE = 'status.json'
+
+
+def entry_file(fmt):
+    return PLAYLIST if fmt == 'hls' else FMP4_FILE
+
+
+def encoder_command(out_dir, width, height, fps, audio_path, fmt='hls', segment_s=2., keyframe_s=1., threads=0,
+                    preset='veryfast'):
+    cmd = ['ffmpeg', '-y', '-loglevel', 'error',
+           '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', '{}x{}'.format(width, height), '-r', str(fps), '-i', 'pipe:0',
+           '-i', audio_path, '-map', '0:v:0', '-map', '1:a:0',
+           # libx264 with yuv420p needs even dimensions.
+           '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+           '-c:v', 'libx264', '-preset', preset, '-tune', 'zerolatency', '-pix_fmt', 'yuv420p',
+           '-force_key_frames', 'expr:gte(t,n_forced*{})'.format(keyframe_s),
+           '-c:a', 'aac', '-shortest']
+    if threads > 0:
+        cmd += ['-threads', str(threads)]
+    if fmt == 'hls':
+        cmd += ['-f', 'hls', '-hls_time', str(segment_s), '-hls_init_time', str(keyframe_s),
+                '-hls_playlist_type', 'event', '-hls_segment_type', 'fmp4',
+                '-hls_flags', 'independent_segments+temp_file',
+                '-hls_fmp4_init_filename', 'init.mp4',
+                '-hls_segment_filename', os.path.join(out_dir, 'seg_%05d.m4s'),
+                os.path.join(out_dir, PLAYLIST)]
+    elif fmt == 'fmp4':
+        cmd += ['-movflags', 'frag_keyframe+empty_moov+default_base_moof',
+                '-frag_duration', str(int(keyframe_s * 1e6)), '-f', 'mp4', os.path.join(out_dir, FMP4_FILE)]
+    else:
+        raise ValueError('Unknown stream format {!r}; expected one of {}'.format(fmt, FORMATS))
+    return cmd
+
+
+def remux_command(out_dir, fmt, outfile, threads=0):
+    """Copy the finished stream into a regular MP4; no second encode."""
+    cmd = ['ffmpeg', '-y', '-loglevel', 'error']
+    if fmt == 'hls':
+        cmd += ['-allowed_extensions', 'ALL']
+    cmd += ['-i', os.path.join(out_dir, entry_file(fmt)), '-c', 'copy', '-movflags', '+faststart']
+    if threads > 0:
+        cmd += ['-threads', str(threads)]
+    return cmd + [outfile]
+
+
+class StreamSink:
+    """Write-only frame sink backed by an ffmpeg subprocess; mirrors ``cv2.VideoWriter``."""
+
+    def __init__(self, out_dir, width, height, fps, audio_path, fmt='hls', segment_s=2., keyframe_s=1., threads=0,
+                 preset='veryfast'):
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.threads = threads
+        self.frames = 0
+        self._proc = subprocess.Popen(encoder_command(out_dir, width, height, fps, audio_path, fmt, segment_s,
+                                                      keyframe_s, threads, preset), stdin=subprocess.PIPE)
+
+    def write(self, frame):
+        self._proc.stdin.write(frame.tobytes())
+        self.frames += 1
+
+    def release(self):
+        """Close the pipe and wait for the last segment; returns ffmpeg's exit code."""
+        self._proc.stdin.close()
+        return self._proc.wait()
+
+    def remux(self, outfile):
+        return subprocess.call(remux_command(self.out_dir, self.fmt, outfile, self.threads))
+
+    def finish(self, ok, **info):
+        status = dict(info, done=True, ok=bool(ok), format=self.fmt, entry=entry_file(self.fmt), frames=self.frames)
+        tmp = os.path.join(self.out_dir, STATUS_FILE + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(status, f)
+        os.replace(tmp, os.path.join(self.out_dir, STATUS_FILE))
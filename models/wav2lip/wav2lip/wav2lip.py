@@ -94,13 +94,54 @@ class Wav2Lip(nn.Module):
             face_sequences = torch.cat([face_sequences[:, :, i] for i in range(face_sequences.size(2))], dim=0)
 
         audio_embedding = self.audio_encoder(audio_sequences) # B, 512, 1, 1
+        feats = self.encode_face(face_sequences)
+        x = self._decode(audio_embedding, feats)
 
+        if input_dim_size > 4:
+            x = torch.split(x, B, dim=0) # [(B, C, H, W)]
+            outputs = torch.stack(x, dim=2) # (B, C, T, H, W)
+
+        else:
+            outputs = x
+            
+        return outputs
+
+    def encode_face(self, face_sequences):
+        """Skip features of the face encoder for (B, 6, H, W) faces.
+
+        They depend only on the face input, so for a fixed reference face they
+        can be computed once and passed to ``decode`` for every audio window.
+        """
         feats = []
         x = face_sequences
         for f in self.face_encoder_blocks:
             x = f(x)
             feats.append(x)
+        return feats
+
+    def encode_audio(self, audio_sequences):
+        """(B, 512, 1, 1) embeddings of (B, 1, 80, 16) mel windows.
+
+        They depend only on the audio, so they can be cached per clip and
+        passed to ``decode_embedding`` instead of the windows.
+        """
+        return self.audio_encoder(audio_sequences)
 
+    def decode(self, audio_sequences, feats):
+        """``forward`` for (B, 1, 80, 16) mel windows and precomputed ``encode_face`` features.
+
+        Features with batch size 1 are shared by every window in the batch.
+        """
+        return self.decode_embedding(self.encode_audio(audio_sequences), feats)
+
+    def decode_embedding(self, audio_embedding, feats):
+        """``decode`` for precomputed ``encode_audio`` embeddings."""
+        B = audio_embedding.size(0)
+        feats = [f.expand(B, -1, -1, -1) if f.size(0) == 1 and B > 1 else f for f in feats]
+        return self._decode(audio_embedding, feats)
+
+    def _decode(self, audio_embedding, feats):
+        feats = list(feats)
         x = audio_embedding
         for f in self.face_decoder_blocks:
             x = f(x)
@@ -113,16 +154,8 @@ class Wav2Lip(nn.Module):
             
             feats.pop()
 
-        x = self.output_block(x)
+        return self.output_block(x)
 
-        if input_dim_size > 4:
-            x = torch.split(x, B, dim=0) # [(B, C, H, W)]
-            outputs = torch.stack(x, dim=2) # (B, C, T, H, W)
-
-        else:
-            outputs = x
-            
-        return outputs
 
 class Wav2Lip_disc_qual(nn.Module):
     def __init__(self):
@@ -0,0 +1,134 @@
+"""Checkpoints as memory-mapped safetensors files, shared by every process through the page cache.
+
+``torch.load`` unpickles a checkpoint into private memory, so each worker
+holds its own copy of wav2lip.pth and s3fd.pth. A converted checkpoint
+
+    python weights.py checkpoints/wav2lip.pth checkpoints/s3fd.pth
+
+is written next to the original as ``<name>.safetensors``, with the
+``module.`` prefix of DataParallel checkpoints already stripped. The layout
+is safetensors' own: an 8-byte header length, a JSON header, then the raw
+tensors. The ``safetensors`` package can read these files, but it is not
+needed here. ``load_file`` maps the file copy-on-write, and every tensor is
+a view of the mapping. ``load_into`` makes those views the model's
+parameters (``assign=True``), so loading takes milliseconds and all workers
+on a node read one physical copy.
+
+``load_state_dict(path)`` is what the loaders call. It takes the
+``.safetensors`` next to a ``.pth`` when that file is at least as new, or
+when the ``.pth`` is missing, and otherwise falls back to ``torch.load``.
+"""
+import json
+import os
+import struct
+import sys
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+DTYPES = {
+    'F64': torch.float64, 'F32': torch.float32, 'F16': torch.float16, 'BF16': torch.bfloat16,
+    'I64': torch.int64, 'I32': torch.int32, 'I16': torch.int16, 'I8': torch.int8, 'U8': torch.uint8,
+    'BOOL': torch.bool,
+}
+NAMES = {dtype: name for name, dtype in DTYPES.items()}
+SUFFIX = '.safetensors'
+
+
+def strip_prefix(state_dict):
+    """Wav2Lip checkpoint dicts keep the weights under "state_dict", with DataParallel's "module." prefix."""
+    state_dict = state_dict.get('state_dict', state_dict)
+    return OrderedDict((k.replace('module.', ''), v) for k, v in state_dict.items())
+
+
+def save_file(tensors, path, metadata=None):
+    # Largest elements first, so every tensor stays aligned to its element size.
+    items = sorted(tensors.items(), key=lambda kv: (-kv[1].element_size(), kv[0]))
+    header, offset = {}, 0
+    for name, tensor in items:
+        nbytes = tensor.numel() * tensor.element_size()
+        header[name] = {'dtype': NAMES[tensor.dtype], 'shape': list(tensor.shape),
+                        'data_offsets': [offset, offset + nbytes]}
+        offset += nbytes
+    if metadata:
+        header['__metadata__'] = {str(k): str(v) for k, v in metadata.items()}
+    raw = json.dumps(header, separators=(',', ':')).encode()
+    raw += b' ' * (-(8 + len(raw)) % 64)  # tensor data starts 64-byte aligned
+
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(struct.pack('<Q', len(raw)))
+        f.write(raw)
+        for _, tensor in items:
+            tensor = tensor.detach().cpu().contiguous()
+            f.write(tensor.reshape(-1).view(torch.uint8).numpy().tobytes())
+    os.replace(tmp, path)
+
+
+def load_file(path):
+    """Tensors of a safetensors file as views of one copy-on-write mapping of it."""
+    with open(path, 'rb') as f:
+        size = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(size))
+    header.pop('__metadata__', None)
+    base = 8 + size
+    if not header:
+        return OrderedDict()
+    # mode 'c' maps privately: pages stay shared with every other process until a tensor is written to.
+    buf = torch.from_numpy(np.memmap(path, dtype=np.uint8, mode='c'))
+    tensors = OrderedDict()
+    for name, info in header.items():
+        start, end = info['data_offsets']
+        tensors[name] = buf[base + start:base + end].view(DTYPES[info['dtype']]).reshape(info['shape'])
+    return tensors
+
+
+def converted_path(path):
+    return os.path.splitext(path)[0] + SUFFIX
+
+
+def resolve(path):
+    """``path``, or its converted ``.safetensors`` sibling if that exists and ``path`` is not newer."""
+    if path.endswith(SUFFIX):
+        return path
+    try:
+        converted_mtime = os.stat(converted_path(path)).st_mtime
+    except OSError:
+        return path
+    try:
+        if os.stat(path).st_mtime > converted_mtime:
+            return path
+    except OSError:
+        pass  # only the converted file was deployed
+    return converted_path(path)
+
+
+def load_state_dict(path):
+    """Prefix-free state dict of checkpoint ``path``, memory-mapped when it is (or has) a safetensors file."""
+    path = resolve(path)
+    if path.endswith(SUFFIX):
+        return load_file(path)
+    return strip_prefix(torch.load(path, map_location=lambda storage, loc: storage))
+
+
+def load_into(model, path):
+    """Load checkpoint ``path`` into ``model``; mapped tensors become its parameters instead of being copied."""
+    state_dict = load_state_dict(path)
+    mapped = resolve(path).endswith(SUFFIX)
+    model.load_state_dict(state_dict, assign=mapped)
+    return model
+
+
+def convert(path):
+    out = converted_path(path)
+    save_file(strip_prefix(torch.load(path, map_location=lambda storage, loc: storage)), out,
+              {'source': os.path.basename(path)})
+    return out
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit('usage: python weights.py CHECKPOINT.pth [...]')
+    for checkpoint in sys.argv[1:]:
+        print('{} -> {}'.format(checkpoint, convert(checkpoint)))
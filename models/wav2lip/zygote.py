@@ -0,0 +1,193 @@
+"""Fork-server for infer.py: imports and weights are loaded once, every render runs in a forked child.
+
+    python zygote.py --socket /tmp/lip2sync-zygote.sock \\
+        --checkpoint_path checkpoints/wav2lip.pth --detector_path checkpoints/s3fd.pth
+
+The zygote imports torch, cv2, librosa and infer.py's helpers, loads the
+Wav2Lip and S3FD weights on the CPU and runs one warm-up pass of each. Then
+it waits on a unix socket. Each request forks a child, which shares those
+pages copy-on-write and runs infer.py as ``python infer.py <argv>`` would.
+It has the client's working directory, environment, CPU affinity, stdout
+and stderr. The zygote reaps the child and answers with its exit code, so a
+crash or leak in one render ends with that render's process.
+
+Protocol (app/utils/zygote.py is the client): the client sends one JSON line
+``{"script", "argv", "cwd", "env", "cores"}`` with its stdout and stderr
+attached as file descriptors (SCM_RIGHTS). The zygote answers
+``{"pid": n}`` when the child is forked and
+``{"returncode": n, "cpu_s": s, "peak_rss_mb": m}`` when it exits, with
+the child's own rusage as the zygote reaped it.
+
+The zygote keeps torch at one thread and never touches CUDA, so forking is
+safe. Children restore the thread count ($LIP2SYNC_THREADS, or the
+default), and on GPU hosts they move the preloaded weights to the GPU
+themselves.
+"""
+import argparse
+import json
+import os
+import runpy
+import selectors
+import signal
+import socket
+import sys
+import traceback
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Filled by preload() in the zygote; forked children find the weights here (see infer.load_model).
+_models = {}
+_default_threads = None
+
+
+def preloaded_model(path):
+    """The Wav2Lip model preloaded from checkpoint ``path`` (on the CPU), or None outside a zygote child."""
+    return _models.get(os.path.realpath(path))
+
+
+def preload(checkpoint_path, detector_path=None):
+    global _default_threads
+    if HERE not in sys.path:
+        sys.path.insert(0, HERE)
+    import torch
+    import cv2  # noqa: F401
+    import librosa  # noqa: F401
+    import audio  # noqa: F401
+    import face_detection
+    from models import Wav2Lip
+
+    # A thread pool started before fork() would be unusable in the children.
+    _default_threads = torch.get_num_threads()
+    torch.set_num_threads(1)
+
+    import weights
+    model = weights.load_into(Wav2Lip(), checkpoint_path).eval()
+    with torch.no_grad():
+        model(torch.zeros(1, 1, 80, 16), torch.zeros(1, 6, 96, 96))
+    _models[os.path.realpath(checkpoint_path)] = model
+
+    if detector_path:
+        detector = face_detection.get_face_alignment(device='cpu', path_to_detector=detector_path)
+        detector.warmup(height=128, width=128)
+
+
+def _recv_request(conn):
+    data, fds, _, _ = socket.recv_fds(conn, 1 << 16, 2)
+    while not data.endswith(b'\n'):
+        chunk = conn.recv(1 << 16)
+        if not chunk:
+            raise ConnectionError('request ended early')
+        data += chunk
+    return json.loads(data), fds
+
+
+def _send(conn, message):
+    try:
+        conn.sendall((json.dumps(message) + '\n').encode())
+    except OSError:
+        pass  # the client went away; the render carries on regardless
+
+
+def _run_child(request, fds):
+    """Runs in the forked child; never returns."""
+    code = 1
+    try:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        for target, fd in zip((1, 2), fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+        if request.get('cores') and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, request['cores'])
+        import torch
+        torch.set_num_threads(int(os.environ.get('LIP2SYNC_THREADS') or 0) or _default_threads)
+
+        script = os.path.abspath(request['script'])
+        sys.argv = [script] + list(request['argv'])
+        sys.path[0] = os.path.dirname(script)
+        runpy.run_path(script, run_name='__main__')
+        code = 0
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def serve(path):
+    """Accept requests on unix socket ``path`` until interrupted; single-threaded so fork() is safe."""
+    if os.path.exists(path):
+        os.remove(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    os.chmod(path, 0o600)
+    server.listen(64)
+    selector = selectors.DefaultSelector()
+    selector.register(server, selectors.EVENT_READ)
+    children = {}  # pid -> client connection
+    print('Zygote {} ready on {}'.format(os.getpid(), path), flush=True)
+    try:
+        while True:
+            for _ in selector.select(timeout=0.1):
+                conn, _ = server.accept()
+                try:
+                    conn.settimeout(10)
+                    request, fds = _recv_request(conn)
+                except (OSError, ValueError) as e:
+                    print('Zygote: bad request: {}'.format(e), file=sys.stderr, flush=True)
+                    conn.close()
+                    continue
+                sys.stdout.flush()
+                sys.stderr.flush()
+                pid = os.fork()
+                if pid == 0:
+                    server.close()
+                    for other in children.values():
+                        other.close()
+                    conn.close()
+                    _run_child(request, fds)
+                for fd in fds:
+                    os.close(fd)
+                children[pid] = conn
+                _send(conn, {'pid': pid})
+            while children:
+                pid, status, usage = os.wait4(-1, os.WNOHANG)
+                if pid == 0:
+                    break
+                conn = children.pop(pid, None)
+                if conn is not None:
+                    _send(conn, {'returncode': os.waitstatus_to_exitcode(status),
+                                 'cpu_s': usage.ru_utime + usage.ru_stime, 'peak_rss_mb': usage.ru_maxrss / 1024.})
+                    conn.close()
+    finally:
+        server.close()
+        os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--socket', default=os.environ.get('LIP2SYNC_ZYGOTE') or '/tmp/lip2sync-zygote.sock')
+    parser.add_argument('--checkpoint_path', required=True, help='Wav2Lip checkpoint to preload')
+    parser.add_argument('--detector_path', default=None, help='S3FD weights to preload')
+    args = parser.parse_args()
+
+    preload(args.checkpoint_path, args.detector_path)
+    # Exit through serve()'s cleanup, which removes the socket; running children are left to finish.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        serve(args.socket)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    # Run as the importable module, so infer.py's `import zygote` sees the preloaded weights.
+    import zygote
+    zygote.main()
@@ -50,6 +50,63 @@ def melspectrogram(wav):
         return _normalize(S)
     return S
 
+class StreamingMelSpectrogram:
+    """``melspectrogram`` over a signal that arrives in chunks.
+
+    The pre-emphasis filter keeps the previous sample. The STFT keeps the
+    samples its next frames overlap, starting with the n_fft // 2 zeros that
+    librosa's centring (pad_mode='constant') puts before the signal. ``push``
+    returns every column whose frame is complete. ``end`` adds the closing
+    padding and returns the rest, so the total is 1 + len(wav) // hop columns,
+    as in the batch version. Memory stays at one frame plus the last chunk.
+
+    Every column is bit-identical however the signal was split into chunks
+    (see ``_linear_to_mel_blocked``), so windows cut from the stream do not
+    depend on the read size. They match the batch version to ~1e-15.
+    """
+
+    def __init__(self):
+        self.hop = get_hop_size()
+        self.columns = 0
+        self.samples = 0
+        self._prev = None
+        self._buffer = np.zeros(hp.n_fft // 2)
+
+    def _preemphasis(self, wav):
+        if not hp.preemphasize:
+            return np.asarray(wav, dtype=np.float64)
+        # Same arithmetic as lfilter over the whole signal: y[n] = x[n] + (-k) * x[n-1]
+        zi = np.zeros(1) if self._prev is None else np.array([-hp.preemphasis]) * self._prev
+        return signal.lfilter([1, -hp.preemphasis], [1], wav, zi=zi)[0]
+
+    def push(self, wav):
+        """Append samples (float, hp.sample_rate); returns the (num_mels, k) block of new columns."""
+        wav = np.asarray(wav)
+        if len(wav) == 0:
+            return np.zeros((hp.num_mels, 0))
+        self._buffer = np.concatenate([self._buffer, self._preemphasis(wav)])
+        self._prev = wav[-1]
+        self.samples += len(wav)
+        return self._emit(None)
+
+    def end(self):
+        self._buffer = np.concatenate([self._buffer, np.zeros(hp.n_fft // 2)])
+        return self._emit(1 + self.samples // self.hop)
+
+    def _emit(self, total):
+        count = (len(self._buffer) - hp.n_fft) // self.hop + 1 if len(self._buffer) >= hp.n_fft else 0
+        if total is not None:
+            count = min(count, total - self.columns)
+        if count <= 0:
+            return np.zeros((hp.num_mels, 0))
+        D = librosa.stft(y=self._buffer[:(count - 1) * self.hop + hp.n_fft], n_fft=hp.n_fft,
+                         hop_length=self.hop, win_length=hp.win_size, center=False)
+        S = _amp_to_db(_linear_to_mel_blocked(np.abs(D), self.columns)) - hp.ref_level_db
+        mel = _normalize(S) if hp.signal_normalization else S
+        self._buffer = self._buffer[count * self.hop:]
+        self.columns += count
+        return mel
+
 def _lws_processor():
     import lws
     return lws.lws(hp.n_fft, get_hop_size(), fftsize=hp.win_size, mode="speech")
@@ -95,6 +152,24 @@ def _linear_to_mel(spectogram):
         _mel_basis = _build_mel_basis()
     return np.dot(_mel_basis, spectogram)
 
+# BLAS results for a column depend on the matrix width and the column's place in it,
+# so the streaming projection runs on fixed blocks aligned to absolute column indices.
+# A column then has the same value however much of the signal was transformed at once.
+MEL_BLOCK = 64
+
+def _linear_to_mel_blocked(spectogram, first_column=0):
+    global _mel_basis
+    if _mel_basis is None:
+        _mel_basis = _build_mel_basis()
+    rows, n = spectogram.shape
+    lead = first_column % MEL_BLOCK
+    blocks = -(-(lead + n) // MEL_BLOCK)
+    padded = np.zeros((rows, blocks * MEL_BLOCK), dtype=spectogram.dtype)
+    padded[:, lead:lead + n] = spectogram
+    stacked = np.ascontiguousarray(padded.reshape(rows, blocks, MEL_BLOCK).transpose(1, 0, 2))
+    out = np.matmul(_mel_basis, stacked)
+    return out.transpose(1, 0, 2).reshape(len(_mel_basis), -1)[:, lead:lead + n]
+
 def _build_mel_basis():
     assert hp.fmax <= hp.sample_rate // 2
     return librosa.filters.mel(hp.sample_rate, hp.n_fft, n_mels=hp.num_mels,
@@ -170,8 +170,7 @@ mel_step_size = 16
 device = 'cuda' if torch.cuda.is_available() else 'cpu'
 print('Using {} for inference.'.format(device))
 
-detector = face_detection.FaceAlignment(face_detection.LandmarksType._2D, 
-											flip_input=False, device=device)
+detector = face_detection.get_face_alignment(device=device)
 
 def _load(checkpoint_path):
 	if device == 'cuda':
@@ -4,4 +4,4 @@ __author__ = """Adrian Bulat"""
 __email__ = 'adrian.bulat@nottingham.ac.uk'
 __version__ = '1.0.1'
 
-from .api import FaceAlignment, LandmarksType, NetworkSize
+from .api import FaceAlignment, LandmarksType, NetworkSize, get_face_alignment, release_face_alignments
@@ -1,5 +1,6 @@
 from __future__ import print_function
 import os
+import threading
 import torch
 from torch.utils.model_zoo import load_url
 from enum import Enum
@@ -45,7 +46,8 @@ ROOT = os.path.dirname(os.path.abspath(__file__))
 
 class FaceAlignment:
     def __init__(self, landmarks_type, network_size=NetworkSize.LARGE,
-                 device='cuda', flip_input=False, face_detector='sfd', verbose=False):
+                 device='cuda', flip_input=False, face_detector='sfd', verbose=False,
+                 path_to_detector=None):
         self.device = device
         self.flip_input = flip_input
         self.landmarks_type = landmarks_type
@@ -59,7 +61,14 @@ class FaceAlignment:
         # Get the face detector
         face_detector_module = __import__('face_detection.detection.' + face_detector,
                                           globals(), locals(), [face_detector], 0)
-        self.face_detector = face_detector_module.FaceDetector(device=device, verbose=verbose)
+        detector_kwargs = {}
+        if path_to_detector is not None:
+            detector_kwargs['path_to_detector'] = path_to_detector
+        self.face_detector = face_detector_module.FaceDetector(device=device, verbose=verbose, **detector_kwargs)
+
+    def warmup(self, height=256, width=256, batch_size=1):
+        """Run a dummy batch so the first real call does not pay for kernel selection."""
+        self.get_detections_for_batch(np.zeros((batch_size, height, width, 3), dtype=np.uint8))
 
     def get_detections_for_batch(self, images):
         images = images[..., ::-1]
@@ -76,4 +85,34 @@ class FaceAlignment:
             x1, y1, x2, y2 = map(int, d[:-1])
             results.append((x1, y1, x2, y2))
 
-        return results
\ No newline at end of file
+        return results
+
+
+_detectors = {}
+_detectors_lock = threading.Lock()
+
+
+def get_face_alignment(device='cuda', face_detector='sfd', warmup=False, **kwargs):
+    """Return the process-wide FaceAlignment for ``(device, face_detector, path_to_detector)``.
+
+    The detector weights are loaded the first time a key is requested and the
+    instance is reused by every later caller in the process. Other keyword
+    arguments are only used when the instance is created.
+    """
+    path = kwargs.get('path_to_detector')
+    key = (device, face_detector, os.path.realpath(path) if path else None)
+    with _detectors_lock:
+        fa = _detectors.get(key)
+        if fa is None:
+            fa = FaceAlignment(LandmarksType._2D, device=device, flip_input=False,
+                               face_detector=face_detector, **kwargs)
+            if warmup:
+                fa.warmup()
+            _detectors[key] = fa
+    return fa
+
+
+def release_face_alignments():
+    """Drop every cached detector, e.g. before handing a GPU to another process."""
+    with _detectors_lock:
+        _detectors.clear()
@@ -0,0 +1,8 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The app package, then infer.py's helper modules (models/wav2lip) and audio.py/hparams.py (models/wav2lip_src).
+for path in (ROOT, os.path.join(ROOT, "models", "wav2lip_src"), os.path.join(ROOT, "models", "wav2lip")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
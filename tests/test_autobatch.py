@@ -0,0 +1,43 @@
+import autobatch
+
+
+def test_cached_size_is_clamped_to_a_smaller_budget(tmp_path):
+    cache = str(tmp_path / "autobatch.json")
+    runs = []
+    tuner = autobatch.AutoTuner(cache)
+    tuner.results["wav2lip/cpu1/96"] = 256  # tuned with a larger --mem_budget_mb
+
+    assert tuner.best("wav2lip/cpu1/96", runs.append, autobatch.candidate_sizes(32)) == 32
+    assert tuner.best_within("wav2lip/cpu1/96", runs.append, 32) == 32
+    assert runs == []
+
+
+def test_result_is_persisted_and_reused(tmp_path):
+    cache = str(tmp_path / "autobatch.json")
+    runs = []
+    first = autobatch.AutoTuner(cache).best("s3fd/cpu1/240", runs.append, [1, 2, 4])
+    assert sorted(set(runs)) == [1, 2, 4]
+
+    runs.clear()
+    assert autobatch.AutoTuner(cache).best("s3fd/cpu1/240", runs.append, [1, 2, 4]) == first
+    assert runs == []
+
+
+def test_short_inputs_are_cached_under_their_cap(tmp_path):
+    runs = []
+    tuner = autobatch.AutoTuner(str(tmp_path / "autobatch.json"))
+    assert tuner.best_within("k", runs.append, 64, max_items=5) == 5  # one batch, nothing to tune
+    assert runs == []
+
+    tuner.best_within("k", runs.append, 64, max_items=40)
+    assert set(runs) == {4, 8, 16, 32}
+    assert "k/max32" in tuner.results
+
+    runs.clear()
+    tuner.best_within("k", runs.append, 64, max_items=45)
+    assert runs == []
+
+
+def test_cpu_limit_is_bounded():
+    assert autobatch.device_limit("cpu", 512) == autobatch.CPU_MAX_BATCH
+    assert autobatch.device_limit("cuda:0", 512) == 512
@@ -0,0 +1,43 @@
+import torch
+
+import face_detection
+from face_detection.detection.sfd.net_s3fd import s3fd
+
+
+def test_detectors_are_shared_per_weights_file(tmp_path):
+    paths = []
+    for name in ("a.pth", "b.pth"):
+        torch.manual_seed(len(paths))
+        path = str(tmp_path / name)
+        torch.save(s3fd().state_dict(), path)
+        paths.append(path)
+
+    try:
+        a = face_detection.get_face_alignment(device="cpu", path_to_detector=paths[0])
+        b = face_detection.get_face_alignment(device="cpu", path_to_detector=paths[1])
+        assert a is not b
+        assert face_detection.get_face_alignment(device="cpu", path_to_detector=paths[0]) is a
+        weight_a = next(a.face_detector.face_detector.parameters())
+        weight_b = next(b.face_detector.face_detector.parameters())
+        assert not torch.equal(weight_a, weight_b)
+    finally:
+        face_detection.release_face_alignments()
+
+
+def test_sfd_loads_the_converted_checkpoint_and_falls_back_to_torch_load(tmp_path, monkeypatch):
+    import weights
+    from face_detection.detection.sfd import sfd_detector
+
+    torch.manual_seed(0)
+    state = s3fd().state_dict()
+    path = str(tmp_path / "s3fd.pth")
+    torch.save(state, path)
+    weights.convert(path)
+
+    mapped = sfd_detector.SFDDetector("cpu", path_to_detector=path)
+    # Without weights.py (a bare wav2lip_src checkout) the .pth goes through torch.load.
+    monkeypatch.setattr(sfd_detector, "weights", None)
+    loaded = sfd_detector.SFDDetector("cpu", path_to_detector=path)
+    for detector in (mapped, loaded):
+        for name, tensor in detector.face_detector.state_dict().items():
+            assert torch.equal(tensor, state[name])
@@ -0,0 +1,32 @@
+import functools
+import multiprocessing
+
+import cv2
+import numpy as np
+
+import framering
+
+
+def test_encoder_process_is_spawned_and_writes_every_frame(tmp_path, monkeypatch):
+    contexts = []
+    get_context = multiprocessing.get_context
+    monkeypatch.setattr(multiprocessing, "get_context", lambda method=None: contexts.append(method) or get_context(method))
+
+    path = str(tmp_path / "out.avi")
+    open_writer = functools.partial(cv2.VideoWriter, path, cv2.VideoWriter_fourcc(*"MJPG"), 25, (64, 48))
+    encoder = framering.EncoderProcess(open_writer, (48, 64, 3), slots=4)
+    for i in range(20):
+        encoder.write(np.full((48, 64, 3), i * 10, dtype=np.uint8))
+    encoder.release()
+
+    assert contexts == ["spawn"]
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames.append(frame)
+    cap.release()
+    assert len(frames) == 20
+    assert abs(int(frames[7].mean()) - 70) <= 2
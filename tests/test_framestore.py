@@ -0,0 +1,37 @@
+import builtins
+import os
+
+import framestore
+
+
+def test_key_without_digest_does_not_read_the_video(tmp_path, monkeypatch):
+    video = tmp_path / "in.mp4"
+    video.write_bytes(b"\0" * 4096)
+
+    def no_open(*args, **kwargs):
+        raise AssertionError("store_key read the video")
+
+    monkeypatch.setattr(builtins, "open", no_open)
+    key = framestore.store_key(str(video), resize_factor=1)
+    assert key == framestore.store_key(str(video), resize_factor=1)
+    assert key != framestore.store_key(str(video), resize_factor=2)
+
+
+def test_key_without_digest_changes_with_the_file(tmp_path):
+    video = tmp_path / "in.mp4"
+    video.write_bytes(b"a" * 100)
+    before = framestore.store_key(str(video))
+    video.write_bytes(b"b" * 101)
+    assert framestore.store_key(str(video)) != before
+    video.write_bytes(b"c" * 101)
+    st = os.stat(video)
+    os.utime(video, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+    assert framestore.store_key(str(video)) != before
+
+
+def test_digest_keys_copies_of_one_upload_alike(tmp_path):
+    first, second = tmp_path / "job1.mp4", tmp_path / "job2.mp4"
+    first.write_bytes(b"video")
+    second.write_bytes(b"video")
+    assert framestore.store_key(str(first), "abc", crop=[0, -1]) == framestore.store_key(str(second), "abc", crop=[0, -1])
+    assert framestore.store_key(str(first), "abc") != framestore.store_key(str(first), "abd")
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from app.utils.jobs import JobRegistry
+
+
+class Rejected(Exception):
+    pass
+
+
+def test_concurrent_identical_submits_make_one_job(tmp_path):
+    async def scenario():
+        registry, admitted, rendered = JobRegistry(str(tmp_path)), [], []
+
+        async def admit():
+            admitted.append(1)
+            await asyncio.sleep(0.01)  # admit_upload probes the upload off the event loop
+            return "ticket"
+
+        async def render(job, ticket):
+            rendered.append(ticket)
+            return {"status": "success"}
+
+        first, second = await asyncio.gather(registry.submit("wav2lip", "k", "hls", admit, render),
+                                             registry.submit("wav2lip", "k", "hls", admit, render))
+        assert first is second
+        assert len(registry.jobs) == 1
+        assert len(admitted) == 1
+        await first.task
+        assert rendered == ["ticket"]
+        assert first.status == "success"
+
+    asyncio.run(scenario())
+
+
+def test_admission_error_reaches_concurrent_submits(tmp_path):
+    async def scenario():
+        registry = JobRegistry(str(tmp_path))
+
+        async def admit():
+            await asyncio.sleep(0.01)
+            raise Rejected()
+
+        async def render(job, ticket):
+            raise AssertionError("rejected uploads are not rendered")
+
+        results = await asyncio.gather(*(registry.submit("wav2lip", "k", "hls", admit, render) for _ in range(2)),
+                                       return_exceptions=True)
+        assert all(isinstance(r, Rejected) for r in results)
+        assert registry.jobs == {}
+
+    asyncio.run(scenario())
+
+
+def test_submit_waiting_on_a_cancelled_admission_admits_itself(tmp_path):
+    async def scenario():
+        registry, admitted = JobRegistry(str(tmp_path)), []
+
+        async def admit():
+            admitted.append(1)
+            await asyncio.sleep(0.01)
+            return "ticket"
+
+        async def render(job, ticket):
+            return {"status": "success"}
+
+        first = asyncio.create_task(registry.submit("wav2lip", "k", "hls", admit, render))
+        second = asyncio.create_task(registry.submit("wav2lip", "k", "hls", admit, render))
+        await asyncio.sleep(0)
+        first.cancel()
+        job = await second
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert len(admitted) == 2
+        assert list(registry.jobs) == [job.id]
+        await job.task
+
+    asyncio.run(scenario())
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+import soundfile
+
+import audio
+import melchunks
+from hparams import hparams as hp
+
+
+@pytest.fixture(scope="module")
+def wav():
+    # 7.3 s: several 64-column projection blocks and a partial last one.
+    t = np.arange(int(7.3 * hp.sample_rate)) / hp.sample_rate
+    rng = np.random.RandomState(0)
+    return (0.3 * np.sin(2 * np.pi * 220 * t) + 0.05 * rng.randn(len(t))).astype(np.float32)
+
+
+def stream(wav, sizes):
+    mel, out, i = audio.StreamingMelSpectrogram(), [], 0
+    for size in sizes:
+        out.append(mel.push(wav[i:i + size]))
+        i += size
+    out.append(mel.push(wav[i:]))
+    out.append(mel.end())
+    return np.concatenate(out, axis=1)
+
+
+def test_batch_mel_is_the_plain_projection(wav):
+    D = audio._stft(audio.preemphasis(wav, hp.preemphasis, hp.preemphasize))
+    audio._linear_to_mel(np.abs(D[:, :1]))  # builds the basis
+    expected = audio._normalize(audio._amp_to_db(np.dot(audio._mel_basis, np.abs(D))) - hp.ref_level_db)
+    assert np.array_equal(audio.melspectrogram(wav), expected)
+
+
+def test_streamed_columns_do_not_depend_on_chunking(wav):
+    whole = stream(wav, [])
+    rng = np.random.RandomState(1)
+    for sizes in ([1600] * 40, [37, 5000, 1, 799, 12000], list(rng.randint(1, 4000, size=30))):
+        assert np.array_equal(stream(wav, sizes), whole)
+    batch = audio.melspectrogram(wav)
+    assert whole.shape == batch.shape
+    np.testing.assert_allclose(whole, batch, rtol=0, atol=1e-12)
+
+
+def test_chunk_stream_windows_do_not_depend_on_the_read_size(wav, tmp_path):
+    path = str(tmp_path / "speech.wav")
+    soundfile.write(path, wav, hp.sample_rate)
+    for fps in (25., 29.97):
+        reference = [np.array(w) for w in melchunks.MelChunkStream(path, fps, block_s=10.)]
+        expected = melchunks.MelWindows(stream(soundfile.read(path, dtype='float32')[0], []), fps)
+        assert len(reference) == len(expected)
+        # MelWindows keeps the model input dtype.
+        assert all(np.array_equal(a.astype(np.float32), b) for a, b in zip(reference, expected))
+        for block_s in (0.25, 1.3):
+            windows = list(melchunks.MelChunkStream(path, fps, block_s=block_s))
+            assert len(windows) == len(reference)
+            assert all(np.array_equal(a, b) for a, b in zip(windows, reference))
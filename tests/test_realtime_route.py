@@ -0,0 +1,54 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app.routes import realtime
+from app.utils.metrics import REALTIME_SESSIONS
+
+
+class StubRealtimeEngine:
+    """Registered faces without a model; open_session fails the way the real engine can."""
+
+    def __init__(self, error):
+        self.error = error
+
+    def get_face(self, face_id):
+        return object() if face_id == "known" else None
+
+    def open_session(self, face, fps, encoder):
+        raise self.error
+
+    def lookahead_ms(self):
+        return 225.0
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(realtime.router, prefix="/api")
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("error, code", [(FileNotFoundError("checkpoint not found at wav2lip.pth"), 1011),
+                                         (ValueError("unsupported encoder"), 1008)])
+def test_open_session_failure_closes_with_reason(client, monkeypatch, error, code):
+    monkeypatch.setattr(realtime, "engine", StubRealtimeEngine(error))
+    before = REALTIME_SESSIONS._default().value
+    with client.websocket_connect("/api/realtime/wav2lip?face_id=known") as ws:
+        assert ws.receive_json() == {"type": "error", "details": str(error)}
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_json()
+    assert closed.value.code == code
+    assert closed.value.reason == str(error)
+    assert REALTIME_SESSIONS._default().value == before
+    assert realtime._open_sessions == 0
+
+
+def test_unknown_face_is_rejected(client, monkeypatch):
+    monkeypatch.setattr(realtime, "engine", StubRealtimeEngine(AssertionError("not opened")))
+    with client.websocket_connect("/api/realtime/wav2lip?face_id=missing") as ws:
+        assert ws.receive_json()["type"] == "error"
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_json()
+    assert closed.value.code == 1008
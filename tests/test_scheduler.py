@@ -0,0 +1,82 @@
+import asyncio
+import os
+import sys
+
+from app.utils.scheduler import FairQueue, RenderScheduler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import sim_scheduler  # noqa: E402
+
+
+def test_fair_scheduling_lowers_short_job_p95():
+    workload = sim_scheduler.make_workload(jobs=2000, slots=2, load=0.85, long_share=0.05, short_s=5., long_s=1200.,
+                                           short_tenants=8, error=0.3, seed=0)
+    results = {mode: sim_scheduler.summarize(workload, sim_scheduler.simulate(workload, 2, FairQueue(mode=mode)))
+               for mode in ("fifo", "fair")}
+    assert results["fair"]["short"]["p95_s"] < results["fifo"]["short"]["p95_s"] / 2
+    # Aging keeps the long jobs from starving.
+    assert results["fair"]["long"]["max_s"] < 1.5 * results["fifo"]["long"]["max_s"]
+
+
+def test_shorter_job_starts_first():
+    async def scenario():
+        scheduler = RenderScheduler(1)
+        await scheduler.acquire(1.0)
+        order = []
+
+        async def job(name, cost):
+            await scheduler.acquire(cost)
+            order.append(name)
+
+        tasks = [asyncio.create_task(job("long", 100.0)), asyncio.create_task(job("short", 1.0))]
+        await asyncio.sleep(0)
+        scheduler.release()
+        await asyncio.sleep(0)
+        scheduler.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == ["short", "long"]
+
+
+def test_cancelled_waiter_does_not_take_the_slot():
+    async def scenario():
+        scheduler = RenderScheduler(1)
+        await scheduler.acquire(1.0)
+        cancelled = asyncio.create_task(scheduler.acquire(1.0, tenant="a"))
+        waiting = asyncio.create_task(scheduler.acquire(50.0, tenant="b"))
+        await asyncio.sleep(0)
+
+        # The cancelled job scores first. release() runs before its cleanup gets a turn.
+        cancelled.cancel()
+        scheduler.release()
+        await asyncio.sleep(0.01)
+
+        assert cancelled.cancelled()
+        assert waiting.done() and waiting.exception() is None
+        assert scheduler.running == 1
+        assert len(scheduler.queue) == 0
+        assert scheduler.queue.vtime["a"] == 0.0  # the skipped job's charge is refunded
+        scheduler.release()
+        assert scheduler.running == 0
+
+    asyncio.run(scenario())
+
+
+def test_waiter_cancelled_after_the_handover_passes_the_slot_on():
+    async def scenario():
+        scheduler = RenderScheduler(1)
+        await scheduler.acquire(1.0)
+        first = asyncio.create_task(scheduler.acquire(1.0))
+        second = asyncio.create_task(scheduler.acquire(5.0))
+        await asyncio.sleep(0)
+
+        scheduler.release()  # hands the slot to ``first``...
+        first.cancel()       # ...which is cancelled before it resumes
+        await asyncio.sleep(0.01)
+
+        assert first.cancelled()
+        assert second.done() and second.exception() is None
+        assert scheduler.running == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,139 @@
+import asyncio
+
+from app.utils.singleflight import SingleFlight
+
+
+def test_identical_calls_share_one_run():
+    async def scenario():
+        flight, runs = SingleFlight("test"), []
+
+        async def fn():
+            runs.append(1)
+            await asyncio.sleep(0.01)
+            return "out"
+
+        results = await asyncio.gather(*(flight.do("k", fn) for _ in range(3)))
+        assert [result for result, _ in results] == ["out"] * 3
+        assert len(runs) == 1
+        assert len(flight) == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_follower_does_not_cancel_the_leader():
+    async def scenario():
+        flight, gate = SingleFlight("test"), asyncio.Event()
+
+        async def fn():
+            await gate.wait()
+            return "out"
+
+        leader = asyncio.create_task(flight.do("k", fn))
+        follower = asyncio.create_task(flight.do("k", fn))
+        await asyncio.sleep(0)
+        follower.cancel()
+        await asyncio.sleep(0)
+        gate.set()
+
+        result, release = await leader
+        assert follower.cancelled()
+        assert result == "out"
+        release()
+
+    asyncio.run(scenario())
+
+
+def test_render_outlives_a_cancelled_leader():
+    async def scenario():
+        flight, gate = SingleFlight("test"), asyncio.Event()
+
+        async def fn():
+            await gate.wait()
+            return "out"
+
+        leader = asyncio.create_task(flight.do("k", fn))
+        follower = asyncio.create_task(flight.do("k", fn))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        gate.set()
+
+        result, release = await follower
+        assert leader.cancelled()
+        assert result == "out"
+        release()
+
+    asyncio.run(scenario())
+
+
+def test_cleanup_runs_once_after_the_last_release():
+    async def scenario():
+        flight, cleaned = SingleFlight("test"), []
+
+        async def fn():
+            await asyncio.sleep(0.01)
+            return "out"
+
+        (_, release_a), (_, release_b) = await asyncio.gather(flight.do("k", fn, cleanup=cleaned.append),
+                                                              flight.do("k", fn, cleanup=cleaned.append))
+        assert cleaned == []
+        release_a()
+        assert cleaned == []
+        release_b()
+        assert cleaned == ["out"]
+
+    asyncio.run(scenario())
+
+
+def test_cleanup_waits_for_the_render_when_every_caller_left():
+    async def scenario():
+        flight, gate, cleaned = SingleFlight("test"), asyncio.Event(), []
+
+        async def fn():
+            await gate.wait()
+            return "out"
+
+        caller = asyncio.create_task(flight.do("k", fn, cleanup=cleaned.append))
+        await asyncio.sleep(0)
+        caller.cancel()
+        await asyncio.sleep(0)
+        assert cleaned == []  # refcount is 0 but the render is still running
+        gate.set()
+        await asyncio.sleep(0.01)
+        assert cleaned == ["out"]
+
+    asyncio.run(scenario())
+
+
+def test_exception_reaches_every_waiter():
+    async def scenario():
+        flight, cleaned = SingleFlight("test"), []
+
+        async def fn():
+            await asyncio.sleep(0.01)
+            raise ValueError("bad input")
+
+        results = await asyncio.gather(*(flight.do("k", fn, cleanup=cleaned.append) for _ in range(3)),
+                                       return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+        assert results[0] is results[1] is results[2]
+        assert cleaned == []
+        assert len(flight) == 0
+
+    asyncio.run(scenario())
+
+
+def test_later_call_starts_a_new_run():
+    async def scenario():
+        flight, runs = SingleFlight("test"), []
+
+        async def fn():
+            runs.append(1)
+            return len(runs)
+
+        first, _ = await flight.do("k", fn)
+        second, _ = await flight.do("k", fn)
+        assert (first, second) == (1, 2)
+
+    asyncio.run(scenario())
+
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+import smoothing
+
+
+def get_smoothened_boxes(boxes, T):
+    # infer.py's smoothing before --smooth existed, verbatim.
+    for i in range(len(boxes)):
+        if i + T > len(boxes):
+            window = boxes[len(boxes) - T:]
+        else:
+            window = boxes[i : i + T]
+        boxes[i] = np.mean(window, axis=0)
+    return boxes
+
+
+def jittery_track(n=200, seed=0):
+    rng = np.random.RandomState(seed)
+    drift = np.cumsum(rng.randint(-3, 4, size=(n, 4)), axis=0)
+    return np.array([100, 80, 260, 240]) + drift + rng.randint(-8, 9, size=(n, 4))
+
+
+@pytest.mark.parametrize("T", [1, 3, 5, 9])
+def test_legacy_reproduces_the_original_boxes(T):
+    boxes = jittery_track()
+    expected = get_smoothened_boxes(boxes.copy(), T)
+    out = smoothing.smooth_boxes(boxes, T=T, mode="legacy")
+    assert out.dtype == expected.dtype
+    np.testing.assert_array_equal(out, expected)
+
+
+def test_legacy_leaves_the_input_untouched():
+    boxes = jittery_track(20)
+    before = boxes.copy()
+    smoothing.smooth_boxes(boxes, T=5, mode="legacy")
+    np.testing.assert_array_equal(boxes, before)
+
+
+@pytest.mark.parametrize("mode", ["window", "centred", "one_euro"])
+def test_streaming_matches_whole_track(mode):
+    boxes = jittery_track(97)
+    expected = smoothing.smooth_boxes(boxes, T=5, mode=mode, fps=30.)
+    smoother = smoothing.StreamingSmoother(T=5, mode=mode, fps=30.)
+    out = []
+    for start in range(0, len(boxes), 16):
+        out += smoother.push(boxes[start:start + 16])
+    out += smoother.flush()
+    np.testing.assert_array_equal(np.array(out), expected)
@@ -0,0 +1,81 @@
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from app.utils import admission
+from app.utils.admission import AdmissionController, UploadGate, UploadTooLarge, upload_too_large_response
+
+
+@pytest.fixture
+def controller(monkeypatch):
+    controller = AdmissionController(budget_s=100.0, max_upload_mb=1.0)
+    monkeypatch.setattr(admission, "_controller", controller)
+    return controller
+
+
+@pytest.fixture
+def client(controller):
+    app = FastAPI()
+    app.add_middleware(UploadGate, render_prefixes=("/api/sync/",))
+    app.add_exception_handler(UploadTooLarge, upload_too_large_response)
+
+    @app.post("/api/sync/echo")
+    async def echo(video: UploadFile = File(...)):
+        return {"size": len(await video.read())}
+
+    @app.post("/api/other")
+    async def other(video: UploadFile = File(...)):
+        return {"size": len(await video.read())}
+
+    return TestClient(app)
+
+
+def multipart(size):
+    boundary = "lip2sync"
+    head = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"video\"; filename=\"v.mp4\"\r\n"
+            "Content-Type: video/mp4\r\n\r\n").encode()
+    tail = f"\r\n--{boundary}--\r\n".encode()
+    return head + b"x" * size + tail, {"content-type": f"multipart/form-data; boundary={boundary}"}
+
+
+def chunked(body, sent, chunk=64 << 10):
+    # A generator body is sent with Transfer-Encoding: chunked, without a Content-Length.
+    for i in range(0, len(body), chunk):
+        sent.append(i)
+        yield body[i:i + chunk]
+
+
+def test_small_upload_passes(client):
+    body, headers = multipart(1000)
+    response = client.post("/api/sync/echo", content=body, headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {"size": 1000}
+
+
+def test_declared_length_over_the_limit_is_rejected(client):
+    body, headers = multipart(2 << 20)
+    response = client.post("/api/sync/echo", content=body, headers=headers)
+    assert response.status_code == 413
+    assert response.json()["status"] == "error"
+
+
+def test_chunked_body_is_cut_off_at_the_limit(client):
+    body, headers = multipart(4 << 20)
+    sent = []
+    response = client.post("/api/sync/echo", content=chunked(body, sent), headers=headers)
+    assert response.status_code == 413
+    assert response.json() == {"status": "error", "details": "upload too large"}
+
+
+def test_full_queue_rejects_before_the_body_is_read(client, controller):
+    controller.outstanding_s = controller.budget_s
+    body, headers = multipart(1000)
+    sent = []
+    response = client.post("/api/sync/echo", content=chunked(body, sent, chunk=100), headers=headers)
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) >= 1
+    assert len(sent) < len(body) // 100
+
+    # Routes that do not render are not subject to the queue budget.
+    response = client.post("/api/other", content=body, headers=headers)
+    assert response.status_code == 200